@@ -0,0 +1,292 @@
+"""基准测试：牌型判断等热点路径的耗时，以及出牌、叫分命令的端到端延迟
+
+在 AstrBot 环境中运行（需要能导入 astrbot）：
+
+    python bench/benchmark.py --output before.json
+    python bench/benchmark.py --compare before.json
+
+热点路径报告每次调用的纳秒数（取多轮中最快的一轮），端到端测试分别在 1、100、
+10000 个群同时进行时测量每条命令的延迟分位数和吞吐量（群数较少时重复多局）。随机数种子固定，结果以
+JSON 输出，可以保存后与其他提交的结果对比。
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from stress_concurrency import PLUGIN_CONFIG, Driver
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PLUGIN_DIR.parent))
+plugin_main = importlib.import_module(f"{PLUGIN_DIR.name}.main")
+cards_mod = importlib.import_module(f"{PLUGIN_DIR.name}.engine.cards")
+game_mod = importlib.import_module(f"{PLUGIN_DIR.name}.engine.game")
+patterns_mod = importlib.import_module(f"{PLUGIN_DIR.name}.engine.patterns")
+endgame_mod = importlib.import_module(f"{PLUGIN_DIR.name}.engine.endgame")
+
+SEED = 20240601
+GROUP_COUNTS = (1, 100, 10000)
+
+
+def make_plugin():
+    return plugin_main.DouDiZhuPlugin(context=None, config=dict(PLUGIN_CONFIG))
+
+
+def time_per_call(func, args_list, repeat=5):
+    """按参数列表依次调用 func，返回多轮中最快一轮的平均每次耗时（纳秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for args in args_list:
+            func(*args)
+        elapsed = (time.perf_counter_ns() - start) / len(args_list)
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 1)
+
+
+def pattern_samples(rng):
+    """每种 (牌型, 张数) 取若干组具体的牌面"""
+    type_names = {card_type: name for name, card_type in patterns_mod.CARD_TYPES.items()}
+    samples = {}
+    for signature, pattern in patterns_mod.build_pattern_index().items():
+        cards = []
+        for rank in range(cards_mod.RANK_SLOTS):
+            count = (signature >> (3 * rank)) & 7
+            cards.extend(rng.sample(cards_mod.RANK_CARDS[rank], count))
+        rng.shuffle(cards)
+        name = f"{type_names[pattern.type]}x{pattern.length}"
+        samples.setdefault(name, []).append(cards)
+    return samples
+
+
+def bench_hot_paths():
+    """热点路径"""
+    rng = random.Random(SEED)
+    plugin = make_plugin()
+    results = {}
+
+    # 牌型判断（与牌局引擎出牌时相同的签名索引）：每种牌型、每种张数分别计时，另外给出不合法的牌
+    index = patterns_mod.pattern_index(plugin.default_rules)
+    samples = pattern_samples(rng)
+    for name, hands in sorted(samples.items()):
+        results[f"classify[{name}]"] = time_per_call(patterns_mod.classify, [(cards, index) for cards in hands] * 20)
+    invalid = [rng.sample(range(52), 7) for _ in range(200)]
+    results["classify[invalid]"] = time_per_call(patterns_mod.classify, [(cards, index) for cards in invalid])
+
+    # 出牌输入解析：带花色的牌面、只写点数（连写）
+    hands = [cards for hands in samples.values() for cards in hands]
+    suited = [(cards_mod.format_cards(cards),) for cards in hands]
+    rank_only = [(''.join(cards_mod.RANKS[card // 4] if card < 52 else cards_mod.CARD_NAMES[card] for card in cards),)
+                 for cards in hands]
+    results["parse_cards[suited]"] = time_per_call(cards_mod.parse_cards, suited)
+    results["parse_cards[rank_only]"] = time_per_call(cards_mod.parse_cards, rank_only)
+
+    # 大小比较
+    patterns = [patterns_mod.classify(cards, index) for hands in samples.values() for cards in hands]
+    pairs = [(rng.choice(patterns), rng.choice(patterns)) for _ in range(5000)]
+    results["can_beat"] = time_per_call(patterns_mod.can_beat, pairs)
+
+    # 20 张手牌的持有检查和出牌移除（每轮使用新建的手牌，建手牌的时间不计入）
+    deck = list(range(cards_mod.DECK_SIZE))
+    hands = []
+    for _ in range(500):
+        rng.shuffle(deck)
+        hands.append((deck[:20], deck[:rng.randint(1, 8)]))
+    for name, method in (("hand_contains_all[20]", cards_mod.Hand.contains_all),
+                         ("hand_remove_all[20]", cards_mod.Hand.remove_all)):
+        best = None
+        for _ in range(5):
+            args_list = [(cards_mod.Hand(cards), play) for cards, play in hands]
+            elapsed = time_per_call(method, args_list, repeat=1)
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+
+    # 洗牌发牌
+    game = game_mod.Game(range(game_mod.SEAT_COUNT))
+    results["deal"] = time_per_call(
+        lambda seed: game.deal(game_mod.new_deck(random.Random(seed)), 0), [(i,) for i in range(500)]
+    )
+
+    # 最少手数：清空缓存后首次求解、重复查询
+    solver = plugin.solvers[plugin.default_rules]
+    for size in (17, 20):
+        counts = [(cards_mod.Hand(game_mod.new_deck(rng)[:size]).counts,) for _ in range(200)]
+        best = None
+        for _ in range(3):
+            solver.cache.clear()
+            elapsed = time_per_call(solver.min_hands, counts, repeat=1)
+            best = elapsed if best is None else min(best, elapsed)
+        results[f"min_hands_cold[{size}]"] = best
+        results[f"min_hands_cached[{size}]"] = time_per_call(solver.min_hands, counts)
+    results.update(bench_endgame(rng, plugin.move_tables[plugin.default_rules]))
+    return results
+
+
+def bench_endgame(rng, table, positions=50):
+    """残局求解：每人 5-8 张牌、随机地主和出牌玩家的明牌局面，报告每秒结点数和置换表命中率"""
+    solver = endgame_mod.EndgameSolver(table)
+    games = []
+    for _ in range(positions):
+        size = rng.randint(5, endgame_mod.ENDGAME_CARDS)
+        deck = game_mod.new_deck(rng)
+        game = game_mod.Game(range(game_mod.SEAT_COUNT))
+        game.hands = {seat: cards_mod.Hand(deck[seat * size:(seat + 1) * size]) for seat in range(game_mod.SEAT_COUNT)}
+        game.landlord = rng.randrange(game_mod.SEAT_COUNT)
+        game.current_player = rng.randrange(game_mod.SEAT_COUNT)
+        games.append(game)
+    start = time.perf_counter()
+    unsolved = sum(solver.solve(game, game.current_player) is None for game in games)
+    elapsed = time.perf_counter() - start
+    return {
+        "endgame_nodes_per_second": round(solver.nodes / elapsed),
+        "endgame_table_hit_rate": round(solver.hits / solver.probes, 3),
+        "endgame_solve_ms": round(elapsed / positions * 1000, 1),
+        "endgame_unsolved": unsolved,
+    }
+
+
+def latency_stats(samples, elapsed):
+    """延迟分位数（微秒）和吞吐量"""
+    samples = sorted(samples)
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))] / 1000, 1)
+
+    return {
+        'commands': len(samples),
+        'mean_us': round(statistics.fmean(samples) / 1000, 1),
+        'p50_us': percentile(0.50),
+        'p95_us': percentile(0.95),
+        'p99_us': percentile(0.99),
+        'max_us': round(samples[-1] / 1000, 1),
+        'commands_per_second': round(len(samples) / elapsed, 1),
+    }
+
+
+async def timed_send(driver, group_id, user_id, message_str, samples):
+    start = time.perf_counter_ns()
+    await driver.send(group_id, user_id, message_str)
+    samples.append(time.perf_counter_ns() - start)
+
+
+async def play_round(plugin, driver, group_ids, bid_samples, play_samples):
+    """group_ids 中的群同时进行一局：叫分，然后轮流出牌直到所有牌局结束，返回 (叫分用时, 出牌用时)"""
+    for group_id in group_ids:
+        for user_id, command in (('1', '斗地主'), ('2', '加入'), ('3', '加入'), ('1', '开始')):
+            await driver.send(group_id, user_id, command)
+
+    # 叫分：每个群的当前玩家叫 3 分
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        timed_send(driver, group_id, plugin.sessions[group_id].current_player, '叫分 3', bid_samples)
+        for group_id in group_ids
+    ))
+    bid_elapsed = time.perf_counter() - start
+
+    # 出牌：每轮每个群的当前玩家打出最小的一手牌
+    play_elapsed = 0.0
+    while plugin.sessions:
+        commands = []
+        for group_id, session in list(plugin.sessions.items()):
+            player_id = session.current_player
+            hand = session.hands[player_id]
+            move = next(plugin.move_tables[session.rules].legal_moves(hand.counts, session.required_pattern(player_id)), None)
+            if move is None:
+                # 没有能出的牌时不出，不计入出牌延迟
+                await driver.send(group_id, player_id, '不出')
+                continue
+            names = cards_mod.format_cards(hand.pick(move.ranks))
+            commands.append((group_id, player_id, f"出牌 {names}"))
+        start = time.perf_counter()
+        await asyncio.gather(*(timed_send(driver, *command, play_samples) for command in commands))
+        play_elapsed += time.perf_counter() - start
+    return bid_elapsed, play_elapsed
+
+
+async def bench_commands(groups, min_games):
+    """groups 个群同时进行，重复多轮直到总局数不少于 min_games"""
+    random.seed(SEED)
+    plugin = make_plugin()
+    driver = Driver(plugin)
+    group_ids = [f"group{i}" for i in range(groups)]
+    bid_samples = []
+    play_samples = []
+    bid_elapsed = play_elapsed = 0.0
+    for _ in range(max(1, -(-min_games // groups))):
+        elapsed = await play_round(plugin, driver, group_ids, bid_samples, play_samples)
+        bid_elapsed += elapsed[0]
+        play_elapsed += elapsed[1]
+    return {
+        'games': len(bid_samples),
+        'bid': latency_stats(bid_samples, bid_elapsed),
+        'play': latency_stats(play_samples, play_elapsed),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PLUGIN_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """把嵌套的结果展开为 {路径: 数值}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline, current):
+    """逐项打印与基准结果的差异"""
+    old = flatten(baseline['results'])
+    new = flatten(current['results'])
+    print(f"基准 {baseline.get('revision')} -> 当前 {current.get('revision')}")
+    for key in sorted(old.keys() & new.keys()):
+        if old[key]:
+            change = (new[key] - old[key]) / old[key] * 100
+            print(f"{key:50} {old[key]:>12} {new[key]:>12} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, nargs='+', default=list(GROUP_COUNTS), help="同时进行的群数")
+    parser.add_argument('--min-games', type=int, default=200, help="每种群数下至少进行的局数")
+    parser.add_argument('--output', help="把结果写入 JSON 文件")
+    parser.add_argument('--compare', help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    results = {'hot_paths': bench_hot_paths(), 'commands': {}}
+    for groups in args.groups:
+        results['commands'][str(groups)] = asyncio.run(bench_commands(groups, args.min_games))
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding='utf-8')), report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
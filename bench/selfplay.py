@@ -0,0 +1,44 @@
+"""自对弈：多进程用给定的策略打大量对局，报告吞吐量和胜负统计
+
+只依赖牌局引擎，不需要 AstrBot：
+
+    python bench/selfplay.py --games 1000000 --policies greedy greedy random
+
+策略可以是内置策略名（random、greedy）或 ``模块:类名``。
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PLUGIN_DIR.parent))
+selfplay = importlib.import_module(f"{PLUGIN_DIR.name}.engine.selfplay")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000, help="对局数")
+    parser.add_argument('--policies', nargs=3, default=['greedy', 'greedy', 'greedy'], help="三个座次的策略")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument('--batch-size', type=int, default=2000, help="每批对局数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--rules', default='classic', help="玩法：classic、simple、two_chain")
+    parser.add_argument('--record', help="把每局的回放写入该目录")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出统计")
+    args = parser.parse_args()
+
+    stats, elapsed = selfplay.run(args.policies, args.games, args.workers, args.batch_size, args.seed, args.record,
+                                  args.rules)
+    summary = selfplay.summarize(args.policies, stats, elapsed)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False))
+        return
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""并发压力测试：向同一个群和大量不同的群同时发送重叠的命令
+
+在 AstrBot 环境中运行（需要能导入 astrbot）：
+
+    python bench/stress_concurrency.py --groups 1000
+
+检查同一个群的重复出牌、出牌与结束游戏的竞争不会破坏牌局，
+并报告多群并发时的命令吞吐量。
+"""
+import argparse
+import asyncio
+import importlib
+import sys
+import time
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PLUGIN_DIR.parent))
+plugin_main = importlib.import_module(f"{PLUGIN_DIR.name}.main")
+
+# 压测的插件配置：不限制发送速率（否则超出速率的回复进入队列，命令不直接返回消息），
+# 手牌不私聊发送（没有 AstrBot 上下文）、不绘制图片，只测量牌局本身
+PLUGIN_CONFIG = {
+    'turn_timeout': 0,
+    'group_send_rate': 0,
+    'global_send_rate': 0,
+    'private_hands': False,
+    'render_images': False,
+}
+
+
+class FakeEvent:
+    """只实现插件用到的 AstrMessageEvent 接口"""
+
+    def __init__(self, group_id, user_id, message_str):
+        self.group_id = group_id
+        self.user_id = user_id
+        self.message_str = message_str
+        self.unified_msg_origin = f"stress:GroupMessage:{group_id}"
+
+    def get_group_id(self):
+        return self.group_id
+
+    def get_sender_id(self):
+        return self.user_id
+
+    def get_sender_name(self):
+        return f"玩家{self.user_id}"
+
+    def plain_result(self, text):
+        return text
+
+
+class Driver:
+    """按命令名分发到插件的处理函数"""
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.handlers = {
+            '斗地主': plugin.start_game,
+            '加入': plugin.join_game,
+            '开始': plugin.begin_game,
+            '叫分': plugin.bid_score,
+            '不叫': plugin.no_bid,
+            '出牌': plugin.play_cards,
+            '不出': plugin.pass_play,
+            '提示': plugin.hint,
+            '结束游戏': plugin.end_game,
+        }
+        self.commands = 0
+
+    async def send(self, group_id, user_id, message_str):
+        handler = self.handlers[message_str.split()[0]]
+        self.commands += 1
+        return [text async for text in handler(FakeEvent(group_id, user_id, message_str))]
+
+    async def setup(self, group_id):
+        """三名玩家入座，当前玩家叫 3 分"""
+        for user_id, command in (('1', '斗地主'), ('2', '加入'), ('3', '加入'), ('1', '开始')):
+            await self.send(group_id, user_id, command)
+        session = self.plugin.sessions[group_id]
+        await self.send(group_id, session.current_player, '叫分 3')
+
+    async def step(self, group_id):
+        """当前玩家按提示出牌，没有能出的牌时不出"""
+        session = self.plugin.sessions[group_id]
+        player_id = session.current_player
+        hint = (await self.send(group_id, player_id, '提示'))[0]
+        if hint.startswith('提示：'):
+            return await self.send(group_id, player_id, hint.split('：', 1)[1])
+        return await self.send(group_id, player_id, '不出')
+
+
+def check_cards(plugin, group_id, played):
+    """手牌与已出的牌合起来恰好是 54 张不重复的牌"""
+    session = plugin.sessions.get(group_id)
+    if session is None:
+        return
+    mask = 0
+    total = played
+    for hand in session.hands.values():
+        assert mask & hand.mask == 0, "同一张牌出现在两名玩家手中"
+        mask |= hand.mask
+        total += len(hand)
+    assert total == 54, f"牌数不守恒: {total}"
+
+
+async def single_group(rounds):
+    """同一个群：每回合同时发出多个相同的出牌、不出和其他玩家的提示"""
+    plugin = plugin_main.DouDiZhuPlugin(context=None, config=dict(PLUGIN_CONFIG))
+    driver = Driver(plugin)
+    group_id = 'single'
+    played = 0
+    for _ in range(rounds):
+        await driver.setup(group_id)
+        played = 0
+        while group_id in plugin.sessions:
+            session = plugin.sessions[group_id]
+            player_id = session.current_player
+            hint = (await driver.send(group_id, player_id, '提示'))[0]
+            command = hint.split('：', 1)[1] if hint.startswith('提示：') else '不出'
+            others = [p for p in session.players if p != player_id]
+            before = len(session.hands[player_id])
+            results = await asyncio.gather(
+                *(driver.send(group_id, player_id, command) for _ in range(3)),
+                driver.send(group_id, player_id, '不出'),
+                *(driver.send(group_id, other, '提示') for other in others),
+            )
+            accepted = sum(1 for messages in results[:4] if '请 ' in messages[0] or '游戏结束' in messages[0])
+            assert accepted == 1, f"同一回合接受了 {accepted} 个操作"
+            if group_id in plugin.sessions:
+                played += before - len(session.hands[player_id])
+            check_cards(plugin, group_id, played)
+        assert group_id not in plugin.locks
+
+    # 出牌与结束游戏同时到达
+    for _ in range(rounds):
+        await driver.setup(group_id)
+        session = plugin.sessions[group_id]
+        player_id = session.current_player
+        hint = (await driver.send(group_id, player_id, '提示'))[0]
+        await asyncio.gather(
+            driver.send(group_id, player_id, hint.split('：', 1)[1]),
+            driver.send(group_id, player_id, '结束游戏'),
+        )
+        assert group_id not in plugin.sessions
+        assert len(plugin.locks) == 0
+    return driver.commands
+
+
+async def many_groups(groups):
+    """大量群同时各自进行完整的一局"""
+    plugin = plugin_main.DouDiZhuPlugin(context=None, config=dict(PLUGIN_CONFIG))
+    driver = Driver(plugin)
+
+    async def play(group_id):
+        await driver.setup(group_id)
+        while group_id in plugin.sessions:
+            await driver.step(group_id)
+
+    await asyncio.gather(*(play(f"group{i}") for i in range(groups)))
+    assert not plugin.sessions, "存在未释放的牌局"
+    assert len(plugin.locks) == 0, "存在未回收的锁"
+    return driver.commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20, help="单群测试的局数")
+    parser.add_argument('--groups', type=int, default=1000, help="多群测试的群数")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    commands = asyncio.run(single_group(args.rounds))
+    elapsed = time.perf_counter() - start
+    print(f"单群重叠命令: {args.rounds} 局, {commands} 条命令, {commands / elapsed:.0f} 条/秒")
+
+    start = time.perf_counter()
+    commands = asyncio.run(many_groups(args.groups))
+    elapsed = time.perf_counter() - start
+    print(f"多群并发: {args.groups} 个群, {commands} 条命令, {commands / elapsed:.0f} 条/秒, "
+          f"{args.groups / elapsed:.1f} 局/秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""斗地主牌局逻辑（不依赖 AstrBot，可单独导入）"""
@@ -0,0 +1,86 @@
+"""叫分建议
+
+叫分时只知道自己的 17 张牌。把其余 37 张（另外两家的手牌和 3 张地主牌）随机分配
+成与自己手牌一致的牌局，假设自己拿到地主牌做地主，由最少手数策略替三家打完，
+统计地主胜率。
+
+抽样按批进行：每批只调用一次随机数生成器，为这一批每局的每张牌各取一个 32 位随机键，
+按键排序即得到该局的牌序（随机键相同的概率可以忽略）。模拟完一批再检查
+时间，到截止时间即返回已有的结果（至少一批）。截止时间是绝对时间，任务在进程池中
+排队时也能按时返回。插件把 estimate 同时提交到多个进程，合并各进程的局数和胜局数。
+"""
+import random
+import time
+from typing import List, Sequence, Tuple
+
+from .cards import DECK_SIZE, Hand
+from .game import HAND_SIZE, WIN, Game
+from .moves import move_table
+from .policies import SolverPolicy
+from .selfplay import MAX_ACTIONS
+
+# 每批抽样的局数
+BATCH_SIZE = 16
+# 叫各分数需要的最低地主胜率，从高到低
+BID_THRESHOLDS = ((3, 0.6), (2, 0.5), (1, 0.4))
+
+
+def sample_deals(cards: Sequence[int], rng: random.Random, count: int) -> List[Tuple[List[int], List[int], List[int]]]:
+    """count 局与手牌一致的发牌：(下家手牌, 上家手牌, 地主牌)"""
+    held = set(cards)
+    unseen = [card for card in range(DECK_SIZE) if card not in held]
+    size = len(unseen)
+    keys = memoryview(rng.randbytes(4 * size * count)).cast('I')
+    deals = []
+    for start in range(0, size * count, size):
+        order = sorted(range(size), key=keys[start:start + size].__getitem__)
+        deck = [unseen[i] for i in order]
+        deals.append((deck[:HAND_SIZE], deck[HAND_SIZE:2 * HAND_SIZE], deck[2 * HAND_SIZE:]))
+    return deals
+
+
+def estimate(cards: Sequence[int], rules: str, deadline: float, seed: int = 0,
+             batch: int = BATCH_SIZE) -> Tuple[int, int]:
+    """在截止时间（time.time()）前按批抽样模拟 cards 做地主的牌局，返回 (地主获胜局数, 模拟局数)"""
+    rng = random.Random(seed)
+    table = move_table(rules)
+    policy = SolverPolicy(table, rng)
+    wins = games = 0
+    while True:
+        for following, preceding, landlord_cards in sample_deals(cards, rng, batch):
+            game = Game((0, 1, 2), rules)
+            game.hands = {0: Hand(cards), 1: Hand(following), 2: Hand(preceding)}
+            game.hands[0].update(landlord_cards)
+            game.landlord_cards = tuple(landlord_cards)
+            game.landlord = game.current_player = 0
+            game.bid_score = 1
+            wins += _playout(game, policy)
+            games += 1
+        if time.time() >= deadline:
+            return wins, games
+
+
+def _playout(game: Game, policy: SolverPolicy) -> int:
+    """由策略替所有人打完，地主获胜时返回 1"""
+    table = policy.table
+    for _ in range(MAX_ACTIONS):
+        player_id = game.current_player
+        hand = game.hands[player_id]
+        move = policy.play(game, player_id, table.legal_moves(hand.counts, game.required_pattern(player_id)))
+        if move is None:
+            game.pass_turn(player_id)
+        elif game.play(player_id, hand.pick(move.ranks)) == WIN:
+            return int(game.winner == game.landlord)
+    return 0
+
+
+def recommend_bid(wins: int, games: int, bid_score: int = 0) -> int:
+    """按地主胜率建议叫分，0 表示不叫（建议的叫分必须高于当前最高分）"""
+    if games == 0:
+        return 0
+    rate = wins / games
+    for score, threshold in BID_THRESHOLDS:
+        if rate >= threshold:
+            return score if score > bid_score else 0
+    return 0
+
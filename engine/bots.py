@@ -0,0 +1,127 @@
+"""机器人玩家的决策
+
+插件在进程池中调用 decide，事件循环不会被搜索阻塞。这里只有纯函数：给定牌局
+状态和时间预算，返回叫分或出牌。
+
+叫分和首选出牌使用最少手数策略（SolverPolicy）。有时间预算时，叫分按叫分建议
+（engine/bidding）模拟的地主胜率决定；出牌对候选出牌做蒙特卡洛模拟：把其他玩家的手牌在他们之间随机重新分配（保持张数，不看真实手牌），
+用最少手数策略替所有人打完，选胜率最高的一手。给出记牌器时按记牌器得到看不到的牌，
+地主还没打出的地主牌固定分给地主。进入残局后，每个随机分配的牌局
+改用残局求解器精确计算胜负，结点数超过上限时仍用模拟打完。
+"""
+import random
+import time
+from typing import Hashable, List, Optional, Tuple, Union
+
+from .bidding import estimate, recommend_bid
+from .cards import Hand
+from .endgame import endgame_solver, in_endgame
+from .game import WIN, Game
+from .moves import Move, move_table
+from .policies import SolverPolicy
+from .selfplay import MAX_ACTIONS
+from .tracker import CardTracker
+
+# 机器人的玩家编号前缀
+BOT_PREFIX = 'bot:'
+# 参与模拟的候选出牌数（按最少手数排序后取前几个）
+MAX_CANDIDATES = 8
+# 残局中每个随机牌局精确求解的结点上限
+ENDGAME_NODE_LIMIT = 20000
+
+
+def is_bot(player_id) -> bool:
+    """是否为机器人玩家"""
+    return isinstance(player_id, str) and player_id.startswith(BOT_PREFIX)
+
+
+def decide(game: Game, player_id: Hashable, budget: float, seed: int,
+           tracker: Optional[CardTracker] = None) -> Union[int, Tuple[int, ...], None]:
+    """机器人的操作：叫分阶段返回叫分（0 表示不叫），出牌阶段返回牌编号，None 表示不出"""
+    rng = random.Random(seed)
+    table = move_table(game.rules)
+    policy = SolverPolicy(table, rng)
+    if game.bid_stage:
+        if budget <= 0:
+            return policy.bid(game, player_id)
+        wins, games = estimate(tuple(game.hands[player_id]), game.rules, time.time() + budget, seed)
+        return recommend_bid(wins, games, game.bid_score)
+
+    hand = game.hands[player_id]
+    last_pattern = game.required_pattern(player_id)
+    default = policy.play(game, player_id, table.legal_moves(hand.counts, last_pattern))
+    if budget <= 0:
+        return _cards(hand, default)
+    candidates: List[Optional[Move]] = policy.solver.order_moves(
+        hand.counts, table.legal_moves(hand.counts, last_pattern))[:MAX_CANDIDATES]
+    if default not in candidates:
+        candidates.insert(0, default)
+    if last_pattern is not None and None not in candidates:
+        candidates.append(None)
+    if len(candidates) == 1:
+        return _cards(hand, default)
+
+    endgame = endgame_solver(game.rules) if in_endgame(game) else None
+    others = [other for other in game.next_seat if other != player_id]
+    if tracker is not None:
+        unknown = tracker.unseen(hand)
+        known = {other: tracker.known_cards(other) for other in others}
+    else:
+        unknown = [card for other in others for card in game.hands[other]]
+        known = {}
+    wins = [0] * len(candidates)
+    runs = [0] * len(candidates)
+    deadline = time.monotonic() + budget
+    i = 0
+    while time.monotonic() < deadline:
+        k = i % len(candidates)
+        i += 1
+        sim = _sample(game, others, unknown, known, rng)
+        won = None
+        if endgame is not None:
+            won = endgame.outcome(sim, player_id, candidates[k], ENDGAME_NODE_LIMIT)
+        if won is None:
+            won = _rollout(sim, player_id, candidates[k], policy)
+        wins[k] += won
+        runs[k] += 1
+    # 胜率相同时取排序靠前（剩余手数少）的一手
+    best = max(range(len(candidates)), key=lambda k: (wins[k] / runs[k] if runs[k] else -1.0, -k))
+    return _cards(hand, candidates[best])
+
+
+def _cards(hand, move: Optional[Move]) -> Optional[Tuple[int, ...]]:
+    return None if move is None else tuple(hand.pick(move.ranks))
+
+
+def _sample(game: Game, others, unknown, known, rng: random.Random) -> Game:
+    """把看不到的牌在其他玩家之间随机重新分配，已知的牌（known）固定分给持有者"""
+    sim = game.copy()
+    fixed = {card for cards in known.values() for card in cards}
+    cards = [card for card in unknown if card not in fixed]
+    rng.shuffle(cards)
+    start = 0
+    for other in others:
+        hand = Hand(known.get(other, ()))
+        size = len(game.hands[other]) - len(hand)
+        hand.update(cards[start:start + size])
+        sim.hands[other] = hand
+        start += size
+    return sim
+
+
+def _rollout(game: Game, player_id, first: Optional[Move], policy: SolverPolicy) -> int:
+    """先打出 first，再由策略替所有人打完，player_id 一方获胜时返回 1"""
+    table = policy.table
+    move = first
+    current = player_id
+    for _ in range(MAX_ACTIONS):
+        if move is None:
+            game.pass_turn(current)
+        elif game.play(current, game.hands[current].pick(move.ranks)) == WIN:
+            break
+        current = game.current_player
+        hand = game.hands[current]
+        move = policy.play(game, current, table.legal_moves(hand.counts, game.required_pattern(current)))
+    else:
+        return 0
+    return int((game.winner == game.landlord) == (player_id == game.landlord))
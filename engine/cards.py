@@ -0,0 +1,217 @@
+"""牌面编码、解析与手牌结构
+
+每张牌用 0-53 的整数编号：``rank * 4 + suit``，其中 rank 为 0-12（3 到 2），
+suit 为 0-3（♣ ♦ ♥ ♠），小王为 52，大王为 53。编号的大小顺序即手牌的展示顺序。
+
+玩家输入用预先构建的前缀树逐字符解析，每个记号解析为一张具体的牌，或者只给出
+点数（如 ``3``、``J``），由 Hand.resolve 从手牌中选出对应的牌。记号之间可以
+不加空格，``JJ QQ KK`` 与 ``J J Q Q K K`` 等价。
+"""
+
+# 点数（按大小排列）
+RANKS = ('3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A', '2')
+# 花色（按排序权重从小到大排列）
+SUITS = ('♣', '♦', '♥', '♠')
+
+# 点数槽位：13 个普通点数 + 小王 + 大王
+RANK_SLOTS = 15
+SMALL_JOKER = 52
+BIG_JOKER = 53
+DECK_SIZE = 54
+
+# 编号 -> 牌面字符串
+CARD_NAMES = tuple(f"{SUITS[card % 4]}{RANKS[card // 4]}" for card in range(52)) + ('joker', 'JOKER')
+# 牌面字符串 -> 编号
+CARD_IDS = {name: card for card, name in enumerate(CARD_NAMES)}
+# 编号 -> 点数槽位
+CARD_RANK = tuple(card // 4 for card in range(52)) + (13, 14)
+# 点数槽位 -> 该点数的全部牌编号
+RANK_CARDS = tuple(tuple(range(rank * 4, rank * 4 + 4)) for rank in range(13)) + ((SMALL_JOKER,), (BIG_JOKER,))
+# 点数槽位 -> 牌值（与插件中 card_values 的取值一致）
+RANK_VALUES = tuple(range(3, 3 + RANK_SLOTS))
+
+# 只给出点数的记号：RANK_TOKEN + 点数槽位，与牌编号（< 64）不重叠
+RANK_TOKEN = 64
+# 记号之间的分隔符
+SEPARATORS = frozenset(' \t\n,，、')
+
+
+def _build_parse_trie():
+    """构建 记号 -> 编号 的前缀树，每个节点为 {字符: 子节点}，'' 键存放终止值"""
+    tokens = dict(CARD_IDS)
+    tokens.update({'小王': SMALL_JOKER, '大王': BIG_JOKER})
+    for rank, name in enumerate(RANKS):
+        tokens[name] = RANK_TOKEN + rank
+        tokens[name.lower()] = RANK_TOKEN + rank
+    trie = {}
+    for token, value in tokens.items():
+        node = trie
+        for char in token:
+            node = node.setdefault(char, {})
+        node[''] = value
+    return trie
+
+
+PARSE_TRIE = _build_parse_trie()
+
+
+def parse_cards(text):
+    """把输入解析为记号列表（牌编号或 RANK_TOKEN + 点数），无法识别时返回 None
+
+    每个位置取最长匹配，因此 ``JOKER`` 不会被拆成 ``J`` 和其余字符。
+    """
+    tokens = []
+    pos = 0
+    size = len(text)
+    while pos < size:
+        if text[pos] in SEPARATORS:
+            pos += 1
+            continue
+        node = PARSE_TRIE
+        value = None
+        matched = end = pos
+        while end < size:
+            node = node.get(text[end])
+            if node is None:
+                break
+            end += 1
+            if '' in node:
+                value = node['']
+                matched = end
+        if value is None:
+            return None
+        tokens.append(value)
+        pos = matched
+    return tokens
+
+
+def format_cards(cards):
+    """按给定顺序把牌编号格式化为以空格分隔的牌面"""
+    return ' '.join([CARD_NAMES[card] for card in cards])
+
+
+class Hand:
+    """手牌：15 槽点数计数 + 54 位牌面掩码，增删查均为 O(1)，遍历时按大小有序"""
+
+    __slots__ = ('counts', 'mask')
+
+    def __init__(self, cards=()):
+        self.counts = bytearray(RANK_SLOTS)
+        self.mask = 0
+        for card in cards:
+            self.add(card)
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def __contains__(self, card):
+        return (self.mask >> card) & 1 == 1
+
+    def __iter__(self):
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def __repr__(self):
+        return f"Hand({' '.join(self.names())})"
+
+    def __getstate__(self):
+        return bytes(self.counts), self.mask
+
+    def __setstate__(self, state):
+        counts, self.mask = state
+        self.counts = bytearray(counts)
+
+    @classmethod
+    def from_state(cls, state):
+        """由 __getstate__ 的结果重建手牌"""
+        hand = cls.__new__(cls)
+        counts, hand.mask = state
+        hand.counts = bytearray(counts)
+        return hand
+
+    def copy(self):
+        """复制手牌"""
+        hand = Hand.__new__(Hand)
+        hand.counts = bytearray(self.counts)
+        hand.mask = self.mask
+        return hand
+
+    def add(self, card):
+        """加入一张牌"""
+        bit = 1 << card
+        if self.mask & bit:
+            raise ValueError(f"重复的牌: {CARD_NAMES[card]}")
+        self.mask |= bit
+        self.counts[CARD_RANK[card]] += 1
+
+    def remove(self, card):
+        """移除一张牌"""
+        bit = 1 << card
+        if not self.mask & bit:
+            raise ValueError(f"手牌中没有: {CARD_NAMES[card]}")
+        self.mask ^= bit
+        self.counts[CARD_RANK[card]] -= 1
+
+    def update(self, cards):
+        """加入多张牌"""
+        for card in cards:
+            self.add(card)
+
+    def contains_all(self, cards):
+        """检查是否持有全部这些牌（重复的牌视为不持有）"""
+        mask = 0
+        for card in cards:
+            bit = 1 << card
+            if mask & bit:
+                return False
+            mask |= bit
+        return mask & ~self.mask == 0
+
+    def remove_all(self, cards):
+        """移除多张牌"""
+        for card in cards:
+            self.remove(card)
+
+    def pick(self, ranks):
+        """按 (点数槽位, 张数) 从手牌中取出花色最小的牌，不修改手牌"""
+        cards = []
+        for rank, count in ranks:
+            for card in RANK_CARDS[rank]:
+                if count == 0:
+                    break
+                if (self.mask >> card) & 1:
+                    cards.append(card)
+                    count -= 1
+        return cards
+
+    def resolve(self, tokens):
+        """把 parse_cards 的记号换成具体的牌，牌不够时返回 None
+
+        指定了花色的牌原样保留（是否持有由出牌规则检查），只给出点数的记号
+        依次取手牌中尚未选中的、花色最小的该点数的牌。
+        """
+        cards = []
+        chosen = 0
+        for token in tokens:
+            if token < RANK_TOKEN:
+                cards.append(token)
+                chosen |= 1 << token
+        for token in tokens:
+            if token < RANK_TOKEN:
+                continue
+            for card in RANK_CARDS[token - RANK_TOKEN]:
+                bit = 1 << card
+                if self.mask & bit and not chosen & bit:
+                    cards.append(card)
+                    chosen |= bit
+                    break
+            else:
+                return None
+        return cards
+
+    def names(self):
+        """按大小排列的牌面字符串"""
+        return [CARD_NAMES[card] for card in self]
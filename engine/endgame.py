@@ -0,0 +1,225 @@
+"""残局精确求解
+
+每个玩家的手牌都不超过 ENDGAME_CARDS 张时，按明牌完整搜索剩余的牌局，给出当前
+玩家一方能否必胜以及必胜的出牌。胜负只分地主和农民两方，搜索是与或树：地主出牌
+的结点只要有一个子结点地主胜即为地主胜，农民出牌的结点要全部子结点地主胜才为
+地主胜，得出结论后立即剪枝（相当于零窗口的 alpha-beta）。
+
+花色不影响出牌，状态只包含三家的点数计数、轮到谁和需要压过的牌型，用 Zobrist
+散列随出牌增量更新。置换表是固定大小的数组，按散列低位寻址、新结果直接覆盖，
+内存占用与搜索规模无关，同一进程内的多次求解共用。子结点先试能一手出完的牌，
+其余按打出后剩余手数排序，农民跟队友的牌时先试不出。
+"""
+import random
+from array import array
+from typing import Dict, Optional, Tuple
+
+from .cards import RANK_SLOTS
+from .game import Game
+from .moves import Move, MoveTable, move_table
+from .patterns import DEFAULT_RULES, Pattern, can_beat
+from .solver import HandSolver, count_key, move_key
+
+# 进入残局的手牌张数上限（每个玩家）
+ENDGAME_CARDS = 8
+# 置换表大小（2 的幂）
+TABLE_BITS = 20
+# 单次求解的默认结点上限，超过时放弃（每秒约 25 万个结点）
+NODE_LIMIT = 1000000
+# 缓存出牌列表的手牌数，超过时清空
+MOVES_CACHE_SIZE = 100000
+
+# 置换表中的结论
+_FARMERS = 1
+_LANDLORD = 2
+
+# Zobrist 随机数，座次以地主为 0 按出牌顺序编号，张数为 0 时不参与散列
+_rng = random.Random(0x5EED)
+_Z_COUNTS = tuple(
+    tuple(tuple(_rng.getrandbits(64) if count else 0 for count in range(5)) for _ in range(RANK_SLOTS))
+    for _ in range(3)
+)
+_Z_TURN = tuple(_rng.getrandbits(64) for _ in range(3))
+# {(牌型, 出牌座次): 随机数}，用到时生成
+_z_patterns: Dict[Tuple[Pattern, int], int] = {}
+
+
+def _pattern_key(pattern: Pattern, leader: int) -> int:
+    key = _z_patterns.get((pattern, leader))
+    if key is None:
+        key = _z_patterns[(pattern, leader)] = _rng.getrandbits(64)
+    return key
+
+
+class _NodeLimit(Exception):
+    """超过结点上限"""
+
+
+def in_endgame(game: Game) -> bool:
+    """是否处于出牌阶段且每个玩家的手牌都不超过 ENDGAME_CARDS 张"""
+    if game.bid_stage or game.landlord is None or game.winner is not None:
+        return False
+    return all(len(hand) <= ENDGAME_CARDS for hand in game.hands.values())
+
+
+class EndgameSolver:
+    """某一玩法下的残局求解器"""
+
+    __slots__ = ('table', 'hand_solver', 'mask', 'keys', 'results', 'moves', 'nodes', 'probes', 'hits', '_limit')
+
+    def __init__(self, table: MoveTable, bits: int = TABLE_BITS, hand_solver: Optional[HandSolver] = None):
+        self.table = table
+        # 用于子结点排序
+        self.hand_solver = hand_solver or HandSolver(table)
+        size = 1 << bits
+        self.mask = size - 1
+        # 置换表：散列和结论（0 表示空）
+        self.keys = array('Q', bytes(8 * size))
+        self.results = bytearray(size)
+        # 每手牌的全部出牌 {计数键: ((出牌, 出牌键, 张数, 打出后剩余手数), ...)}
+        self.moves: Dict[int, Tuple[Tuple[Move, int, int, int], ...]] = {}
+        self.nodes = 0
+        self.probes = 0
+        self.hits = 0
+        self._limit = 0
+
+    def solve(self, game: Game, player_id, node_limit: int = NODE_LIMIT) -> Optional[Tuple[bool, Optional[Move]]]:
+        """(player_id 一方是否必胜, 出牌)：必胜时为必胜的一手，否则为剩余手数最少的一手，None 表示不出；
+        不在残局或超过结点上限时返回 None"""
+        if not in_endgame(game) or game.current_player != player_id:
+            return None
+        hands, sizes, seat, leader, pattern, h = self._state(game, player_id)
+        want = seat == 0
+        self._limit = self.nodes + node_limit
+        children = self._children(hands[seat], seat, leader, pattern)
+        try:
+            for entry in children:
+                if self._child(hands, sizes, seat, leader, pattern, h, entry) == want:
+                    return True, entry and entry[0]
+        except _NodeLimit:
+            return None
+        return False, children[0] and children[0][0]
+
+    def outcome(self, game: Game, player_id, move: Optional[Move], node_limit: int = NODE_LIMIT) -> Optional[bool]:
+        """player_id 打出 move（None 为不出）之后双方都不失误时，player_id 一方是否获胜；
+        不在残局或超过结点上限时返回 None"""
+        if not in_endgame(game) or game.current_player != player_id:
+            return None
+        hands, sizes, seat, leader, pattern, h = self._state(game, player_id)
+        entry = None
+        if move is not None:
+            entry = (move, move_key(move), sum(count for _, count in move.ranks), 0)
+        self._limit = self.nodes + node_limit
+        try:
+            return self._child(hands, sizes, seat, leader, pattern, h, entry) == (seat == 0)
+        except _NodeLimit:
+            return None
+
+    def _state(self, game: Game, player_id):
+        """把牌局转换为以地主为 0 号座次的搜索状态（各家的计数键）和散列"""
+        seats = [game.landlord]
+        while len(seats) < 3:
+            seats.append(game.next_seat[seats[-1]])
+        hands = [count_key(game.hands[player].counts) for player in seats]
+        sizes = [len(game.hands[player]) for player in seats]
+        seat = seats.index(player_id)
+        pattern = game.required_pattern(player_id)
+        leader = seats.index(game.last_play.player) if pattern is not None else seat
+        h = _Z_TURN[seat]
+        for i, hand in enumerate(hands):
+            for rank in range(RANK_SLOTS):
+                h ^= _Z_COUNTS[i][rank][(hand >> (4 * rank)) & 15]
+        if pattern is not None:
+            h ^= _pattern_key(pattern, leader)
+        return hands, sizes, seat, leader, pattern, h
+
+    def _hand_moves(self, hand: int):
+        """一手牌的全部出牌，按打出后剩余手数排序，能一手出完的在最前"""
+        entries = self.moves.get(hand)
+        if entries is None:
+            if len(self.moves) >= MOVES_CACHE_SIZE:
+                self.moves.clear()
+            counts = [(hand >> (4 * rank)) & 15 for rank in range(RANK_SLOTS)]
+            entries = [
+                (move, move_key(move), sum(count for _, count in move.ranks), self.hand_solver.remaining(counts, move))
+                for move in self.table.legal_moves(counts)
+            ]
+            entries.sort(key=lambda entry: entry[3])
+            entries = self.moves[hand] = tuple(entries)
+        return entries
+
+    def _children(self, hand: int, seat: int, leader: int, pattern: Optional[Pattern]) -> list:
+        """子结点的出牌顺序：能一手出完时只试这一手；不出（None）在跟队友时放在最前，否则放在最后"""
+        entries = self._hand_moves(hand)
+        if pattern is None:
+            return entries[:1] if entries[0][3] == 0 else list(entries)
+        children = [entry for entry in entries if can_beat(entry[0].pattern, pattern)]
+        if children and children[0][3] == 0:
+            return children[:1]
+        if seat != 0 and leader != 0:
+            children.insert(0, None)
+        else:
+            children.append(None)
+        return children
+
+    def _child(self, hands, sizes, seat, leader, pattern, h, entry) -> bool:
+        """执行一手出牌或不出（entry 为 None），返回之后的结论（地主是否获胜）"""
+        nxt = seat + 1 if seat < 2 else 0
+        h ^= _Z_TURN[seat] ^ _Z_TURN[nxt]
+        if entry is None:
+            if nxt == leader:
+                # 一轮都不要，上一手出牌的玩家自由出牌
+                return self._search(hands, sizes, nxt, nxt, None, h ^ _pattern_key(pattern, leader))
+            return self._search(hands, sizes, nxt, leader, pattern, h)
+        move, key, cards, _ = entry
+        if cards == sizes[seat]:
+            return seat == 0
+        if pattern is not None:
+            h ^= _pattern_key(pattern, leader)
+        hand = hands[seat]
+        zobrist = _Z_COUNTS[seat]
+        for rank, count in move.ranks:
+            old = (hand >> (4 * rank)) & 15
+            h ^= zobrist[rank][old] ^ zobrist[rank][old - count]
+        hands[seat] = hand - key
+        sizes[seat] -= cards
+        try:
+            return self._search(hands, sizes, nxt, seat, move.pattern, h ^ _pattern_key(move.pattern, seat))
+        finally:
+            hands[seat] = hand
+            sizes[seat] += cards
+
+    def _search(self, hands, sizes, seat, leader, pattern, h) -> bool:
+        self.nodes += 1
+        if self.nodes > self._limit:
+            raise _NodeLimit
+        index = h & self.mask
+        self.probes += 1
+        if self.keys[index] == h:
+            self.hits += 1
+            return self.results[index] == _LANDLORD
+        want = seat == 0
+        result = not want
+        for entry in self._children(hands[seat], seat, leader, pattern):
+            if self._child(hands, sizes, seat, leader, pattern, h, entry) == want:
+                result = want
+                break
+        self.keys[index] = h
+        self.results[index] = _LANDLORD if result else _FARMERS
+        return result
+
+
+_solvers: Dict[str, EndgameSolver] = {}
+
+
+def endgame_solver(rules: str = DEFAULT_RULES) -> EndgameSolver:
+    """玩法对应的残局求解器，每个进程每种玩法只生成一次，置换表在多次求解间共用"""
+    solver = _solvers.get(rules)
+    if solver is None:
+        solver = _solvers[rules] = EndgameSolver(move_table(rules))
+    return solver
+
+
+def solve_endgame(game: Game, player_id, node_limit: int = NODE_LIMIT) -> Optional[Tuple[bool, Optional[Move]]]:
+    """用本进程的求解器求解（供进程池调用）"""
+    return endgame_solver(game.rules).solve(game, player_id, node_limit)
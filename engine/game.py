@@ -0,0 +1,234 @@
+"""牌局规则引擎
+
+不依赖 AstrBot 的规则状态机：发牌、叫分、出牌、不出和计分。玩家用任意可哈希的
+编号表示，牌用整数编号表示。非法操作抛出 RuleError，由调用方按错误码生成提示；
+合法操作返回结果码，由调用方决定后续动作（例如无人叫分时重新发牌）。
+"""
+import random
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cards import BIG_JOKER, CARD_IDS, RANKS, SMALL_JOKER, Hand
+from .patterns import DEFAULT_RULES, Pattern, can_beat, classify, pattern_index
+
+# 每局玩家数、每人手牌数、最高叫分
+SEAT_COUNT = 3
+HAND_SIZE = 17
+MAX_BID = 3
+
+# 默认玩法的牌型签名索引
+PATTERN_INDEX = pattern_index(DEFAULT_RULES)
+
+# 洗牌前的牌序：♠ ♥ ♦ ♣ 各 13 张，再加小王、大王
+DECK_ORDER = tuple(CARD_IDS[f"{suit}{rank}"] for suit in '♠♥♦♣' for rank in RANKS) + (SMALL_JOKER, BIG_JOKER)
+
+# 错误码
+NOT_BIDDING = 1    # 不是叫分阶段
+NOT_PLAYING = 2    # 不是出牌阶段
+NOT_TURN = 3       # 没有轮到该玩家
+BAD_SCORE = 4      # 叫分不在 1-3 之间
+LOW_SCORE = 5      # 叫分没有高于当前最高分
+NOT_IN_HAND = 6    # 手牌中没有这些牌
+BAD_PATTERN = 7    # 牌型不合法
+CANNOT_BEAT = 8    # 大不过上一手牌
+MUST_PLAY = 9      # 自由出牌时不能不出
+
+# 操作结果
+NEXT = 0       # 轮到下一个玩家
+LANDLORD = 1   # 叫分结束，地主已确定
+REDEAL = 2     # 无人叫分，需要重新发牌
+WIN = 3        # 出完手牌，牌局结束
+
+
+class RuleError(Exception):
+    """不符合规则的操作"""
+
+    def __init__(self, code: int):
+        super().__init__(code)
+        self.code = code
+
+
+class Play(NamedTuple):
+    """一手牌：出牌玩家、牌编号、牌型"""
+    player: Hashable
+    cards: Tuple[int, ...]
+    pattern: Pattern
+
+
+def new_deck(rng=random) -> List[int]:
+    """洗好的一副牌（牌编号），同一随机数序列得到的牌序相同"""
+    deck = list(DECK_ORDER)
+    rng.shuffle(deck)
+    return deck
+
+
+class Game:
+    """一局斗地主的规则状态：座次、手牌、叫分和出牌进度"""
+
+    __slots__ = (
+        'next_seat', 'hands', 'landlord_cards', 'current_player', 'landlord', 'last_play',
+        'bid_stage', 'bid_score', 'bid_player', 'first_bidder', 'winner', 'rules',
+    )
+
+    def __init__(self, players: Iterable[Hashable] = (), rules: str = DEFAULT_RULES):
+        # 座次环 {player_id: 下家 player_id}
+        self.next_seat: Dict[Hashable, Hashable] = {}
+        # 玩家手牌 {player_id: Hand}
+        self.hands: Dict[Hashable, Hand] = {}
+        self.landlord_cards: Tuple[int, ...] = ()
+        self.current_player = None
+        self.landlord = None
+        # 最后一手牌
+        self.last_play: Optional[Play] = None
+        self.bid_stage = False
+        self.bid_score = 0
+        self.bid_player = None
+        self.first_bidder = None
+        self.winner = None
+        # 玩法（RULE_SETS 的键）
+        self.rules = rules
+        if players:
+            self.seat(players)
+
+    def __getstate__(self):
+        # 快照只含不可变的值和新建的容器，与牌局脱离后可以交给线程序列化
+        return (
+            self.next_seat, {player_id: hand.__getstate__() for player_id, hand in self.hands.items()},
+            self.landlord_cards, self.current_player, self.landlord, self.last_play,
+            self.bid_stage, self.bid_score, self.bid_player, self.first_bidder, self.winner, self.rules,
+        )
+
+    def __setstate__(self, state):
+        (self.next_seat, hands, self.landlord_cards, self.current_player, self.landlord, self.last_play,
+         self.bid_stage, self.bid_score, self.bid_player, self.first_bidder, self.winner, self.rules) = state
+        self.hands = {player_id: Hand.from_state(hand) for player_id, hand in hands.items()}
+
+    @classmethod
+    def from_state(cls, state):
+        """由 __getstate__ 的结果重建牌局"""
+        game = cls.__new__(cls)
+        game.__setstate__(state)
+        return game
+
+    def copy(self) -> 'Game':
+        """复制规则状态（手牌为副本），子类增加的字段不复制"""
+        game = Game.__new__(Game)
+        for name in Game.__slots__:
+            setattr(game, name, getattr(self, name))
+        game.hands = {player_id: hand.copy() for player_id, hand in self.hands.items()}
+        return game
+
+    def seat(self, players: Iterable[Hashable]):
+        """按给定顺序生成座次环"""
+        seats = list(players)
+        self.next_seat = {player_id: seats[(i + 1) % len(seats)] for i, player_id in enumerate(seats)}
+
+    def seat_index(self, player_id) -> int:
+        """玩家的座次（从 0 开始）"""
+        return list(self.next_seat).index(player_id)
+
+    def next_player(self):
+        """轮到下一个玩家"""
+        self.current_player = self.next_seat[self.current_player]
+        return self.current_player
+
+    def deal(self, deck: Sequence[int], first_bidder: Hashable):
+        """按座次每人发 17 张，剩余 3 张作为地主牌，由 first_bidder 开始叫分"""
+        self.hands = {
+            player_id: Hand(deck[i * HAND_SIZE:(i + 1) * HAND_SIZE])
+            for i, player_id in enumerate(self.next_seat)
+        }
+        self.landlord_cards = tuple(deck[SEAT_COUNT * HAND_SIZE:])
+        self.landlord = None
+        self.last_play = None
+        self.winner = None
+        self.bid_stage = True
+        self.bid_score = 0
+        self.bid_player = None
+        self.current_player = first_bidder
+        self.first_bidder = first_bidder
+
+    def check_turn(self, player_id, bidding: bool):
+        """检查阶段和是否轮到该玩家"""
+        if bidding and not self.bid_stage:
+            raise RuleError(NOT_BIDDING)
+        if not bidding and (self.bid_stage or self.landlord is None or self.winner is not None):
+            raise RuleError(NOT_PLAYING)
+        if self.current_player != player_id:
+            raise RuleError(NOT_TURN)
+
+    def bid(self, player_id, score: int) -> int:
+        """叫分，叫满 3 分直接成为地主"""
+        self.check_turn(player_id, True)
+        if score < 1 or score > MAX_BID:
+            raise RuleError(BAD_SCORE)
+        if score <= self.bid_score:
+            raise RuleError(LOW_SCORE)
+        self.bid_score = score
+        self.bid_player = player_id
+        if score == MAX_BID:
+            self._end_bidding()
+            return LANDLORD
+        self.next_player()
+        return NEXT
+
+    def no_bid(self, player_id) -> int:
+        """不叫，叫分回到第一个叫分的玩家时结束叫分或要求重新发牌"""
+        self.check_turn(player_id, True)
+        self.next_player()
+        if self.current_player != self.first_bidder:
+            return NEXT
+        if self.bid_score == 0:
+            return REDEAL
+        self._end_bidding()
+        return LANDLORD
+
+    def _end_bidding(self):
+        """确定地主，地主获得底牌并先出牌"""
+        self.landlord = self.bid_player
+        self.hands[self.landlord].update(self.landlord_cards)
+        self.bid_stage = False
+        self.current_player = self.landlord
+
+    def required_pattern(self, player_id) -> Optional[Pattern]:
+        """玩家需要压过的牌型，自由出牌时返回 None"""
+        last_play = self.last_play
+        if last_play is None or last_play.player == player_id:
+            return None
+        return last_play.pattern
+
+    def play(self, player_id, cards: Sequence[int]) -> int:
+        """出牌，出完手牌时牌局结束"""
+        self.check_turn(player_id, False)
+        hand = self.hands[player_id]
+        if not hand.contains_all(cards):
+            raise RuleError(NOT_IN_HAND)
+        pattern = classify(cards, pattern_index(self.rules))
+        if pattern is None:
+            raise RuleError(BAD_PATTERN)
+        last_pattern = self.required_pattern(player_id)
+        if last_pattern is not None and not can_beat(pattern, last_pattern):
+            raise RuleError(CANNOT_BEAT)
+        hand.remove_all(cards)
+        self.last_play = Play(player_id, tuple(cards), pattern)
+        if len(hand) == 0:
+            self.winner = player_id
+            return WIN
+        self.next_player()
+        return NEXT
+
+    def pass_turn(self, player_id) -> int:
+        """不出，自由出牌时不能不出"""
+        self.check_turn(player_id, False)
+        if self.required_pattern(player_id) is None:
+            raise RuleError(MUST_PLAY)
+        self.next_player()
+        return NEXT
+
+    def scores(self) -> Dict[Hashable, int]:
+        """结算得分：地主胜利时地主得叫分的 2 倍、农民各扣叫分，农民胜利时相反"""
+        base = self.bid_score
+        sign = 1 if self.winner == self.landlord else -1
+        return {
+            player_id: sign * (base * 2 if player_id == self.landlord else -base)
+            for player_id in self.next_seat
+        }
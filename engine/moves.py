@@ -0,0 +1,107 @@
+"""合法出牌生成
+
+按 (牌型, 张数) 把牌型索引整理成按牌值升序的候选表。生成出牌时从候选表中
+二分定位到第一个大过上家的位置，再逐个检查手牌点数是否足够，结果以生成器
+惰性产出，按牌型强度从小到大排列，同一点数组合只产出一次（不区分花色）。
+
+每种出牌需要的点数按张数从多到少排列，主牌（三张、四张、飞机）在前。同一
+牌值的候选主牌相同、只是带牌不同，主牌不够时整段跳过，因此带翅膀的牌型虽然
+候选很多，实际检查的候选并不多。
+"""
+from bisect import bisect_right
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cards import RANK_SLOTS
+from .patterns import (
+    BOMB, DEFAULT_RULES, FOUR_PAIR, FOUR_SINGLE, PAIR, PAIRS, PLANE, PLANE_PAIR, PLANE_SINGLE, ROCKET, SINGLE,
+    STRAIGHT, TRIO, TRIO_PAIR, TRIO_SINGLE, Pattern, pattern_index,
+)
+
+# 首家出牌时各牌型的尝试顺序，炸弹和火箭放在最后
+LEAD_ORDER = (
+    SINGLE, PAIR, TRIO, TRIO_SINGLE, TRIO_PAIR, STRAIGHT, PAIRS, PLANE, PLANE_SINGLE, PLANE_PAIR,
+    FOUR_SINGLE, FOUR_PAIR,
+)
+
+
+class Move(NamedTuple):
+    """一种出牌：牌型 + 需要的 (点数槽位, 张数)"""
+    pattern: Pattern
+    ranks: Tuple[Tuple[int, int], ...]
+
+
+class MoveTable:
+    """按 (牌型, 张数) 分组、按牌值升序排列的候选出牌表"""
+
+    __slots__ = ('groups', 'values', 'lead_keys')
+
+    def __init__(self, index: Dict[int, Pattern]):
+        groups: Dict[Tuple[int, int], List[Tuple[int, Move]]] = {}
+        for signature, pattern in index.items():
+            ranks = tuple(sorted(
+                ((rank, (signature >> (3 * rank)) & 7)
+                 for rank in range(RANK_SLOTS)
+                 if (signature >> (3 * rank)) & 7),
+                key=lambda entry: -entry[1],
+            ))
+            groups.setdefault((pattern.type, pattern.length), []).append((signature, Move(pattern, ranks)))
+        self.groups: Dict[Tuple[int, int], Tuple[Move, ...]] = {}
+        self.values: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        for key, entries in groups.items():
+            entries.sort(key=lambda entry: (entry[1].pattern.value, entry[0]))
+            self.groups[key] = tuple(move for _, move in entries)
+            self.values[key] = tuple(move.pattern.value for move in self.groups[key])
+        # 首家出牌的分组顺序：普通牌型按张数升序，然后是炸弹、火箭
+        self.lead_keys = tuple(sorted(
+            (key for key in self.groups if key[0] not in (BOMB, ROCKET)),
+            key=lambda key: (LEAD_ORDER.index(key[0]) if key[0] in LEAD_ORDER else len(LEAD_ORDER), key[1]),
+        )) + tuple(key for key in ((BOMB, 4), (ROCKET, 2)) if key in self.groups)
+
+    def _scan(self, counts: Sequence[int], key: Tuple[int, int], above: int) -> Iterator[Move]:
+        """产出分组 key 中牌值大于 above 且手牌足够的出牌"""
+        moves = self.groups.get(key)
+        if not moves:
+            return
+        values = self.values[key]
+        i = bisect_right(values, above)
+        while i < len(moves):
+            move = moves[i]
+            rank, count = move.ranks[0]
+            if counts[rank] < count:
+                # 主牌不够，跳过同一牌值的全部候选
+                i = bisect_right(values, move.pattern.value, i)
+                continue
+            i += 1
+            for rank, count in move.ranks:
+                if counts[rank] < count:
+                    break
+            else:
+                yield move
+
+    def legal_moves(self, counts: Sequence[int], last: Optional[Pattern] = None) -> Iterator[Move]:
+        """惰性产出所有合法出牌，last 为 None 表示自由出牌"""
+        if last is None:
+            for key in self.lead_keys:
+                yield from self._scan(counts, key, -1)
+            return
+        if last.type == ROCKET:
+            return
+        yield from self._scan(counts, (last.type, last.length), last.value)
+        if last.type != BOMB:
+            yield from self._scan(counts, (BOMB, 4), -1)
+        yield from self._scan(counts, (ROCKET, 2), -1)
+
+    def has_move(self, counts: Sequence[int], last: Optional[Pattern] = None) -> bool:
+        """是否存在合法出牌"""
+        return next(self.legal_moves(counts, last), None) is not None
+
+
+_tables: Dict[str, MoveTable] = {}
+
+
+def move_table(rules: str = DEFAULT_RULES) -> MoveTable:
+    """玩法对应的候选出牌表，每个进程每种玩法只生成一次"""
+    table = _tables.get(rules)
+    if table is None:
+        table = _tables[rules] = MoveTable(pattern_index(rules))
+    return table
@@ -0,0 +1,193 @@
+"""牌型签名索引
+
+一手牌按点数计数归约为一个整数签名：每个点数槽位占 3 位，存放该点数的张数。
+所有合法牌型的签名在加载时一次性生成索引，判断牌型只需累加签名并查一次表。
+
+不同玩法（是否允许飞机带翅膀、四带二、顺子带 2）各自编译为一份索引，玩法只
+影响索引的内容，判断牌型的开销与玩法无关。
+"""
+from itertools import combinations
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from .cards import CARD_RANK, RANK_VALUES
+
+# 牌型编号
+SINGLE = 1       # 单牌
+PAIR = 2         # 对子
+TRIO = 3         # 三张
+TRIO_SINGLE = 4  # 三带一
+TRIO_PAIR = 5    # 三带二
+STRAIGHT = 6     # 顺子
+PAIRS = 7        # 连对
+PLANE = 8        # 飞机
+BOMB = 9         # 炸弹
+ROCKET = 10      # 火箭
+PLANE_SINGLE = 11  # 飞机带单牌
+PLANE_PAIR = 12    # 飞机带对子
+FOUR_SINGLE = 13   # 四带两张单牌
+FOUR_PAIR = 14     # 四带两对
+
+CARD_TYPES = {
+    'single': SINGLE,
+    'pair': PAIR,
+    'trio': TRIO,
+    'trio_single': TRIO_SINGLE,
+    'trio_pair': TRIO_PAIR,
+    'straight': STRAIGHT,
+    'pairs': PAIRS,
+    'plane': PLANE,
+    'bomb': BOMB,
+    'rocket': ROCKET,
+    'plane_single': PLANE_SINGLE,
+    'plane_pair': PLANE_PAIR,
+    'four_single': FOUR_SINGLE,
+    'four_pair': FOUR_PAIR,
+}
+
+# 压制等级：火箭 > 炸弹 > 其他牌型，按牌型编号索引
+BEAT_TIER = (0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 2, 0, 0, 0, 0)
+
+# 一手牌最多的张数（地主手牌数）
+MAX_PLAY = 20
+# 可以组成顺子、连对、飞机的最大点数槽位（A，允许顺子带 2 时为 2）
+MAX_CHAIN_RANK = 11
+TWO_RANK = 12
+# 点数槽位数量：普通点数 13 个，王 2 个
+NORMAL_RANKS = 13
+SMALL_JOKER_RANK = 13
+BIG_JOKER_RANK = 14
+
+# 每张牌对签名的贡献
+CARD_SIGNATURE = tuple(1 << (3 * rank) for rank in CARD_RANK)
+
+
+class RuleSet(NamedTuple):
+    """玩法：名称和可选规则"""
+    label: str
+    # 飞机可以带同样数量的单牌或对子
+    plane_wings: bool
+    # 炸弹可以带两张单牌或两对（不算炸弹）
+    four_with_two: bool
+    # 顺子、连对、飞机可以包含 2
+    chain_with_two: bool
+
+
+# 可选的玩法，键用于日志和回放
+RULE_SETS = {
+    'classic': RuleSet('经典', True, True, False),
+    'simple': RuleSet('简单', False, False, False),
+    'two_chain': RuleSet('顺子带2', True, True, True),
+}
+DEFAULT_RULES = 'classic'
+
+
+def find_rules(name: str) -> Optional[str]:
+    """按键或名称查找玩法，返回玩法的键"""
+    if name in RULE_SETS:
+        return name
+    for key, rules in RULE_SETS.items():
+        if rules.label == name:
+            return key
+    return None
+
+
+class Pattern(NamedTuple):
+    """牌型：类型编号、主牌值、张数"""
+    type: int
+    value: int
+    length: int
+
+
+def rank_signature(counts: Dict[int, int]) -> int:
+    """由 {点数槽位: 张数} 计算签名"""
+    signature = 0
+    for rank, count in counts.items():
+        signature += count << (3 * rank)
+    return signature
+
+
+def build_pattern_index(rules: RuleSet = RULE_SETS[DEFAULT_RULES]) -> Dict[int, Pattern]:
+    """按玩法生成签名 -> 牌型的索引"""
+    index = {}
+    max_chain_rank = TWO_RANK if rules.chain_with_two else MAX_CHAIN_RANK
+
+    def add(card_type, main_rank, counts):
+        length = sum(counts.values())
+        if length <= MAX_PLAY:
+            index.setdefault(rank_signature(counts), Pattern(card_type, RANK_VALUES[main_rank], length))
+
+    # 火箭
+    add(ROCKET, BIG_JOKER_RANK, {SMALL_JOKER_RANK: 1, BIG_JOKER_RANK: 1})
+    for rank in range(NORMAL_RANKS):
+        # 炸弹、对子、三张
+        add(BOMB, rank, {rank: 4})
+        add(PAIR, rank, {rank: 2})
+        add(TRIO, rank, {rank: 3})
+    # 单牌
+    for rank in range(NORMAL_RANKS + 2):
+        add(SINGLE, rank, {rank: 1})
+    for rank in range(NORMAL_RANKS):
+        # 三带一
+        for kicker in range(NORMAL_RANKS + 2):
+            if kicker != rank:
+                add(TRIO_SINGLE, rank, {rank: 3, kicker: 1})
+        # 三带二
+        for kicker in range(NORMAL_RANKS):
+            if kicker != rank:
+                add(TRIO_PAIR, rank, {rank: 3, kicker: 2})
+    # 顺子、连对、飞机
+    for card_type, count, min_len in ((STRAIGHT, 1, 5), (PAIRS, 2, 3), (PLANE, 3, 2)):
+        for start in range(max_chain_rank + 1):
+            for end in range(start + min_len - 1, max_chain_rank + 1):
+                add(card_type, start, {rank: count for rank in range(start, end + 1)})
+
+    # 带牌的点数互不相同且不在主牌中，两张王不能同时作为单牌带出（那是火箭）
+    def kickers(exclude, size, count):
+        ranks = [rank for rank in range(NORMAL_RANKS + 2 if count == 1 else NORMAL_RANKS) if rank not in exclude]
+        for combo in combinations(ranks, size):
+            if SMALL_JOKER_RANK not in combo or BIG_JOKER_RANK not in combo:
+                yield {rank: count for rank in combo}
+
+    if rules.plane_wings:
+        # 飞机带翅膀：每个三张带一张单牌或一对
+        for start in range(max_chain_rank + 1):
+            for end in range(start + 1, max_chain_rank + 1):
+                chain = {rank: 3 for rank in range(start, end + 1)}
+                for card_type, count in ((PLANE_SINGLE, 1), (PLANE_PAIR, 2)):
+                    if len(chain) * (3 + count) > MAX_PLAY:
+                        continue
+                    for wings in kickers(chain, len(chain), count):
+                        add(card_type, start, {**chain, **wings})
+    if rules.four_with_two:
+        # 四带二：四张带两张单牌或两对
+        for rank in range(NORMAL_RANKS):
+            for card_type, count in ((FOUR_SINGLE, 1), (FOUR_PAIR, 2)):
+                for pair in kickers((rank,), 2, count):
+                    add(card_type, rank, {rank: 4, **pair})
+    return index
+
+
+_indexes: Dict[str, Dict[int, Pattern]] = {}
+
+
+def pattern_index(rules: str = DEFAULT_RULES) -> Dict[int, Pattern]:
+    """玩法对应的牌型索引，每个玩法只生成一次"""
+    index = _indexes.get(rules)
+    if index is None:
+        index = _indexes[rules] = build_pattern_index(RULE_SETS[rules])
+    return index
+
+
+def classify(cards: Iterable[int], index: Dict[int, Pattern]) -> Optional[Pattern]:
+    """判断一手牌（牌编号）的牌型，不合法时返回 None"""
+    signature = 0
+    for card in cards:
+        signature += CARD_SIGNATURE[card]
+    return index.get(signature)
+
+
+def can_beat(pattern: Pattern, last: Pattern) -> bool:
+    """判断 pattern 能否压过 last"""
+    if pattern.type == last.type:
+        return pattern.length == last.length and pattern.value > last.value
+    return BEAT_TIER[pattern.type] > BEAT_TIER[last.type]
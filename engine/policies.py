@@ -0,0 +1,122 @@
+"""自对弈用的出牌策略
+
+策略决定轮到自己时叫几分、出哪手牌。自定义策略继承 Policy 并实现 bid 和 play，
+在自对弈中以 ``模块:类名`` 的形式指定即可加载。
+"""
+import random
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+
+from .cards import RANK_SLOTS
+from .game import MAX_BID, Game
+from .moves import Move, MoveTable
+from .patterns import BOMB, ROCKET
+from .solver import HandSolver
+
+# 点数槽位：2、小王、大王
+TWO_RANK = 12
+SMALL_JOKER_RANK = 13
+BIG_JOKER_RANK = 14
+
+
+class Policy(ABC):
+    """策略基类"""
+
+    def __init__(self, table: MoveTable, rng: random.Random):
+        self.table = table
+        self.rng = rng
+
+    @abstractmethod
+    def bid(self, game: Game, player_id) -> int:
+        """返回叫分，0 表示不叫（必须高于当前最高分）"""
+
+    @abstractmethod
+    def play(self, game: Game, player_id, moves: Iterator[Move]) -> Optional[Move]:
+        """从合法出牌中选择一手，返回 None 表示不出（自由出牌时不能不出）"""
+
+
+class RandomPolicy(Policy):
+    """随机叫分、随机出牌，能不出时有一半概率不出"""
+
+    def bid(self, game, player_id):
+        return self.rng.choice([0] + list(range(game.bid_score + 1, MAX_BID + 1)))
+
+    def play(self, game, player_id, moves):
+        moves = list(moves)
+        if game.required_pattern(player_id) is not None and (not moves or self.rng.random() < 0.5):
+            return None
+        return self.rng.choice(moves)
+
+
+class GreedyPolicy(Policy):
+    """按大牌数量叫分，总是出最小的牌；不压队友，非必要不用炸弹"""
+
+    def bid(self, game, player_id):
+        counts = game.hands[player_id].counts
+        strength = counts[TWO_RANK] + 2 * (counts[SMALL_JOKER_RANK] + counts[BIG_JOKER_RANK])
+        strength += 2 * sum(1 for rank in range(RANK_SLOTS) if counts[rank] == 4)
+        score = min(MAX_BID, strength // 2)
+        return score if score > game.bid_score else 0
+
+    def play(self, game, player_id, moves):
+        last_play = game.last_play
+        if last_play is None or last_play.player == player_id:
+            return next(moves)
+        # 队友出的牌不压
+        if game.landlord not in (player_id, last_play.player):
+            return None
+        for move in moves:
+            # 对手手牌还多时不用炸弹
+            if move.pattern.type in (BOMB, ROCKET) and len(game.hands[last_play.player]) > 5:
+                return None
+            return move
+        return None
+
+
+class SolverPolicy(GreedyPolicy):
+    """叫分同 GreedyPolicy；首家出最少手数拆牌中最小的一手，跟牌时选打出后剩余手数最少的牌"""
+
+    # 同一候选出牌表的策略共用求解器和缓存 {id(table): HandSolver}
+    _solvers = {}
+
+    def __init__(self, table, rng):
+        super().__init__(table, rng)
+        solver = self._solvers.get(id(table))
+        if solver is None:
+            solver = self._solvers[id(table)] = HandSolver(table)
+        self.solver = solver
+
+    def play(self, game, player_id, moves):
+        counts = game.hands[player_id].counts
+        last_play = game.last_play
+        if last_play is None or last_play.player == player_id:
+            plan = self.solver.plan(counts)
+            if len(plan) == 1:
+                return plan[0]
+            # 先出拆牌中最小的一手，炸弹和火箭留到最后
+            return min(plan, key=lambda move: (move.pattern.type in (BOMB, ROCKET), move.pattern.value))
+        moves = list(moves)
+        if not moves:
+            return None
+        move = min(moves, key=lambda move: self.solver.remaining(counts, move))
+        remaining = self.solver.remaining(counts, move)
+        if remaining == 0:
+            return move
+        # 队友出的牌不压
+        if game.landlord not in (player_id, last_play.player):
+            return None
+        opponent_cards = len(game.hands[last_play.player])
+        if move.pattern.type in (BOMB, ROCKET) and opponent_cards > 5:
+            return None
+        # 打出的是最少手数拆牌中的一手，或者对手快出完时才压
+        if remaining < self.solver.min_hands(counts) or opponent_cards <= 2:
+            return move
+        return None
+
+
+# 内置策略
+POLICIES = {
+    'random': RandomPolicy,
+    'greedy': GreedyPolicy,
+    'solver': SolverPolicy,
+}
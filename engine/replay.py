@@ -0,0 +1,206 @@
+"""对局回放的二进制格式
+
+一局的记录由玩家昵称、结束时间和操作流组成。操作流中每个操作以 varint
+``座次 << 3 | 标记`` 开头，后面按标记跟随数据：
+
+    DEAL    54 字节牌序（每张牌 1 字节编号），座次为第一个叫分的玩家
+    BID     叫分(u8)
+    NO_BID  无
+    PLAY    张数(varint) + 每张牌 1 字节编号
+    PASS    无
+    RULES   玩法的键（varint 长度 + ASCII），在第一次发牌之前，缺省为默认玩法
+
+一局约几百字节。回放文件以魔数开头，之后是若干条 ``varint 长度 + 记录``，
+可以流式追加，读取时逐条解码，不需要一次读入整个文件。
+"""
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+from .cards import DECK_SIZE
+from .game import Game
+from .patterns import DEFAULT_RULES
+
+# 操作标记
+TAG_DEAL = 0
+TAG_BID = 1
+TAG_NO_BID = 2
+TAG_PLAY = 3
+TAG_PASS = 4
+TAG_RULES = 5
+
+FILE_MAGIC = b'DDZR\x01'
+
+
+def _put_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def put_deal(out: bytearray, first_seat: int, deck: Sequence[int]):
+    """记录发牌：叫分起始座次和洗好的牌序"""
+    _put_varint(out, first_seat << 3 | TAG_DEAL)
+    out += bytes(deck)
+
+
+def put_bid(out: bytearray, seat: int, score: int):
+    _put_varint(out, seat << 3 | TAG_BID)
+    out.append(score)
+
+
+def put_no_bid(out: bytearray, seat: int):
+    _put_varint(out, seat << 3 | TAG_NO_BID)
+
+
+def put_play(out: bytearray, seat: int, cards: Sequence[int]):
+    _put_varint(out, seat << 3 | TAG_PLAY)
+    _put_varint(out, len(cards))
+    out += bytes(cards)
+
+
+def put_pass(out: bytearray, seat: int):
+    _put_varint(out, seat << 3 | TAG_PASS)
+
+
+def put_rules(out: bytearray, rules: str):
+    """记录玩法"""
+    raw = rules.encode('ascii')
+    _put_varint(out, TAG_RULES)
+    _put_varint(out, len(raw))
+    out += raw
+
+
+class Action(NamedTuple):
+    """一个操作：座次、标记、数据（叫分、出的牌或发牌的牌序、玩法）"""
+    seat: int
+    tag: int
+    score: int = 0
+    cards: Tuple[int, ...] = ()
+    rules: str = DEFAULT_RULES
+
+
+class GameReplay(NamedTuple):
+    """一局的完整记录"""
+    names: Tuple[str, ...]
+    ended_at: int
+    actions: Tuple[Action, ...]
+
+
+def encode_game(names: Sequence[str], ended_at: int, history: bytes) -> bytes:
+    """把一局的操作流编码为一条记录（不含长度前缀）"""
+    out = bytearray()
+    _put_varint(out, len(names))
+    for name in names:
+        raw = name.encode('utf-8')
+        _put_varint(out, len(raw))
+        out += raw
+    _put_varint(out, ended_at)
+    out += history
+    return bytes(out)
+
+
+def decode_game(data) -> GameReplay:
+    """解码一条记录"""
+    count, pos = _get_varint(data, 0)
+    names = []
+    for _ in range(count):
+        size, pos = _get_varint(data, pos)
+        names.append(bytes(data[pos:pos + size]).decode('utf-8'))
+        pos += size
+    ended_at, pos = _get_varint(data, pos)
+    actions = []
+    while pos < len(data):
+        head, pos = _get_varint(data, pos)
+        seat, tag = head >> 3, head & 7
+        if tag == TAG_DEAL:
+            actions.append(Action(seat, tag, 0, tuple(data[pos:pos + DECK_SIZE])))
+            pos += DECK_SIZE
+        elif tag == TAG_BID:
+            actions.append(Action(seat, tag, data[pos]))
+            pos += 1
+        elif tag == TAG_PLAY:
+            size, pos = _get_varint(data, pos)
+            actions.append(Action(seat, tag, 0, tuple(data[pos:pos + size])))
+            pos += size
+        elif tag == TAG_RULES:
+            size, pos = _get_varint(data, pos)
+            actions.append(Action(seat, tag, rules=bytes(data[pos:pos + size]).decode('ascii')))
+            pos += size
+        else:
+            actions.append(Action(seat, tag))
+    return GameReplay(tuple(names), ended_at, tuple(actions))
+
+
+def replay_steps(replay: GameReplay) -> Iterator[Tuple[Action, Game, Optional[int]]]:
+    """用牌局引擎逐步重现一局，产出 (操作, 操作后的牌局, 操作结果)"""
+    game = Game(range(len(replay.names)))
+    for action in replay.actions:
+        if action.tag == TAG_RULES:
+            game.rules = action.rules
+            result = None
+        elif action.tag == TAG_DEAL:
+            game.deal(action.cards, action.seat)
+            result = None
+        elif action.tag == TAG_BID:
+            result = game.bid(action.seat, action.score)
+        elif action.tag == TAG_NO_BID:
+            result = game.no_bid(action.seat)
+        elif action.tag == TAG_PLAY:
+            result = game.play(action.seat, action.cards)
+        else:
+            result = game.pass_turn(action.seat)
+        yield action, game, result
+
+
+def write_replays(path, records: Sequence[bytes]):
+    """把若干条记录追加到回放文件，文件不存在时写入魔数"""
+    path = Path(path)
+    out = bytearray()
+    if not path.exists() or path.stat().st_size == 0:
+        out += FILE_MAGIC
+    for record in records:
+        _put_varint(out, len(record))
+        out += record
+    with open(path, 'ab') as f:
+        f.write(out)
+
+
+def _read_varint(f: BinaryIO) -> Optional[int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def iter_replays(path) -> Iterator[GameReplay]:
+    """逐条读取回放文件，末尾不完整的记录会被忽略"""
+    with open(path, 'rb', buffering=1 << 16) as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"不是回放文件: {path}")
+        while True:
+            size = _read_varint(f)
+            if size is None:
+                return
+            data = f.read(size)
+            if len(data) < size:
+                return
+            yield decode_game(data)
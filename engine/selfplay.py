@@ -0,0 +1,175 @@
+"""多进程自对弈
+
+每个工作进程按批次独立对局，批次由 (种子, 批号) 决定全部随机数，同样的参数
+得到同样的结果。每局只用牌局引擎本身的规则检查出牌，策略给出的出牌被引擎拒绝
+时记为规则不一致（候选出牌表与牌型判断不符），便于修改规则后做大规模回归。
+指定记录目录时，每批对局以回放格式写入一个文件，供分析工具读取。
+"""
+import importlib
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+from .game import LANDLORD, REDEAL, SEAT_COUNT, WIN, Game, RuleError, new_deck
+from .moves import move_table
+from .patterns import BOMB, DEFAULT_RULES, RULE_SETS, ROCKET
+from .policies import POLICIES, Policy
+from .replay import encode_game, put_bid, put_deal, put_no_bid, put_pass, put_play, put_rules, write_replays
+
+# 单局的操作数上限，超过说明规则或策略进入了死循环
+MAX_ACTIONS = 1000
+# 连续无人叫分的重新发牌次数上限
+MAX_REDEALS = 100
+
+def load_policy(spec: str):
+    """按名称加载策略：内置策略名或 ``模块:类名``"""
+    if spec in POLICIES:
+        return POLICIES[spec]
+    module_name, _, attr = spec.partition(':')
+    if not attr:
+        raise ValueError(f"未知的策略: {spec}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def play_game(policies: Sequence[Policy], rng: random.Random, stats: Counter,
+              history: Optional[bytearray] = None, rules: str = DEFAULT_RULES) -> bool:
+    """用给定的策略（按座次）打一局，结果累加到 stats，正常结束时返回 True
+
+    给出 history 时把操作流以回放格式追加到其中。
+    """
+    table = move_table(rules)
+    seats = tuple(range(SEAT_COUNT))
+    game = Game(seats, rules)
+    actions = 0
+    if history is not None:
+        put_rules(history, rules)
+
+    # 叫分，无人叫分时重新发牌
+    for _ in range(MAX_REDEALS):
+        deck = new_deck(rng)
+        game.deal(deck, rng.choice(seats))
+        if history is not None:
+            put_deal(history, game.current_player, deck)
+        result = None
+        while result not in (LANDLORD, REDEAL):
+            player_id = game.current_player
+            score = policies[player_id].bid(game, player_id)
+            result = game.bid(player_id, score) if score else game.no_bid(player_id)
+            if history is not None and score:
+                put_bid(history, player_id, score)
+            elif history is not None:
+                put_no_bid(history, player_id)
+            actions += 1
+        if result == LANDLORD:
+            break
+        stats['redeals'] += 1
+    else:
+        stats['abandoned'] += 1
+        return False
+
+    # 出牌
+    while True:
+        if actions >= MAX_ACTIONS:
+            stats['stalled'] += 1
+            return False
+        actions += 1
+        player_id = game.current_player
+        hand = game.hands[player_id]
+        move = policies[player_id].play(game, player_id, table.legal_moves(hand.counts, game.required_pattern(player_id)))
+        try:
+            if move is None:
+                game.pass_turn(player_id)
+                if history is not None:
+                    put_pass(history, player_id)
+                continue
+            cards = hand.pick(move.ranks)
+            result = game.play(player_id, cards)
+        except RuleError as e:
+            stats[f'rule_error:{e.code}'] += 1
+            return False
+        if history is not None:
+            put_play(history, player_id, cards)
+        if move.pattern.type == BOMB:
+            stats['bombs'] += 1
+        elif move.pattern.type == ROCKET:
+            stats['rockets'] += 1
+        if result == WIN:
+            break
+
+    stats['games'] += 1
+    stats['actions'] += actions
+    stats['bid_total'] += game.bid_score
+    stats['landlord_wins' if game.winner == game.landlord else 'farmer_wins'] += 1
+    stats[f'landlord_seat:{game.landlord}'] += 1
+    for player_id, score in game.scores().items():
+        stats[f'score:{player_id}'] += score
+        if score > 0:
+            stats[f'wins:{player_id}'] += 1
+    return True
+
+
+def run_batch(policy_specs: Sequence[str], games: int, seed: int, batch: int,
+              record_dir: Optional[str] = None, rules: str = DEFAULT_RULES) -> Counter:
+    """在当前进程中打 games 局，返回统计；给出 record_dir 时把回放写入该目录"""
+    rng = random.Random((seed << 32) | batch)
+    policies = [load_policy(spec)(move_table(rules), rng) for spec in policy_specs]
+    stats = Counter()
+    records = []
+    for _ in range(games):
+        history = bytearray() if record_dir else None
+        if play_game(policies, rng, stats, history, rules) and record_dir:
+            records.append(encode_game(policy_specs, int(time.time()), history))
+    if record_dir:
+        write_replays(Path(record_dir) / f"selfplay-{seed}-{batch}.ddzr", records)
+    return stats
+
+
+def run(policy_specs: Sequence[str], games: int, workers: int = None, batch_size: int = 2000,
+        seed: int = 0, record_dir: Optional[str] = None, rules: str = DEFAULT_RULES) -> Tuple[Counter, float]:
+    """把 games 局按批次分给多个进程，返回 (汇总统计, 用时秒数)"""
+    if len(policy_specs) != SEAT_COUNT:
+        raise ValueError(f"需要 {SEAT_COUNT} 个策略，实际为 {len(policy_specs)}")
+    if rules not in RULE_SETS:
+        raise ValueError(f"未知的玩法: {rules}")
+    # 在主进程中提前加载，策略名有误时立即报错
+    for spec in policy_specs:
+        load_policy(spec)
+    if record_dir:
+        Path(record_dir).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    batches = [min(batch_size, games - i) for i in range(0, games, batch_size)]
+    stats = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_batch, tuple(policy_specs), size, seed, batch, record_dir, rules)
+            for batch, size in enumerate(batches)
+        ]
+        for future in futures:
+            stats.update(future.result())
+    return stats, time.perf_counter() - start
+
+
+def summarize(policy_specs: Sequence[str], stats: Counter, elapsed: float) -> Dict[str, float]:
+    """把统计整理为便于阅读和比较的指标"""
+    games = stats['games']
+    summary = {
+        'games': games,
+        'seconds': round(elapsed, 3),
+        'games_per_second': round(games / elapsed, 1) if elapsed else 0.0,
+        'landlord_win_rate': round(stats['landlord_wins'] / games, 4) if games else 0.0,
+        'avg_bid': round(stats['bid_total'] / games, 3) if games else 0.0,
+        'avg_actions': round(stats['actions'] / games, 2) if games else 0.0,
+        'redeals': stats['redeals'],
+        'bombs': stats['bombs'],
+        'rockets': stats['rockets'],
+        'stalled': stats['stalled'],
+        'abandoned': stats['abandoned'],
+        'rule_errors': sum(count for key, count in stats.items() if key.startswith('rule_error:')),
+    }
+    for seat, spec in enumerate(policy_specs):
+        summary[f'seat{seat}:{spec}:win_rate'] = round(stats[f'wins:{seat}'] / games, 4) if games else 0.0
+        summary[f'seat{seat}:{spec}:avg_score'] = round(stats[f'score:{seat}'] / games, 4) if games else 0.0
+    return summary
@@ -0,0 +1,98 @@
+"""单个群的牌局状态"""
+import time
+
+from .game import Game
+from .patterns import DEFAULT_RULES
+from .tracker import CardTracker
+
+# 游戏状态：1-等待加入，2-游戏中（未开始的群不保留牌局对象）
+WAITING = 1
+PLAYING = 2
+# 桌号与群号之间的分隔
+TABLE_SEPARATOR = '#'
+
+
+def table_key(group_id, table=1):
+    """一桌牌局的键：1 号桌就是群号（与只有一桌时的日志和快照兼容），其余为 群号#桌号"""
+    return group_id if table == 1 else f"{group_id}{TABLE_SEPARATOR}{table}"
+
+
+def split_table_key(key):
+    """由牌局的键得到 (群号, 桌号)"""
+    group_id, separator, table = str(key).rpartition(TABLE_SEPARATOR)
+    if separator and table.isdigit():
+        return group_id, int(table)
+    return key, 1
+
+
+class GameSession(Game):
+    """群里的一桌牌局：在牌局规则状态之上增加桌号、玩家昵称、消息来源等群聊信息"""
+
+    __slots__ = (
+        'group_id', 'table', 'status', 'players', 'hints', 'created_at', 'origin', 'origins', 'seed', 'deals', 'history',
+        'tracker',
+    )
+
+    def __init__(self, group_id, owner_id, owner_name, origin=None, rules=DEFAULT_RULES, table=1):
+        super().__init__(rules=rules)
+        self.group_id = group_id
+        # 群内的桌号，从 1 开始
+        self.table = table
+        # 群聊的消息来源（unified_msg_origin），用于主动发送消息
+        self.origin = origin
+        # 跨群匹配的牌局中各玩家所在群的消息来源 {player_id: origin}，普通牌局为空
+        self.origins = {}
+        self.status = WAITING
+        # 玩家信息 {player_id: player_name}，按加入顺序即座次
+        self.players = {owner_id: owner_name}
+        # 提示候选的生成器，出牌或不出后失效
+        self.hints = None
+        self.created_at = time.time()
+        # 发牌种子和已发牌次数，洗牌和选择叫分玩家都由二者决定
+        self.seed = 0
+        self.deals = 0
+        # 本局的回放操作流
+        self.history = bytearray()
+        # 记牌器，随发牌、亮地主牌和出牌更新
+        self.tracker = CardTracker()
+
+    def __getstate__(self):
+        return super().__getstate__() + (
+            self.group_id, self.table, self.status, dict(self.players), self.created_at, self.origin,
+            dict(self.origins), self.seed, self.deals, bytes(self.history), self.tracker.__getstate__(),
+        )
+
+    def __setstate__(self, state):
+        size = len(Game.__slots__)
+        super().__setstate__(state[:size])
+        (self.group_id, self.table, self.status, self.players, self.created_at, self.origin,
+         self.origins, self.seed, self.deals, history, tracker) = state[size:]
+        self.history = bytearray(history)
+        self.tracker = CardTracker.from_state(tracker)
+        # 提示生成器不写入快照，恢复后重新生成
+        self.hints = None
+
+    def deal(self, deck, first_bidder):
+        """发牌并重新开始记牌"""
+        super().deal(deck, first_bidder)
+        self.tracker.reset({player_id: len(hand) for player_id, hand in self.hands.items()})
+
+    def _end_bidding(self):
+        """确定地主并记下亮出的地主牌"""
+        super()._end_bidding()
+        self.tracker.reveal(self.landlord, self.landlord_cards)
+
+    def play(self, player_id, cards):
+        """出牌成功后记牌"""
+        result = super().play(player_id, cards)
+        self.tracker.record(player_id, cards)
+        return result
+
+    @property
+    def table_id(self):
+        """牌局的键（sessions、命令锁、定时器和日志都按此区分各桌）"""
+        return table_key(self.group_id, self.table)
+
+    def seat_players(self):
+        """按加入顺序生成座次环"""
+        self.seat(self.players)
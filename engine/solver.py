@@ -0,0 +1,163 @@
+"""最少手数拆牌
+
+把一手牌拆成最少的合法出牌（最少手数），用于评估手牌强弱、给提示排序和机器人
+出牌。按点数计数做动态规划：每次取剩余牌中最小的点数，它一定是某一手牌中最小的
+点数，只需枚举以它为最小点数的出牌，再对剩余的牌递归求解。
+
+点数计数编码为每个点数槽位 4 位的整数（最高位为借位保护位），判断一手牌能否从
+剩余牌中拿出只需一次减法。候选出牌按主牌（三张、飞机、四张）分组，主牌不够时
+整组跳过，带翅膀的牌型虽多，实际检查的候选很少。
+
+结果按计数签名缓存在有界的 LRU 中，不同花色组合、不同玩家的相似手牌共用子问题，
+重复查询只需一次查表。在事件循环中求解时可以限制新求解的状态数，超出时放弃本次
+查询；已经求出的子问题留在缓存中，之后的查询从这里继续。
+"""
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .cards import RANK_SLOTS
+from .moves import Move, MoveTable
+
+# 默认缓存的状态数
+CACHE_SIZE = 50000
+# 惰性排序时每批排序的出牌数
+ORDER_BATCH = 8
+# 没有在限制内求出的手数，排在已求出的之后
+UNSOLVED = RANK_SLOTS * 4 + 2
+
+# 每个点数槽位的借位保护位
+_GUARD = sum(8 << (4 * rank) for rank in range(RANK_SLOTS))
+
+
+def count_key(counts: Sequence[int]) -> int:
+    """由 15 槽点数计数计算缓存键（每槽 4 位）"""
+    key = 0
+    for rank in range(RANK_SLOTS):
+        key |= counts[rank] << (4 * rank)
+    return key
+
+
+def move_key(move: Move, min_count: int = 1) -> int:
+    """出牌的计数键，只计张数不少于 min_count 的点数"""
+    key = 0
+    for rank, count in move.ranks:
+        if count >= min_count:
+            key |= count << (4 * rank)
+    return key
+
+
+class _OverBudget(Exception):
+    """新求解的状态数超出限制"""
+
+
+class HandSolver:
+    """某一玩法下的最少手数求解器"""
+
+    __slots__ = ('by_rank', 'cache', 'cache_size', 'hits', 'misses', '_limit')
+
+    def __init__(self, table: MoveTable, cache_size: int = CACHE_SIZE):
+        # 按最小点数、主牌分组的候选 [(主牌键, ((出牌键, Move), ...))]
+        groups: List[Dict[int, List[Tuple[int, Move]]]] = [{} for _ in range(RANK_SLOTS)]
+        for moves in table.groups.values():
+            for move in moves:
+                key = move_key(move)
+                core = move_key(move, 3) or key
+                lowest = min(rank for rank, _ in move.ranks)
+                groups[lowest].setdefault(core, []).append((key, move))
+        self.by_rank = tuple(
+            tuple((core, tuple(entries)) for core, entries in group.items())
+            for group in groups
+        )
+        # {缓存键: (最少手数, 拆牌中包含最小点数的那一手)}
+        self.cache: 'OrderedDict[int, Tuple[int, Optional[Move]]]' = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        # 本次查询允许达到的 misses，超出时放弃
+        self._limit = float('inf')
+
+    def _solve(self, state: int) -> int:
+        if state == 0:
+            return 0
+        cache = self.cache
+        entry = cache.get(state)
+        if entry is not None:
+            self.hits += 1
+            cache.move_to_end(state)
+            return entry[0]
+        self.misses += 1
+        if self.misses > self._limit:
+            raise _OverBudget
+        lowest = ((state & -state).bit_length() - 1) >> 2
+        guarded = state | _GUARD
+        best = RANK_SLOTS * 4 + 1
+        best_move = None
+        for core, entries in self.by_rank[lowest]:
+            if (guarded - core) & _GUARD != _GUARD:
+                continue
+            for key, move in entries:
+                if (guarded - key) & _GUARD == _GUARD:
+                    hands = self._solve(state - key) + 1
+                    if hands < best:
+                        best = hands
+                        best_move = move
+        cache[state] = (best, best_move)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return best
+
+    def _try_solve(self, state: int) -> Optional[int]:
+        """在当前的限制内求解，超出时返回 None"""
+        try:
+            return self._solve(state)
+        except _OverBudget:
+            return None
+
+    def min_hands(self, counts: Sequence[int], budget: Optional[int] = None) -> Optional[int]:
+        """最少手数；给出 budget 时最多新求解这么多个状态，超出时返回 None"""
+        if budget is None:
+            return self._solve(count_key(counts))
+        self._limit = self.misses + budget
+        try:
+            return self._try_solve(count_key(counts))
+        finally:
+            self._limit = float('inf')
+
+    def plan(self, counts: Sequence[int]) -> List[Move]:
+        """一种手数最少的拆牌"""
+        state = count_key(counts)
+        moves = []
+        while state:
+            self._solve(state)
+            move = self.cache[state][1]
+            moves.append(move)
+            state -= move_key(move)
+        return moves
+
+    def remaining(self, counts: Sequence[int], move: Move) -> int:
+        """打出 move 之后剩余牌的最少手数"""
+        return self._solve(count_key(counts) - move_key(move))
+
+    def order_moves(self, counts: Sequence[int], moves: Iterable[Move]) -> List[Move]:
+        """按打出后剩余手数从少到多排列，手数相同时保持原有顺序"""
+        state = count_key(counts)
+        return sorted(moves, key=lambda move: self._solve(state - move_key(move)))
+
+    def iter_ordered(self, counts: Sequence[int], moves: Iterable[Move], batch: int = ORDER_BATCH,
+                     budget: Optional[int] = None) -> Iterator[Move]:
+        """惰性的 order_moves：每次从 moves 中取 batch 个排序后产出，只求解用到的那一批；
+        给出 budget 时每批最多新求解这么多个状态，没有求出的出牌保持原有顺序排在这一批的最后"""
+        state = count_key(counts)
+        moves = iter(moves)
+        while True:
+            chunk = list(islice(moves, batch))
+            if not chunk:
+                return
+            self._limit = self.misses + budget if budget is not None else float('inf')
+            try:
+                keys = [self._try_solve(state - move_key(move)) for move in chunk]
+            finally:
+                self._limit = float('inf')
+            for i in sorted(range(len(chunk)), key=lambda i: UNSOLVED if keys[i] is None else keys[i]):
+                yield chunk[i]
@@ -0,0 +1,102 @@
+"""群内淘汰赛的赛程
+
+报名的选手每轮随机分组，每组最多三人（人数不够时由机器人补位），各组在群里同时开桌。
+每桌先出完牌的选手晋级；机器人先出完或牌局中途结束时，由本局得分最高的选手晋级
+（得分相同时比较比赛累计积分，再按座次）。剩下一名选手时产生冠军。
+
+这里只记录赛程、积分和名次，开桌、出牌和结算都按普通牌局进行。
+"""
+import random
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .game import SEAT_COUNT
+
+
+class Tournament:
+    """一个群的一场淘汰赛"""
+
+    __slots__ = ('group_id', 'owner', 'origin', 'names', 'points', 'round', 'waiting', 'running', 'advanced',
+                 'eliminated')
+
+    def __init__(self, group_id, owner_id, owner_name: str, origin: Optional[str] = None):
+        self.group_id = group_id
+        self.owner = owner_id
+        # 群聊的消息来源，用于公布赛程
+        self.origin = origin
+        # 报名的选手 {player_id: 昵称}，按报名顺序
+        self.names: Dict[Hashable, str] = {owner_id: owner_name}
+        # 各选手在比赛中的累计得分
+        self.points: Dict[Hashable, int] = {owner_id: 0}
+        # 当前轮次，0 表示还没开赛
+        self.round = 0
+        # 本轮还没开桌的分组、进行中的桌 {table_id: 选手}、已晋级的选手
+        self.waiting: List[List[Hashable]] = []
+        self.running: Dict[str, List[Hashable]] = {}
+        self.advanced: List[Hashable] = []
+        # 被淘汰的选手 {player_id: 淘汰时的轮次}
+        self.eliminated: Dict[Hashable, int] = {}
+
+    @property
+    def started(self) -> bool:
+        return self.round > 0
+
+    @property
+    def round_over(self) -> bool:
+        """本轮的各组都已结束（还没开赛时也为 True）"""
+        return not self.waiting and not self.running
+
+    @property
+    def champion(self) -> Optional[Hashable]:
+        """决出的冠军，比赛还没结束时为 None"""
+        if self.started and self.round_over and len(self.advanced) == 1:
+            return self.advanced[0]
+        return None
+
+    def register(self, player_id, name: str) -> bool:
+        """报名，已经报名或已经开赛时返回 False"""
+        if self.started or player_id in self.names:
+            return False
+        self.names[player_id] = name
+        self.points[player_id] = 0
+        return True
+
+    def next_round(self, rng=random) -> List[List[Hashable]]:
+        """开始下一轮：把剩下的选手随机分成人数尽量平均的若干组，返回各组"""
+        players = list(self.advanced if self.started else self.names)
+        rng.shuffle(players)
+        count = -(-len(players) // SEAT_COUNT)
+        self.round += 1
+        self.advanced = []
+        self.waiting = [players[i::count] for i in range(count)]
+        return self.waiting
+
+    def assign(self, table_id: str, players: List[Hashable]):
+        """一组选手已经开桌"""
+        self.waiting.remove(players)
+        self.running[table_id] = players
+
+    def report(self, table_id: str, winner, scores: Dict[Hashable, int]) -> Optional[Hashable]:
+        """记录一桌的结果（牌局中途结束时 winner 为 None、scores 为空），返回晋级的选手"""
+        players = self.running.pop(table_id, None)
+        if not players:
+            return None
+        for player_id in players:
+            self.points[player_id] += scores.get(player_id, 0)
+        if winner in players:
+            advancer = winner
+        else:
+            advancer = max(players, key=lambda player_id: (scores.get(player_id, 0), self.points[player_id]))
+        self.advanced.append(advancer)
+        for player_id in players:
+            if player_id != advancer:
+                self.eliminated[player_id] = self.round
+        return advancer
+
+    def standings(self) -> List[Tuple[Hashable, str, int, int]]:
+        """名次：(选手, 昵称, 累计得分, 打到第几轮)，先比较打到的轮次，再比较累计得分"""
+        rows = [(player_id, name, self.points[player_id], self.eliminated.get(player_id, self.round))
+                for player_id, name in self.names.items()]
+        # 本轮晋级的选手排在本轮被淘汰的选手之前
+        alive = set(self.advanced)
+        rows.sort(key=lambda row: (row[3], row[0] in alive, row[2]), reverse=True)
+        return rows
@@ -0,0 +1,100 @@
+"""记牌器
+
+随牌局增量维护公开信息：还没打出的牌、每个玩家打过的牌、每个玩家的剩余张数，
+以及已经亮出的地主牌。每次出牌只按打出的张数更新，查询时再与某个玩家自己的手牌
+相减，得到其余两家合计持有的牌。
+"""
+from typing import Dict, Hashable, List, Sequence
+
+from .cards import BIG_JOKER, DECK_SIZE, RANK_SLOTS, SMALL_JOKER, Hand
+
+# 炸弹需要的同点数张数
+BOMB_SIZE = 4
+
+
+class CardTracker:
+    """一局的公开出牌信息"""
+
+    __slots__ = ('outstanding', 'played', 'sizes', 'landlord', 'landlord_cards')
+
+    def __init__(self):
+        # 还没打出的牌（包括所有人的手牌）
+        self.outstanding = Hand()
+        # 每个玩家打过的牌 {player_id: Hand}
+        self.played: Dict[Hashable, Hand] = {}
+        # 每个玩家的剩余张数
+        self.sizes: Dict[Hashable, int] = {}
+        self.landlord = None
+        self.landlord_cards: tuple = ()
+
+    def __getstate__(self):
+        return (
+            self.outstanding.__getstate__(), {player_id: hand.__getstate__() for player_id, hand in self.played.items()},
+            dict(self.sizes), self.landlord, self.landlord_cards,
+        )
+
+    def __setstate__(self, state):
+        outstanding, played, self.sizes, self.landlord, self.landlord_cards = state
+        self.outstanding = Hand.from_state(outstanding)
+        self.played = {player_id: Hand.from_state(hand) for player_id, hand in played.items()}
+
+    @classmethod
+    def from_state(cls, state) -> 'CardTracker':
+        """由 __getstate__ 的结果重建记牌器"""
+        tracker = cls.__new__(cls)
+        tracker.__setstate__(state)
+        return tracker
+
+    def copy(self) -> 'CardTracker':
+        """复制记牌器"""
+        tracker = CardTracker.__new__(CardTracker)
+        tracker.outstanding = self.outstanding.copy()
+        tracker.played = {player_id: hand.copy() for player_id, hand in self.played.items()}
+        tracker.sizes = dict(self.sizes)
+        tracker.landlord = self.landlord
+        tracker.landlord_cards = self.landlord_cards
+        return tracker
+
+    def reset(self, sizes: Dict[Hashable, int]):
+        """发牌后重新开始记牌"""
+        self.outstanding = Hand(range(DECK_SIZE))
+        self.played = {player_id: Hand() for player_id in sizes}
+        self.sizes = dict(sizes)
+        self.landlord = None
+        self.landlord_cards = ()
+
+    def reveal(self, landlord, cards: Sequence[int]):
+        """地主确定，地主牌亮出并加入地主手牌"""
+        self.landlord = landlord
+        self.landlord_cards = tuple(cards)
+        self.sizes[landlord] += len(cards)
+
+    def record(self, player_id, cards: Sequence[int]):
+        """记录一手出牌"""
+        self.outstanding.remove_all(cards)
+        self.played[player_id].update(cards)
+        self.sizes[player_id] -= len(cards)
+
+    def unseen(self, hand: Hand) -> List[int]:
+        """持有 hand 的玩家看不到的牌（其余两家的手牌合计）"""
+        mask = self.outstanding.mask & ~hand.mask
+        return [card for card in range(DECK_SIZE) if (mask >> card) & 1]
+
+    def unseen_counts(self, hand: Hand) -> bytearray:
+        """其余两家合计每个点数的张数"""
+        return bytearray(self.outstanding.counts[rank] - hand.counts[rank] for rank in range(RANK_SLOTS))
+
+    def known_cards(self, player_id) -> List[int]:
+        """已知在 player_id 手中的牌：地主还没打出的地主牌"""
+        if player_id != self.landlord:
+            return []
+        return [card for card in self.landlord_cards if card in self.outstanding]
+
+    def bomb_ranks(self, hand: Hand) -> List[int]:
+        """其余两家可能有炸弹的点数（该点数的牌都不在 hand 中且都没有打出）"""
+        return [rank for rank in range(RANK_SLOTS - 2) if self.outstanding.counts[rank] - hand.counts[rank] == BOMB_SIZE]
+
+    def rocket_possible(self, hand: Hand) -> bool:
+        """其余两家是否可能有火箭"""
+        mask = self.outstanding.mask & ~hand.mask
+        return (mask >> SMALL_JOKER) & 1 == 1 and (mask >> BIG_JOKER) & 1 == 1
@@ -1,62 +1,197 @@
-from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
-from astrbot.api.star import Context, Star, register
-from astrbot.api import logger
+from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult, MessageChain
+from astrbot.api.star import Context, Star, StarTools, register
+from astrbot.api import logger, AstrBotConfig
+import astrbot.api.message_components as Comp
+import asyncio
+import gc
+import os
 import random
 import time
 import re
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Union
 
+from .engine.bidding import estimate, recommend_bid
+from .engine.bots import BOT_PREFIX, decide, is_bot
+from .engine.cards import CARD_NAMES, RANKS, RANK_SLOTS, format_cards, parse_cards
+from .engine.endgame import ENDGAME_CARDS, in_endgame, solve_endgame
+from .engine.game import (
+    BAD_PATTERN, BAD_SCORE, CANNOT_BEAT, LANDLORD, LOW_SCORE, MUST_PLAY, NOT_BIDDING, NOT_IN_HAND,
+    NOT_PLAYING, NOT_TURN, REDEAL, SEAT_COUNT, WIN, RuleError, new_deck,
+)
+from .engine.moves import move_table
+from .engine.patterns import DEFAULT_RULES, RULE_SETS, find_rules
+from .engine.replay import (
+    TAG_BID, TAG_DEAL, TAG_NO_BID, TAG_PLAY, TAG_RULES, decode_game, encode_game, put_bid, put_deal,
+    put_no_bid, put_pass, put_play, put_rules, replay_steps, write_replays,
+)
+from .engine.session import PLAYING, WAITING, GameSession, split_table_key, table_key
+from .engine.solver import HandSolver
+from .engine.tournament import Tournament
+from .services.journal import (
+    OP_BEGIN, OP_BID, OP_END, OP_JOIN, OP_NO_BID, OP_PASS, OP_PLAY, OP_START, SNAPSHOT_RECORDS, Journal,
+)
+from .services.delivery import PrivateDelivery, private_origin
+from .services.ledger import Ledger
+from .services.matchmaking import MATCH_GROUP, Matchmaker
+from .services.outbox import Outbox
+from .services.tables import TableIndex
+from .services.render import CardRenderer, can_render, hand_image_key, table_image_key
+from .services.locks import GroupLocks
+from .services.metrics import COMMAND, HELPER, Metrics, instrument
+from .services.timers import TimerWheel
+
+# 定时器类型：阶段空闲超时、整局超时、单回合超时
+IDLE_TIMER = 'idle'
+GAME_TIMER = 'game'
+TURN_TIMER = 'turn'
+
+# 积分账本和回放记录的写入间隔（秒）
+WRITER_INTERVAL = 1.0
+# 每个群保留的最近对局回放数
+RECENT_REPLAYS = 5
+# 回放时每条消息包含的步数
+REPLAY_STEPS_PER_MESSAGE = 20
+# 机器人搜索超出时间预算多久后放弃，改用不搜索的出牌（秒）
+BOT_GRACE = 1.0
+# 必胜提示的最长计算时间（秒）
+ENDGAME_TIMEOUT = 10.0
+# 绘制图片的线程数
+RENDER_WORKERS = 2
+# 手牌消息中计算最少手数时最多新求解的状态数（通常不到 1 毫秒），超出时先不显示
+HAND_SOLVE_BUDGET = 100
+# 提示排序时每批最多新求解的状态数，求解的子问题留在缓存中，重复提示时逐步排得更准
+HINT_SOLVE_BUDGET = 10
+# 轮到谁操作的提示行，排队发送时被之后的提示取代
+PROMPT_LINE = re.compile(r"^请 .+ (出牌|开始叫分|叫分)")
+
+# 牌局引擎错误码对应的提示
+RULE_MESSAGES = {
+    NOT_BIDDING: "当前不是抢地主阶段",
+    NOT_PLAYING: "当前不是出牌阶段",
+    BAD_SCORE: "叫分必须在1-3分之间",
+    NOT_IN_HAND: "您的手牌中没有这些牌",
+    BAD_PATTERN: "出牌不符合规则，请重新出牌",
+    CANNOT_BEAT: "您的牌无法大过上一手牌，请重新出牌或选择 '不出'",
+    MUST_PLAY: "您必须出牌",
+}
+
 @register("doudizhu", "YourName", "一个简单的斗地主游戏插件，支持QQ群聊中进行游戏", "1.0.0")
 class DouDiZhuPlugin(Star):
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, config: AstrBotConfig = None):
         super().__init__(context)
-        # 游戏状态：0-未开始，1-等待加入，2-游戏中
-        self.game_status = {}
-        # 玩家信息 {group_id: {player_id: player_name}}
-        self.players = {}
-        # 当前牌局 {group_id: {cards, current_player, landlord, last_play}}
-        self.game_data = {}
-        # 玩家手牌 {group_id: {player_id: [cards]}}
-        self.player_cards = {}
-        # 游戏计时
-        self.game_time = {}
-        # 牌面值映射
-        self.card_values = {
-            '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, '10': 10,
-            'J': 11, 'Q': 12, 'K': 13, 'A': 14, '2': 15, 'joker': 16, 'JOKER': 17
-        }
-        # 牌型
-        self.card_types = {
-            'single': 1,      # 单牌
-            'pair': 2,        # 对子
-            'trio': 3,        # 三张
-            'trio_single': 4, # 三带一
-            'trio_pair': 5,   # 三带二
-            'straight': 6,    # 顺子
-            'pairs': 7,       # 连对
-            'plane': 8,       # 飞机
-            'bomb': 9,        # 炸弹
-            'rocket': 10      # 火箭
+        self.config = config or {}
+        # 各桌的牌局 {table_id: GameSession}，1 号桌的键就是群号，游戏结束后释放
+        self.sessions: Dict[str, GameSession] = {}
+        # 每个群开着的桌号和每个玩家所在的桌，按玩家找桌只需查一次表
+        self.tables = TableIndex()
+        # 每个群最多同时进行的桌数
+        self.max_tables = self.config.get('max_tables', 10)
+        # 各群的命令锁，同一个群的命令串行执行
+        self.locks = GroupLocks()
+        # 发起游戏时未指定玩法则使用该玩法
+        self.default_rules = find_rules(self.config.get('default_rules', DEFAULT_RULES)) or DEFAULT_RULES
+        # 各玩法按牌型分组的候选出牌表，用于提示和判断是否有牌可出，加载时一次性生成
+        self.move_tables = {rules: move_table(rules) for rules in RULE_SETS}
+        # 各玩法的最少手数求解器，用于提示排序和手牌强度
+        self.solvers = {rules: HandSolver(table) for rules, table in self.move_tables.items()}
+        # 各阶段无人操作的超时时间（秒）
+        self.phase_timeouts = {
+            'lobby': self.config.get('lobby_timeout', 300),
+            'bid': self.config.get('bid_timeout', 300),
+            'play': self.config.get('play_timeout', 600),
         }
+        self.game_timeout = self.config.get('game_timeout', 3600)
+        # 单回合超时时间（秒），超时后代为操作，0 表示不限制
+        self.turn_timeout = self.config.get('turn_timeout', 60)
+        # 超时定时器，键为 (table_id, 定时器类型)
+        self.timers = TimerWheel(time.monotonic())
+        self._reaper_task = None
+        # 牌局日志，重启后据此恢复进行中的游戏
+        self.journal_enabled = self.config.get('journal_enabled', True)
+        self.snapshot_interval = self.config.get('snapshot_interval', 300)
+        self.data_dir = None
+        self.journal = None
+        self._journal_task = None
+        self._replaying = False
+        # 命令耗时统计，按间隔导出为 Prometheus 文本文件，0 表示不导出
+        self.metrics = Metrics()
+        self.metrics_interval = self.config.get('metrics_interval', 60)
+        self._metrics_task = None
+        # 积分账本，后台定期批量写入
+        self.ledger_enabled = self.config.get('ledger_enabled', True)
+        self.ledger = None
+        # 对局回放：每个群最近几局保存在内存中，全部对局追加到回放文件
+        self.recent_replays: Dict[str, deque] = {}
+        self.replay_archive = self.config.get('replay_archive', True)
+        self._replay_buffer: List[bytes] = []
+        self._writer_task = None
+        # 机器人：每步的思考时间（秒）和搜索进程数，0 个进程时只用启发式出牌
+        self.bot_think_time = self.config.get('bot_think_time', 1.0)
+        self.bot_workers = self.config.get('bot_workers', 2)
+        self._search_pool = None
+        # 残局时按明牌给出必胜的出牌
+        self.endgame_hint = self.config.get('endgame_hint', False)
+        # 群消息限速：每个群和全局的令牌桶（每秒条数、最多积累条数），速率为 0 表示不限制
+        self.outbox = Outbox(
+            self._send_origin,
+            self.config.get('group_send_rate', 1.0), self.config.get('group_send_burst', 5),
+            self.config.get('global_send_rate', 10.0), self.config.get('global_send_burst', 20),
+            is_status=lambda line: PROMPT_LINE.match(line) is not None,
+            # 消息按桌排队、合并，发送速率按群计算
+            bucket_of=self._send_bucket,
+            on_error=lambda origin, e: logger.error(f"斗地主群消息发送失败（{origin}）: {e}"),
+        )
+        # 手牌私聊发送，关闭或无法确定私聊来源时在群里发送
+        self.private_hands = self.config.get('private_hands', True)
+        self.delivery = PrivateDelivery(self._send_private, self.config.get('private_send_concurrency', 8))
+        # 手牌和牌桌图片（启动时生成牌面图集），关闭或没有安装 Pillow 时只发送文字
+        self.renderer = CardRenderer() if self.config.get('render_images', True) and can_render() else None
+        self._render_pool = None
+        # 各桌正在替机器人操作的任务 {table_id: Task}
+        self._bot_tasks: Dict[str, asyncio.Task] = {}
+        # 跨群匹配队列（按匹配积分分段）和各匹配桌要通知的群 {table_id: 消息来源}，桌号复用时覆盖
+        self.matchmaker = Matchmaker(self.config.get('match_rating_band', 50), timeout=self.config.get('match_timeout', 600))
+        self.match_rooms: Dict[str, Tuple[str, ...]] = {}
+        # 各群进行中的比赛 {group_id: Tournament}，以及推进赛程的后台任务
+        self.tournaments: Dict[str, Tournament] = {}
+        self._tournament_tasks = set()
         
     # 帮助命令
     @filter.command("斗地主帮助")
+    @instrument(COMMAND, "斗地主帮助")
     async def doudizhu_help(self, event: AstrMessageEvent):
         """显示斗地主游戏帮助"""
         help_text = """斗地主游戏帮助：
-1. 发送 '斗地主' 创建游戏
-2. 发送 '加入' 加入游戏
-3. 发送 '开始' 开始游戏
+1. 发送 '斗地主' 创建游戏（'斗地主 玩法' 指定玩法，'斗地主 桌号' 指定桌号，一个群可以同时开多桌）
+2. 发送 '加入' 坐到第一张等待加入的桌（'加入 桌号' 加入指定的桌，发送 '加入机器人' 由机器人补位）
+3. 发送 '开始' 开始游戏（以下命令都作用于自己所在的桌）
 4. 叫分阶段：
    - 发送 '叫分 1/2/3' 叫分
    - 发送 '不叫' 不叫地主
+   - 发送 '叫分建议' 按模拟的地主胜率给出叫分建议
 5. 出牌阶段：
    - 发送 '出牌 牌1 牌2 ...' 出牌
    - 发送 '不出' 不出牌
-   - 发送 '手牌' 查看自己的手牌
+   - 发送 '提示' 查看可以出的牌（出完剩余手数少的在前，重复发送切换下一种）
+   - 发送 '必胜提示' 在残局（每人不超过8张）时按所有人的手牌计算必胜的出牌（需要在配置中开启）
+   - 发送 '手牌' 查看自己的手牌（开启私聊发送手牌时重新私聊发送）
+   - 发送 '记牌' 查看其余两家还有哪些牌、各家出过的牌和剩余张数（开启私聊发送手牌时私聊发送）
 6. 其他命令：
-   - 发送 '状态' 查看游戏状态
-   - 发送 '结束游戏' 强制结束游戏
+   - 发送 '状态' 查看游戏状态（不在任何一桌时列出本群所有桌，'状态 桌号' 查看指定的桌）
+   - 发送 '结束游戏' 强制结束游戏（'结束游戏 桌号' 结束指定的桌）
+   - 发送 '排行榜' 查看本群积分排行
+   - 发送 '我的战绩' 查看自己的积分和胜负
+   - 发送 '回放' 查看本群上一局的过程（'回放 2' 查看倒数第二局）
+7. 匹配和比赛：
+   - 发送 '匹配' 进入跨群匹配队列，与积分相近的玩家凑满三人后自动开始（'取消匹配' 退出队列）
+   - 发送 '比赛' 发起淘汰赛（比赛进行中时查看名次），其他玩家发送 '报名' 参加
+   - 发起者发送 '开始比赛' 开赛：每轮分组同时开桌，每桌先出完牌的玩家晋级，直到决出冠军
+   - 发起者发送 '结束比赛' 取消比赛
 
 牌型说明：
 - 单牌：任意单张牌
@@ -67,14 +202,22 @@ class DouDiZhuPlugin(Star):
 - 顺子：五张或更多的连续单牌（不能包含2和王）
 - 连对：三对或更多的连续对子（不能包含2和王）
 - 飞机：两个或更多的连续三张（不能包含2和王）
+- 飞机带翅膀：飞机 + 同样数量的单牌或对子
+- 四带二：四张相同点数的牌 + 两张单牌或两对（不算炸弹）
 - 炸弹：四张相同点数的牌
 - 火箭：大小王
 
+玩法：
+- 经典（默认）：以上全部牌型
+- 简单：不能飞机带翅膀、四带二
+- 顺子带2：经典玩法，顺子、连对、飞机可以包含2
+
 牌面表示：
 - 花色：♠(黑桃) ♥(红桃) ♦(方块) ♣(梅花)
 - 点数：3, 4, 5, 6, 7, 8, 9, 10, J, Q, K, A, 2
 - 小王：joker
-- 大王：JOKER
+- 大王：JOKER（也可以写作 小王、大王）
+- 出牌时可以只写点数，如 '出牌 3 3 3 4' 或 '出牌 JJ QQ KK'，自动从手牌中选取花色
 
 游戏规则：
 - 三人游戏，一人为地主，两人为农民
@@ -89,10 +232,29 @@ class DouDiZhuPlugin(Star):
 
     async def initialize(self):
         """插件初始化方法，当实例化该插件类之后会自动调用该方法。"""
+        if self.data_dir is None and (self.journal_enabled or self.ledger_enabled or self.replay_archive
+                                      or self.metrics_interval > 0):
+            self.data_dir = StarTools.get_data_dir("doudizhu")
+        if self.ledger_enabled:
+            self.ledger = Ledger(Path(self.data_dir) / 'ledger.db', self.config.get('leaderboard_size', 10))
+            await asyncio.to_thread(self.ledger.load)
+        if self.ledger is not None or self.replay_archive:
+            self._writer_task = asyncio.create_task(self._writer_loop())
+        if self.journal_enabled:
+            self.journal = Journal(
+                self.data_dir, self.config.get('journal_flush_interval', 0.2),
+                on_warning=lambda message: logger.warning(f"斗地主{message}"),
+            )
+            self._restore_sessions()
+            self._journal_task = asyncio.create_task(self._journal_loop())
+        self._reaper_task = asyncio.create_task(self._reaper_loop())
+        if self.metrics_interval > 0:
+            self._metrics_task = asyncio.create_task(self._metrics_loop())
         logger.info("斗地主插件已加载")
 
     # 开始游戏命令
     @filter.command("斗地主")
+    @instrument(COMMAND, "斗地主")
     async def start_game(self, event: AstrMessageEvent):
         """开始一局斗地主游戏"""
         group_id = event.get_group_id()
@@ -104,20 +266,28 @@ class DouDiZhuPlugin(Star):
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否已经开始
-        if group_id in self.game_status and self.game_status[group_id] != 0:
-            yield event.plain_result(f"游戏已经在进行中，当前状态: {self._get_status_text(group_id)}")
-            return
+        # 解析桌号和玩法，没有指定桌号时使用最小的空闲桌号
+        table = None
+        rules = self.default_rules
+        for arg in event.message_str.split()[1:]:
+            if arg.isdigit() and int(arg) > 0:
+                table = int(arg)
+                continue
+            rules = find_rules(arg)
+            if rules is None:
+                labels = '、'.join(rule_set.label for rule_set in RULE_SETS.values())
+                yield event.plain_result(f"未知的玩法，可选玩法：{labels}")
+                return
+        table_id = table_key(group_id, table or self.tables.free_table(group_id))
             
-        # 初始化游戏
-        self.game_status[group_id] = 1  # 等待加入状态
-        self.players[group_id] = {user_id: user_name}
-        self.game_time[group_id] = time.time()
-        
-        yield event.plain_result(f"{user_name} 发起了斗地主游戏！\n发送 '加入' 参与游戏，需要3名玩家。\n发起者已自动加入。\n发送 '开始' 开始游戏。")
+        async with self.locks.hold(table_id):
+            messages = self._act_start(table_id, user_id, user_name, event.unified_msg_origin, rules)
+        for text in self._replies(event, table_id, messages):
+            yield event.plain_result(text)
 
     # 加入游戏命令
     @filter.command("加入")
+    @instrument(COMMAND, "加入")
     async def join_game(self, event: AstrMessageEvent):
         """加入斗地主游戏"""
         group_id = event.get_group_id()
@@ -129,86 +299,61 @@ class DouDiZhuPlugin(Star):
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否处于等待加入状态
-        if group_id not in self.game_status or self.game_status[group_id] != 1:
-            yield event.plain_result("当前没有等待加入的游戏，请先发送 '斗地主' 开始一局游戏")
-            return
+        # 解析桌号，没有指定时坐到第一张等待加入的桌
+        table_match = re.search(r'加入\s*(\d+)', event.message_str)
+        table_id = table_key(group_id, int(table_match.group(1))) if table_match else self._open_table(group_id)
             
-        # 检查玩家是否已经加入
-        if user_id in self.players[group_id]:
-            yield event.plain_result(f"{user_name} 已经在游戏中了")
-            return
-            
-        # 检查玩家数量是否已满
-        if len(self.players[group_id]) >= 3:
-            yield event.plain_result("游戏人数已满（3人），无法加入")
+        async with self.locks.hold(table_id):
+            messages = self._act_join(table_id, user_id, user_name)
+        for text in self._replies(event, table_id, messages):
+            yield event.plain_result(text)
+
+    # 加入机器人命令
+    @filter.command("加入机器人")
+    @instrument(COMMAND, "加入机器人")
+    async def add_bot(self, event: AstrMessageEvent):
+        """加入一个机器人玩家"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 加入游戏
-        self.players[group_id][user_id] = user_name
-        
-        yield event.plain_result(f"{user_name} 加入了游戏！当前玩家数: {len(self.players[group_id])}/3")
+        # 加入发送者所在的桌，不在任何一桌时加入第一张等待加入的桌
+        table_id = self._seated_table(group_id, user_id) or self._open_table(group_id)
+        async with self.locks.hold(table_id):
+            messages = self._act_add_bot(table_id)
+        for text in self._replies(event, table_id, messages):
+            yield event.plain_result(text)
 
     # 开始游戏命令
     @filter.command("开始")
+    @instrument(COMMAND, "开始")
     async def begin_game(self, event: AstrMessageEvent):
         """开始斗地主游戏"""
         group_id = event.get_group_id()
         user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
         
         # 检查是否在群聊中
         if not group_id:
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否处于等待加入状态
-        if group_id not in self.game_status or self.game_status[group_id] != 1:
-            yield event.plain_result("当前没有等待加入的游戏，请先发送 '斗地主' 开始一局游戏")
-            return
-            
-        # 检查玩家数量是否足够
-        if len(self.players[group_id]) < 3:
-            yield event.plain_result(f"玩家数量不足，需要3名玩家，当前只有{len(self.players[group_id])}名玩家")
-            return
-            
-        # 开始游戏
-        self.game_status[group_id] = 2  # 游戏中状态
-        
-        # 初始化游戏数据
-        self._init_game(group_id)
-        
-        # 发牌
-        self._deal_cards(group_id)
-        
-        # 通知玩家手牌
-        yield event.plain_result("游戏开始！正在私聊发送手牌...")
-        
-        # 发送手牌信息给每个玩家
-        for player_id, player_name in self.players[group_id].items():
-            cards_str = self._format_cards(self.player_cards[group_id][player_id])
-            # 这里应该是私聊发送，但示例中简化为群聊发送
-            yield event.plain_result(f"[私聊] {player_name} 的手牌:\n{cards_str}")
-        
-        # 开始抢地主
-        self.game_data[group_id]['bid_stage'] = True
-        self.game_data[group_id]['bid_score'] = 0
-        self.game_data[group_id]['bid_player'] = None
-        
-        # 随机选择一个玩家开始抢地主
-        player_ids = list(self.players[group_id].keys())
-        start_player = random.choice(player_ids)
-        self.game_data[group_id]['current_player'] = start_player
-        
-        yield event.plain_result(f"请 {self.players[group_id][start_player]} 开始叫分 (1-3分)，回复 '叫分 数字' 或 '不叫'")
+        table_id = self._table_of(group_id, user_id)
+        async with self.locks.hold(table_id):
+            messages = self._act_begin(table_id)
+        for text in self._replies(event, table_id, messages):
+            yield event.plain_result(text)
 
     # 叫分命令
     @filter.command("叫分")
+    @instrument(COMMAND, "叫分")
     async def bid_score(self, event: AstrMessageEvent):
         """叫地主分数"""
         group_id = event.get_group_id()
         user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
         message_str = event.message_str
         
         # 检查是否在群聊中
@@ -216,128 +361,69 @@ class DouDiZhuPlugin(Star):
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否在进行中
-        if group_id not in self.game_status or self.game_status[group_id] != 2:
-            yield event.plain_result("当前没有进行中的游戏")
-            return
-            
-        # 检查是否在抢地主阶段
-        if not self.game_data[group_id].get('bid_stage', False):
-            yield event.plain_result("当前不是抢地主阶段")
-            return
-            
-        # 检查是否轮到该玩家
-        if self.game_data[group_id]['current_player'] != user_id:
-            yield event.plain_result(f"当前轮到 {self.players[group_id][self.game_data[group_id]['current_player']]} 叫分")
-            return
-            
         # 解析叫分
         score_match = re.search(r'叫分\s*(\d+)', message_str)
-        if not score_match:
-            yield event.plain_result("请正确输入叫分，格式为 '叫分 数字'")
-            return
-            
-        score = int(score_match.group(1))
-        
-        # 检查分数是否有效
-        if score < 1 or score > 3:
-            yield event.plain_result("叫分必须在1-3分之间")
-            return
-            
-        # 检查分数是否高于当前最高分
-        if score <= self.game_data[group_id]['bid_score']:
-            yield event.plain_result(f"叫分必须高于当前最高分 {self.game_data[group_id]['bid_score']}")
-            return
-            
-        # 更新叫分信息
-        self.game_data[group_id]['bid_score'] = score
-        self.game_data[group_id]['bid_player'] = user_id
-        
-        # 如果叫3分，直接成为地主
-        if score == 3:
-            yield from self._end_bidding(event, group_id)
-            return
-            
-        # 轮到下一个玩家
-        self._next_player(group_id)
+        score = int(score_match.group(1)) if score_match else None
         
-        yield event.plain_result(f"{user_name} 叫了 {score} 分！\n请 {self.players[group_id][self.game_data[group_id]['current_player']]} 叫分，回复 '叫分 数字' 或 '不叫'")
+        table_id = self._table_of(group_id, user_id)
+        for text in self._replies(event, table_id, await self._run_locked(table_id, self._act_bid, user_id, score)):
+            yield event.plain_result(text)
 
     # 不叫命令
     @filter.command("不叫")
+    @instrument(COMMAND, "不叫")
     async def no_bid(self, event: AstrMessageEvent):
         """不叫地主"""
         group_id = event.get_group_id()
         user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
         
         # 检查是否在群聊中
         if not group_id:
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否在进行中
-        if group_id not in self.game_status or self.game_status[group_id] != 2:
-            yield event.plain_result("当前没有进行中的游戏")
+        table_id = self._table_of(group_id, user_id)
+        for text in self._replies(event, table_id, await self._run_locked(table_id, self._act_no_bid, user_id)):
+            yield event.plain_result(text)
+
+    # 叫分建议命令
+    @filter.command("叫分建议")
+    @instrument(COMMAND, "叫分建议")
+    async def bid_advice(self, event: AstrMessageEvent):
+        """按模拟的地主胜率给出叫分建议"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查是否在抢地主阶段
-        if not self.game_data[group_id].get('bid_stage', False):
-            yield event.plain_result("当前不是抢地主阶段")
+        # 在锁内检查并复制牌局，模拟期间不占用锁
+        table_id = self._table_of(group_id, user_id)
+        async with self.locks.hold(table_id):
+            session = self.sessions.get(table_id)
+            error = self._bid_advice_error(session, user_id)
+            game = session.copy() if error is None else None
+        if error is not None:
+            yield event.plain_result(error)
             return
             
-        # 检查是否轮到该玩家
-        if self.game_data[group_id]['current_player'] != user_id:
-            yield event.plain_result(f"当前轮到 {self.players[group_id][self.game_data[group_id]['current_player']]} 叫分")
+        wins, games = await self._bid_estimate(game, user_id, self.bot_think_time)
+        if games == 0:
+            yield event.plain_result("暂时无法给出叫分建议")
             return
-            
-        # 轮到下一个玩家
-        self._next_player(group_id)
-        
-        # 如果所有玩家都不叫，或者回到了第一个叫分的玩家
-        if self.game_data[group_id]['current_player'] == self.game_data[group_id].get('first_bidder'):
-            # 如果没有人叫分，重新发牌
-            if self.game_data[group_id]['bid_score'] == 0:
-                yield event.plain_result("没有人叫分，重新发牌！")
-                self._init_game(group_id)
-                self._deal_cards(group_id)
-                
-                # 通知玩家手牌
-                yield event.plain_result("重新发牌！正在私聊发送手牌...")
-                
-                # 发送手牌信息给每个玩家
-                for player_id, player_name in self.players[group_id].items():
-                    cards_str = self._format_cards(self.player_cards[group_id][player_id])
-                    # 这里应该是私聊发送，但示例中简化为群聊发送
-                    yield event.plain_result(f"[私聊] {player_name} 的手牌:\n{cards_str}")
-                
-                # 开始抢地主
-                self.game_data[group_id]['bid_stage'] = True
-                self.game_data[group_id]['bid_score'] = 0
-                self.game_data[group_id]['bid_player'] = None
-                
-                # 随机选择一个玩家开始抢地主
-                player_ids = list(self.players[group_id].keys())
-                start_player = random.choice(player_ids)
-                self.game_data[group_id]['current_player'] = start_player
-                self.game_data[group_id]['first_bidder'] = start_player
-                
-                yield event.plain_result(f"请 {self.players[group_id][start_player]} 开始叫分 (1-3分)，回复 '叫分 数字' 或 '不叫'")
-                return
-            else:
-                # 结束叫分阶段
-                yield from self._end_bidding(event, group_id)
-                return
-        
-        yield event.plain_result(f"{user_name} 不叫！\n请 {self.players[group_id][self.game_data[group_id]['current_player']]} 叫分，回复 '叫分 数字' 或 '不叫'")
+        score = recommend_bid(wins, games, game.bid_score)
+        advice = f"叫 {score} 分" if score else "不叫"
+        yield event.plain_result(f"叫分建议：{advice}\n模拟 {games} 局，拿到地主牌后做地主的胜率约 {wins / games:.0%}")
 
     # 出牌命令
     @filter.command("出牌")
+    @instrument(COMMAND, "出牌")
     async def play_cards(self, event: AstrMessageEvent):
         """出牌"""
         group_id = event.get_group_id()
         user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
         message_str = event.message_str
         
         # 检查是否在群聊中
@@ -345,135 +431,84 @@ class DouDiZhuPlugin(Star):
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否在进行中
-        if group_id not in self.game_status or self.game_status[group_id] != 2:
-            yield event.plain_result("当前没有进行中的游戏")
-            return
-            
-        # 检查是否在出牌阶段
-        if self.game_data[group_id].get('bid_stage', True):
-            yield event.plain_result("当前不是出牌阶段")
-            return
-            
-        # 检查是否轮到该玩家
-        if self.game_data[group_id]['current_player'] != user_id:
-            yield event.plain_result(f"当前轮到 {self.players[group_id][self.game_data[group_id]['current_player']]} 出牌")
-            return
-            
         # 解析出牌
         cards_match = re.search(r'出牌\s*(.+)', message_str)
-        if not cards_match:
-            yield event.plain_result("请正确输入出牌，格式为 '出牌 牌1 牌2 ...'")
-            return
-            
-        cards_str = cards_match.group(1).strip()
-        cards = self._parse_cards(cards_str)
-        
-        # 检查牌是否在玩家手中
-        if not self._has_cards(group_id, user_id, cards):
-            yield event.plain_result("您的手牌中没有这些牌")
-            return
-            
-        # 检查牌型是否合法
-        card_type, card_value = self._get_card_type(cards)
-        if card_type is None:
-            yield event.plain_result("出牌不符合规则，请重新出牌")
-            return
-            
-        # 检查是否符合上一手牌的规则
-        last_play = self.game_data[group_id].get('last_play', None)
-        if last_play and not self._can_beat(card_type, card_value, last_play['type'], last_play['value']):
-            yield event.plain_result(f"您的牌无法大过上一手牌，请重新出牌或选择 '不出'")
-            return
-            
-        # 出牌
-        self._remove_cards(group_id, user_id, cards)
-        
-        # 更新最后一手牌
-        self.game_data[group_id]['last_play'] = {
-            'player': user_id,
-            'cards': cards,
-            'type': card_type,
-            'value': card_value
-        }
-        
-        # 检查是否获胜
-        if len(self.player_cards[group_id][user_id]) == 0:
-            # 游戏结束，当前玩家获胜
-            landlord = self.game_data[group_id]['landlord']
-            is_landlord_win = (user_id == landlord)
-            
-            # 计算分数
-            base_score = self.game_data[group_id]['bid_score']
-            
-            # 输出结果
-            result = f"游戏结束！{user_name} 获胜！\n"
-            if is_landlord_win:
-                result += f"地主胜利！地主得分：+{base_score * 2}，农民得分：-{base_score}\n"
-            else:
-                result += f"农民胜利！农民得分：+{base_score}，地主得分：-{base_score * 2}\n"
-                
-            # 重置游戏状态
-            self.game_status[group_id] = 0
-            
-            yield event.plain_result(result)
-            return
-            
-        # 轮到下一个玩家
-        self._next_player(group_id)
-        
-        # 输出结果
-        result = f"{user_name} 出牌：{self._format_cards(cards)}\n"
-        result += f"剩余 {len(self.player_cards[group_id][user_id])} 张牌\n"
-        result += f"请 {self.players[group_id][self.game_data[group_id]['current_player']]} 出牌"
+        cards = self._parse_cards(cards_match.group(1).strip()) if cards_match else None
         
-        yield event.plain_result(result)
+        table_id = self._table_of(group_id, user_id)
+        for text in self._replies(event, table_id, await self._run_locked(table_id, self._act_play, user_id, cards)):
+            yield event.plain_result(text)
 
     # 不出命令
     @filter.command("不出")
+    @instrument(COMMAND, "不出")
     async def pass_play(self, event: AstrMessageEvent):
         """不出牌"""
         group_id = event.get_group_id()
         user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
         
         # 检查是否在群聊中
         if not group_id:
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否在进行中
-        if group_id not in self.game_status or self.game_status[group_id] != 2:
-            yield event.plain_result("当前没有进行中的游戏")
+        table_id = self._table_of(group_id, user_id)
+        for text in self._replies(event, table_id, await self._run_locked(table_id, self._act_pass, user_id)):
+            yield event.plain_result(text)
+
+    # 提示命令
+    @filter.command("提示")
+    @instrument(COMMAND, "提示")
+    async def hint(self, event: AstrMessageEvent):
+        """提示可以出的牌"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查是否在出牌阶段
-        if self.game_data[group_id].get('bid_stage', True):
-            yield event.plain_result("当前不是出牌阶段")
+        table_id = self._table_of(group_id, user_id)
+        for text in self._replies(event, table_id, await self._run_locked(table_id, self._act_hint, user_id)):
+            yield event.plain_result(text)
+
+    # 必胜提示命令
+    @filter.command("必胜提示")
+    @instrument(COMMAND, "必胜提示")
+    async def endgame_hint_command(self, event: AstrMessageEvent):
+        """残局中按明牌计算必胜的出牌"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查是否轮到该玩家
-        if self.game_data[group_id]['current_player'] != user_id:
-            yield event.plain_result(f"当前轮到 {self.players[group_id][self.game_data[group_id]['current_player']]} 出牌")
+        if not self.endgame_hint:
+            yield event.plain_result("必胜提示未开启")
             return
             
-        # 检查是否可以不出
-        last_play = self.game_data[group_id].get('last_play', None)
-        if last_play is None or last_play['player'] == user_id:
-            yield event.plain_result("您必须出牌")
+        # 在锁内检查并复制牌局，搜索期间不占用锁
+        table_id = self._table_of(group_id, user_id)
+        async with self.locks.hold(table_id):
+            session = self.sessions.get(table_id)
+            error = self._endgame_error(session, user_id)
+            game = session.copy() if error is None else None
+        if error is not None:
+            yield event.plain_result(error)
             return
             
-        # 轮到下一个玩家
-        self._next_player(group_id)
-        
-        # 输出结果
-        result = f"{user_name} 不出\n"
-        result += f"请 {self.players[group_id][self.game_data[group_id]['current_player']]} 出牌"
-        
-        yield event.plain_result(result)
+        try:
+            verdict = await self._run_search(ENDGAME_TIMEOUT, solve_endgame, game, user_id)
+        except (asyncio.TimeoutError, BrokenProcessPool):
+            verdict = None
+        yield event.plain_result(self._endgame_text(game, user_id, verdict))
 
     # 查看手牌命令
     @filter.command("手牌")
+    @instrument(COMMAND, "手牌")
     async def show_cards(self, event: AstrMessageEvent):
         """查看手牌"""
         group_id = event.get_group_id()
@@ -486,81 +521,145 @@ class DouDiZhuPlugin(Star):
             return
             
         # 检查游戏是否在进行中
-        if group_id not in self.game_status or self.game_status[group_id] != 2:
+        session = self.sessions.get(self._table_of(group_id, user_id))
+        if session is None or session.status != PLAYING:
             yield event.plain_result("当前没有进行中的游戏")
             return
             
         # 检查玩家是否在游戏中
-        if user_id not in self.players[group_id]:
+        if user_id not in session.players:
             yield event.plain_result("您不在当前游戏中")
             return
             
         # 获取手牌
-        cards = self.player_cards[group_id][user_id]
-        cards_str = self._format_cards(cards)
+        cards_str = self._hand_text(session, user_id)
         
+        # 开启私聊发送手牌时重新私聊发送，不在群里展示手牌
+        origin = self._hand_origin(session, user_id)
+        if origin is not None:
+            self._submit_private(session, user_id, origin, f"斗地主手牌:\n{cards_str}")
+            yield event.plain_result(f"正在私聊发送 {user_name} 的手牌...")
+            return
+            
         # 输出结果
         result = f"[私聊] {user_name} 的手牌:\n{cards_str}"
         
-        yield event.plain_result(result)
+        png = await self._render_image(hand_image_key(session.hands[user_id]))
+        if png is None:
+            yield event.plain_result(result)
+        else:
+            yield event.chain_result([Comp.Plain(result), Comp.Image.fromBytes(png)])
+
+    # 记牌命令
+    @filter.command("记牌")
+    @instrument(COMMAND, "记牌")
+    async def show_tracker(self, event: AstrMessageEvent):
+        """查看记牌信息"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        user_name = event.get_sender_name()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        # 检查游戏是否在进行中
+        session = self.sessions.get(self._table_of(group_id, user_id))
+        if session is None or session.status != PLAYING:
+            yield event.plain_result("当前没有进行中的游戏")
+            return
+            
+        # 检查玩家是否在游戏中
+        if user_id not in session.players:
+            yield event.plain_result("您不在当前游戏中")
+            return
+            
+        # 其余两家的牌由自己的手牌推出，开启私聊发送手牌时同样私聊发送
+        tracker_str = self._tracker_text(session, user_id)
+        origin = self._hand_origin(session, user_id)
+        if origin is not None:
+            self._submit_private(session, user_id, origin, f"斗地主记牌:\n{tracker_str}", "记牌")
+            yield event.plain_result(f"正在私聊发送 {user_name} 的记牌...")
+            return
+            
+        yield event.plain_result(f"{user_name} 的记牌:\n{tracker_str}")
 
     # 查看游戏状态命令
     @filter.command("状态")
+    @instrument(COMMAND, "状态")
     async def show_status(self, event: AstrMessageEvent):
         """查看游戏状态"""
         group_id = event.get_group_id()
+        user_id = event.get_sender_id()
         
         # 检查是否在群聊中
         if not group_id:
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
+        # 指定桌号时查看该桌，否则查看自己所在的桌；不在任何一桌且本群有多桌时列出所有桌
+        table_match = re.search(r'状态\s*(\d+)', event.message_str)
+        if table_match:
+            table_id = table_key(group_id, int(table_match.group(1)))
+        else:
+            table_id = self._seated_table(group_id, user_id)
+            if table_id is None and len(self.tables.tables(group_id)) > 1:
+                yield event.plain_result(self._tables_text(group_id))
+                return
+            table_id = table_id or self._table_of(group_id, user_id)
+            
         # 检查游戏是否存在
-        if group_id not in self.game_status:
+        session = self.sessions.get(table_id)
+        if session is None:
             yield event.plain_result("当前没有游戏")
             return
             
         # 获取游戏状态
-        status = self._get_status_text(group_id)
+        status = self._get_status_text(session)
         
         # 输出结果
-        result = f"当前游戏状态: {status}\n"
+        result = self._label(table_id, [f"当前游戏状态: {status}\n"])[0]
+        result += f"玩法: {RULE_SETS[session.rules].label}\n"
         
-        if self.game_status[group_id] == 1:
+        if session.status == WAITING:
             # 等待加入状态
-            result += f"已加入玩家: {', '.join(self.players[group_id].values())}\n"
-            result += f"玩家数: {len(self.players[group_id])}/3\n"
-            result += "发送 '加入' 参与游戏，发送 '开始' 开始游戏"
-        elif self.game_status[group_id] == 2:
-            # 游戏中状态
-            if self.game_data[group_id].get('bid_stage', False):
-                # 叫分阶段
-                result += f"当前叫分: {self.game_data[group_id]['bid_score']}\n"
-                if self.game_data[group_id]['bid_score'] > 0:
-                    bid_player = self.players[group_id][self.game_data[group_id]['bid_player']]
-                    result += f"当前最高叫分者: {bid_player}\n"
-                result += f"当前轮到: {self.players[group_id][self.game_data[group_id]['current_player']]}\n"
-                result += "请使用 '叫分 数字' 或 '不叫' 进行操作"
-            else:
-                # 出牌阶段
-                landlord = self.players[group_id][self.game_data[group_id]['landlord']]
-                result += f"地主: {landlord}\n"
-                result += f"当前轮到: {self.players[group_id][self.game_data[group_id]['current_player']]}\n"
-                
-                # 显示上一手牌
-                last_play = self.game_data[group_id].get('last_play', None)
-                if last_play:
-                    last_player = self.players[group_id][last_play['player']]
-                    last_cards = self._format_cards(last_play['cards'])
-                    result += f"上一手牌 ({last_player}): {last_cards}\n"
-                
-                result += "请使用 '出牌 牌1 牌2 ...' 或 '不出' 进行操作\n"
-                result += "发送 '手牌' 查看自己的手牌"
+            result += f"已加入玩家: {', '.join(session.players.values())}\n"
+            result += f"玩家数: {len(session.players)}/3\n"
+            result += f"发送 '{self._join_command(session)}' 参与游戏，发送 '开始' 开始游戏"
+        elif session.bid_stage:
+            # 叫分阶段
+            result += f"当前叫分: {session.bid_score}\n"
+            if session.bid_score > 0:
+                result += f"当前最高叫分者: {session.players[session.bid_player]}\n"
+            result += f"当前轮到: {session.players[session.current_player]}\n"
+            result += "请使用 '叫分 数字' 或 '不叫' 进行操作"
+        else:
+            # 出牌阶段
+            result += f"地主: {session.players[session.landlord]}\n"
+            result += f"当前轮到: {session.players[session.current_player]}\n"
+            
+            # 显示上一手牌
+            last_play = session.last_play
+            if last_play:
+                last_player = session.players[last_play.player]
+                last_cards = self._format_cards(last_play.cards)
+                result += f"上一手牌 ({last_player}): {last_cards}\n"
+            
+            result += "请使用 '出牌 牌1 牌2 ...' 或 '不出' 进行操作\n"
+            result += "发送 '手牌' 查看自己的手牌"
+            
+            # 牌桌图片：地主牌和上一手牌
+            png = await self._render_image(table_image_key(session.landlord_cards, last_play.cards if last_play else ()))
+            if png is not None:
+                yield event.chain_result([Comp.Plain(result), Comp.Image.fromBytes(png)])
+                return
         
         yield event.plain_result(result)
 
     # 结束游戏命令
     @filter.command("结束游戏")
+    @instrument(COMMAND, "结束游戏")
     async def end_game(self, event: AstrMessageEvent):
         """强制结束游戏"""
         group_id = event.get_group_id()
@@ -572,104 +671,1412 @@ class DouDiZhuPlugin(Star):
             yield event.plain_result("斗地主游戏仅支持在群聊中进行")
             return
             
-        # 检查游戏是否存在
-        if group_id not in self.game_status or self.game_status[group_id] == 0:
-            yield event.plain_result("当前没有进行中的游戏")
+        # 指定桌号时结束该桌，否则结束自己所在的桌
+        table_match = re.search(r'结束游戏\s*(\d+)', event.message_str)
+        table_id = table_key(group_id, int(table_match.group(1))) if table_match else self._table_of(group_id, user_id)
+        async with self.locks.hold(table_id):
+            messages = self._act_end(table_id, user_name)
+        for text in self._replies(event, table_id, messages):
+            yield event.plain_result(text)
+
+    # 匹配命令
+    @filter.command("匹配")
+    @instrument(COMMAND, "匹配")
+    async def join_queue(self, event: AstrMessageEvent):
+        """进入跨群匹配队列，凑满三人后自动开始"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        user_name = event.get_sender_name()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        # 检查是否已经在队列中或已经在某一桌
+        ticket = self.matchmaker.get(user_id)
+        if ticket is not None:
+            waited = int(time.monotonic() - ticket.since)
+            yield event.plain_result(f"{user_name} 已经在匹配队列中（已等待 {waited} 秒），发送 '取消匹配' 退出")
+            return
+        seated = self._seated_table(group_id, user_id)
+        if seated is not None:
+            yield event.plain_result(f"{user_name} 已经在 {self._table_name(seated)}了")
+            return
+        if self.tables.seat_of(user_id) is not None:
+            yield event.plain_result(f"{user_name} 已经在其他群的牌局中了，结束后再来匹配")
             return
             
-        # 重置游戏状态
-        self.game_status[group_id] = 0
+        # 加入队列，凑满一桌时立即开始
+        rating = self._match_rating(user_id)
+        tickets = self.matchmaker.enqueue(user_id, user_name, event.unified_msg_origin, rating, time.monotonic())
+        if tickets is None:
+            yield event.plain_result(f"{user_name} 加入了匹配队列（匹配积分 {rating:+d}），当前 {len(self.matchmaker)} 人等待\n凑满三人后自动开始，发送 '取消匹配' 退出")
+            return
+        await self._form_match(tickets)
+
+    # 取消匹配命令
+    @filter.command("取消匹配")
+    @instrument(COMMAND, "取消匹配")
+    async def leave_queue(self, event: AstrMessageEvent):
+        """退出跨群匹配队列"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        user_name = event.get_sender_name()
         
-        yield event.plain_result(f"{user_name} 强制结束了游戏")
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        if not self.matchmaker.cancel(user_id):
+            yield event.plain_result(f"{user_name} 不在匹配队列中")
+            return
+        yield event.plain_result(f"{user_name} 退出了匹配队列")
 
-    # 辅助方法：初始化游戏
-    def _init_game(self, group_id):
-        """初始化游戏数据"""
-        self.game_data[group_id] = {
-            'cards': self._create_cards(),
-            'current_player': None,
-            'landlord': None,
-            'last_play': None,
-            'bid_stage': True,
-            'bid_score': 0,
-            'bid_player': None
-        }
-        self.player_cards[group_id] = {player_id: [] for player_id in self.players[group_id]}
-
-    # 辅助方法：创建一副牌
-    def _create_cards(self):
-        """创建一副牌"""
-        suits = ['♠', '♥', '♦', '♣']
-        ranks = ['3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A', '2']
-        cards = [f"{suit}{rank}" for suit in suits for rank in ranks]
-        cards.append('joker')  # 小王
-        cards.append('JOKER')  # 大王
-        random.shuffle(cards)  # 洗牌
-        return cards
-
-    # 辅助方法：发牌
-    def _deal_cards(self, group_id):
-        """发牌"""
-        cards = self.game_data[group_id]['cards']
-        player_ids = list(self.players[group_id].keys())
-        
-        # 每人17张牌
-        for i, player_id in enumerate(player_ids):
-            self.player_cards[group_id][player_id] = sorted(cards[i*17:(i+1)*17], key=self._card_sort_key)
-        
-        # 剩余3张作为地主牌
-        self.game_data[group_id]['landlord_cards'] = cards[51:]
+    # 比赛命令
+    @filter.command("比赛")
+    @instrument(COMMAND, "比赛")
+    async def tournament(self, event: AstrMessageEvent):
+        """发起淘汰赛，比赛已经存在时查看赛况和名次"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        user_name = event.get_sender_name()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        tournament = self.tournaments.get(group_id)
+        if tournament is not None:
+            yield event.plain_result(self._standings_text(tournament))
+            return
+            
+        self.tournaments[group_id] = Tournament(group_id, user_id, user_name, event.unified_msg_origin)
+        yield event.plain_result(f"{user_name} 发起了斗地主比赛！发送 '报名' 参加，发起者已自动报名。\n发起者发送 '开始比赛' 开赛：每轮分组同时开桌，每桌先出完牌的玩家晋级，直到决出冠军。")
 
-    # 辅助方法：结束叫分阶段
-    async def _end_bidding(self, event, group_id):
-        """结束叫分阶段"""
-        # 设置地主
-        landlord_id = self.game_data[group_id]['bid_player']
-        self.game_data[group_id]['landlord'] = landlord_id
+    # 报名命令
+    @filter.command("报名")
+    @instrument(COMMAND, "报名")
+    async def register(self, event: AstrMessageEvent):
+        """报名参加本群的比赛"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        user_name = event.get_sender_name()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        tournament = self.tournaments.get(group_id)
+        if tournament is None:
+            yield event.plain_result("本群没有比赛，发送 '比赛' 发起一场")
+            return
+        if tournament.started:
+            yield event.plain_result("比赛已经开始，无法报名")
+            return
+        if not tournament.register(user_id, user_name):
+            yield event.plain_result(f"{user_name} 已经报名了")
+            return
+        yield event.plain_result(f"{user_name} 报名参加比赛！当前 {len(tournament.names)} 人报名")
+
+    # 开始比赛命令
+    @filter.command("开始比赛")
+    @instrument(COMMAND, "开始比赛")
+    async def begin_tournament(self, event: AstrMessageEvent):
+        """发起者开始比赛，安排第一轮"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        tournament = self.tournaments.get(group_id)
+        if tournament is None:
+            yield event.plain_result("本群没有比赛，发送 '比赛' 发起一场")
+            return
+        if tournament.owner != user_id:
+            yield event.plain_result("只有比赛的发起者可以开始比赛")
+            return
+        if tournament.started:
+            yield event.plain_result("比赛已经开始了")
+            return
+        if len(tournament.names) < 2:
+            yield event.plain_result("报名人数不足，至少需要 2 人")
+            return
+            
+        await self._advance_tournament(group_id)
+
+    # 结束比赛命令
+    @filter.command("结束比赛")
+    @instrument(COMMAND, "结束比赛")
+    async def end_tournament(self, event: AstrMessageEvent):
+        """发起者取消比赛，已经开始的牌局继续进行"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        tournament = self.tournaments.get(group_id)
+        if tournament is None:
+            yield event.plain_result("本群没有比赛")
+            return
+        if tournament.owner != user_id:
+            yield event.plain_result("只有比赛的发起者可以结束比赛")
+            return
+            
+        del self.tournaments[group_id]
+        yield event.plain_result("比赛已取消，已经开始的牌局继续进行，但不再计入比赛")
+
+    # 排行榜命令
+    @filter.command("排行榜")
+    @instrument(COMMAND, "排行榜")
+    async def show_leaderboard(self, event: AstrMessageEvent):
+        """查看本群积分排行榜"""
+        group_id = event.get_group_id()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        if self.ledger is None:
+            yield event.plain_result("积分记录未开启")
+            return
+            
+        top = self.ledger.top(group_id)
+        if not top:
+            yield event.plain_result("本群还没有完成的对局")
+            return
+            
+        result = "斗地主积分排行榜：\n"
+        for rank, (player_id, record) in enumerate(top, 1):
+            result += f"{rank}. {record.name}  {record.score:+d} 分（{record.wins}胜/{record.games}局）\n"
+        
+        yield event.plain_result(result.rstrip())
+
+    # 我的战绩命令
+    @filter.command("我的战绩")
+    @instrument(COMMAND, "我的战绩")
+    async def show_record(self, event: AstrMessageEvent):
+        """查看自己的积分和胜负"""
+        group_id = event.get_group_id()
+        user_id = event.get_sender_id()
+        user_name = event.get_sender_name()
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        if self.ledger is None:
+            yield event.plain_result("积分记录未开启")
+            return
+            
+        record = self.ledger.player(group_id, user_id)
+        if record is None:
+            yield event.plain_result(f"{user_name} 在本群还没有完成的对局")
+            return
+            
+        result = f"{user_name} 的战绩：\n"
+        result += f"本群积分: {record.score:+d}（第 {self.ledger.rank(group_id, user_id)} 名）\n"
+        result += f"对局: {record.games} 局，胜 {record.wins} 局\n"
+        result += f"当地主: {record.landlord_games} 局，胜 {record.landlord_wins} 局\n"
+        result += f"当农民: {record.farmer_games} 局，胜 {record.farmer_wins} 局"
+        
+        # 多个群的合计
+        totals = self.ledger.totals(user_id)
+        if totals is not None and totals.games != record.games:
+            result += f"\n所有群合计: {totals.score:+d} 分，{totals.wins}胜/{totals.games}局"
+        
+        yield event.plain_result(result)
+
+    # 回放命令
+    @filter.command("回放")
+    @instrument(COMMAND, "回放")
+    async def show_replay(self, event: AstrMessageEvent):
+        """逐步回放本群最近结束的一局"""
+        group_id = event.get_group_id()
+        message_str = event.message_str
+        
+        # 检查是否在群聊中
+        if not group_id:
+            yield event.plain_result("斗地主游戏仅支持在群聊中进行")
+            return
+            
+        # 解析要回放倒数第几局
+        index_match = re.search(r'回放\s*(\d+)', message_str)
+        index = int(index_match.group(1)) if index_match else 1
+        
+        recent = self.recent_replays.get(group_id)
+        if not recent:
+            yield event.plain_result("本群还没有可以回放的对局")
+            return
+        if index < 1 or index > len(recent):
+            yield event.plain_result(f"只保留了最近 {len(recent)} 局，请发送 '回放 1' 到 '回放 {len(recent)}'")
+            return
+            
+        lines = self._replay_lines(decode_game(recent[-index]))
+        for start in range(0, len(lines), REPLAY_STEPS_PER_MESSAGE):
+            yield event.plain_result("\n".join(lines[start:start + REPLAY_STEPS_PER_MESSAGE]))
+
+    # 统计命令
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("斗地主统计")
+    @instrument(COMMAND, "斗地主统计")
+    async def show_metrics(self, event: AstrMessageEvent):
+        """查看插件的命令耗时和牌局统计（仅管理员）"""
+        uptime = int(time.time() - self.metrics.started_at)
+        result = f"斗地主统计（运行 {uptime // 3600} 小时 {uptime % 3600 // 60} 分钟）\n"
+        
+        # 牌局数量
+        phases = self._phase_counts()
+        result += f"进行中的牌局: {len(self.sessions)}（等待加入 {phases['lobby']}，叫分 {phases['bid']}，出牌 {phases['play']}）\n"
+        result += f"命令锁: {len(self.locks)}，定时器: {len(self.timers)}\n"
+        delivery = self.delivery
+        result += f"私聊发送: 成功 {delivery.sent}，重试 {delivery.retries}，失败 {delivery.failures}，进行中 {len(delivery)}\n"
+        outbox = self.outbox
+        result += f"群消息: 发送 {outbox.sent}，合并 {outbox.merged}，排队 {outbox.queued}，丢弃过期提示 {outbox.collapsed}，等待 {len(outbox)}\n"
+        matchmaker = self.matchmaker
+        result += f"匹配队列: 等待 {len(matchmaker)}，成桌 {matchmaker.matched}，超时 {matchmaker.expired}；进行中的比赛: {len(self.tournaments)}\n"
+        if self.renderer is not None:
+            pngs, tiles = self.renderer.pngs, self.renderer.tiles
+            result += f"图片缓存: 命中 {pngs.hits}，绘制 {pngs.misses}，牌带命中 {tiles.hits}/{tiles.hits + tiles.misses}\n"
+        
+        # 命令耗时
+        lines = self.metrics.summary(COMMAND)
+        result += "命令耗时:\n" + ("\n".join(lines) if lines else "暂无") + "\n"
+        lines = self.metrics.summary(HELPER)
+        result += "内部方法耗时:\n" + ("\n".join(lines) if lines else "暂无")
+        
+        yield event.plain_result(result)
+
+    # 辅助方法：在桌锁内执行操作
+    async def _run_locked(self, table_id, action, *args):
+        """持有这一桌的锁，找到进行中的牌局后执行操作，返回要发送的消息"""
+        async with self.locks.hold(table_id):
+            # 检查游戏是否在进行中
+            session = self.sessions.get(table_id)
+            if session is None or session.status != PLAYING:
+                return ["当前没有进行中的游戏"]
+            return action(session, *args)
+
+    # 辅助方法：发起游戏
+    @instrument(HELPER, "act_start")
+    def _act_start(self, table_id, user_id, user_name, origin, rules=DEFAULT_RULES):
+        """在一张空桌发起游戏，返回要发送的消息"""
+        group_id, table = split_table_key(table_id)
+        # 检查这一桌是否已经开始
+        session = self.sessions.get(table_id)
+        if session is not None:
+            return [f"游戏已经在进行中，当前状态: {self._get_status_text(session)}"]
+            
+        # 检查发起者是否已经在本群的其他桌或匹配桌
+        seated = self._seated_table(group_id, user_id)
+        if seated is not None:
+            return [f"{user_name} 已经在 {self._table_name(seated)}了"]
+            
+        # 检查本群的桌数（重放日志时以当时的结果为准，匹配桌不限）
+        if not self._replaying and group_id != MATCH_GROUP and len(self.tables.tables(group_id)) >= self.max_tables:
+            return [f"本群同时进行的游戏已达上限（{self.max_tables} 桌），请等待其他桌结束"]
+            
+        # 初始化游戏，发起者自动加入（同时退出匹配队列）
+        session = GameSession(group_id, user_id, user_name, origin, rules, table)
+        self.sessions[table_id] = session
+        self.tables.open(group_id, table)
+        self.tables.seat(group_id, user_id, table)
+        self.matchmaker.cancel(user_id)
+        if group_id == MATCH_GROUP:
+            session.origins[user_id] = origin
+            self.match_rooms[table_id] = (origin,)
+        self._journal(OP_START, table_id, user_id, user_name, origin or '', rules)
+        self._touch(session)
+        
+        return [f"{user_name} 发起了斗地主游戏！玩法：{RULE_SETS[rules].label}\n发送 '{self._join_command(session)}' 参与游戏，需要3名玩家。\n发起者已自动加入。\n发送 '开始' 开始游戏。"]
+
+    # 辅助方法：加入游戏
+    @instrument(HELPER, "act_join")
+    def _act_join(self, table_id, user_id, user_name, origin=None):
+        """加入一桌游戏（跨群匹配时 origin 为玩家所在群的消息来源），返回要发送的消息"""
+        # 检查游戏是否处于等待加入状态
+        session = self.sessions.get(table_id)
+        if session is None or session.status != WAITING:
+            return ["当前没有等待加入的游戏，请先发送 '斗地主' 开始一局游戏"]
+            
+        # 检查玩家是否已经加入
+        if user_id in session.players:
+            return [f"{user_name} 已经在游戏中了"]
+            
+        # 检查玩家是否已经在本群的其他桌或匹配桌
+        seated = self._seated_table(session.group_id, user_id)
+        if seated is not None:
+            return [f"{user_name} 已经在 {self._table_name(seated)}了"]
+            
+        # 检查玩家数量是否已满
+        if len(session.players) >= SEAT_COUNT:
+            return ["游戏人数已满（3人），无法加入"]
+            
+        # 加入游戏，机器人不按玩家找桌，不记座位
+        session.players[user_id] = user_name
+        if not is_bot(user_id):
+            self.tables.seat(session.group_id, user_id, session.table)
+            self.matchmaker.cancel(user_id)
+        if origin:
+            session.origins[user_id] = origin
+            self.match_rooms[table_id] = tuple(dict.fromkeys(session.origins.values()))
+        self._journal(OP_JOIN, table_id, user_id, user_name, origin or '')
+        self._touch(session)
+        
+        return [f"{user_name} 加入了游戏！当前玩家数: {len(session.players)}/3"]
+
+    # 辅助方法：加入机器人
+    @instrument(HELPER, "act_add_bot")
+    def _act_add_bot(self, table_id):
+        """按已有机器人数编号，以普通玩家的方式加入，返回要发送的消息"""
+        session = self.sessions.get(table_id)
+        if session is None or session.status != WAITING:
+            return ["当前没有等待加入的游戏，请先发送 '斗地主' 开始一局游戏"]
+        number = sum(1 for player_id in session.players if is_bot(player_id)) + 1
+        return self._act_join(table_id, f"{BOT_PREFIX}{number}", f"机器人{number}")
+
+    # 辅助方法：开始游戏
+    @instrument(HELPER, "act_begin")
+    def _act_begin(self, table_id, seed=None):
+        """开始游戏并发牌，返回要发送的消息"""
+        # 检查游戏是否处于等待加入状态
+        session = self.sessions.get(table_id)
+        if session is None or session.status != WAITING:
+            return ["当前没有等待加入的游戏，请先发送 '斗地主' 开始一局游戏"]
+            
+        # 检查玩家数量是否足够
+        if len(session.players) < SEAT_COUNT:
+            return [f"玩家数量不足，需要3名玩家，当前只有{len(session.players)}名玩家"]
+            
+        # 开始游戏
+        session.status = PLAYING
+        session.seat_players()
+        session.seed = random.getrandbits(63) if seed is None else seed
+        self._journal(OP_BEGIN, table_id, session.seed)
+        session.history = bytearray()
+        put_rules(session.history, session.rules)
+        
+        # 发牌，随机选择一个玩家开始抢地主
+        self._init_game(session)
+        start_player = session.current_player
+        
+        # 通知玩家手牌
+        messages = ["游戏开始！正在私聊发送手牌..."]
+        messages.extend(self._hand_messages(session))
+        
+        self.timers.schedule((table_id, GAME_TIMER), self.game_timeout, time.monotonic())
+        self._touch(session)
+        
+        messages.append(f"请 {session.players[start_player]} 开始叫分 (1-3分)，回复 '叫分 数字' 或 '不叫'")
+        return messages
+
+    # 辅助方法：强制结束游戏
+    @instrument(HELPER, "act_end")
+    def _act_end(self, table_id, user_name):
+        """强制结束游戏，返回要发送的消息"""
+        # 检查游戏是否存在
+        if table_id not in self.sessions:
+            return ["当前没有进行中的游戏"]
+            
+        # 释放牌局
+        self._release_session(table_id)
+        
+        return [f"{user_name} 强制结束了游戏"]
+
+    # 辅助方法：提示
+    @instrument(HELPER, "act_hint")
+    def _act_hint(self, session, user_id):
+        """依次给出下一种可出的牌，返回要发送的消息"""
+        # 检查是否在出牌阶段
+        if session.bid_stage:
+            return ["当前不是出牌阶段"]
+            
+        # 检查是否轮到该玩家
+        if session.current_player != user_id:
+            return [f"当前轮到 {session.players[session.current_player]} 出牌"]
+            
+        # 依次取下一种出牌，取完后从头开始
+        hand = session.hands[user_id]
+        move = next(session.hints, None) if session.hints is not None else None
+        if move is None:
+            moves = self.move_tables[session.rules].legal_moves(hand.counts, session.required_pattern(user_id))
+            # 每一小批中打出后剩余手数最少的牌排在前面，只在取到这一批时生成和求解
+            session.hints = self.solvers[session.rules].iter_ordered(hand.counts, moves, budget=HINT_SOLVE_BUDGET)
+            move = next(session.hints, None)
+        if move is None:
+            session.hints = None
+            return ["没有能大过上家的牌，建议发送 '不出'"]
+        
+        result = f"提示：出牌 {self._format_cards(hand.pick(move.ranks))}"
+        # 按记牌判断其余两家是否还可能压过
+        unseen = session.tracker.unseen_counts(hand)
+        if not self.move_tables[session.rules].has_move(unseen, move.pattern):
+            result += "\n其余两家没有更大的牌"
+        return [result]
+
+    # 辅助方法：叫分
+    @instrument(HELPER, "act_bid")
+    def _act_bid(self, session, user_id, score, auto=False):
+        """叫分，返回要发送的消息"""
+        try:
+            session.check_turn(user_id, True)
+            if score is None:
+                return ["请正确输入叫分，格式为 '叫分 数字'"]
+            result = session.bid(user_id, score)
+        except RuleError as e:
+            return [self._rule_message(session, e)]
+            
+        self._journal(OP_BID, session.table_id, user_id, score)
+        put_bid(session.history, session.seat_index(user_id), score)
+        
+        # 如果叫3分，直接成为地主
+        if result == LANDLORD:
+            return self._end_bidding(session, auto)
+            
+        # 轮到下一个玩家
+        self._touch(session, auto)
         
-        # 地主获得底牌
-        landlord_cards = self.game_data[group_id]['landlord_cards']
-        self.player_cards[group_id][landlord_id].extend(landlord_cards)
-        self.player_cards[group_id][landlord_id] = sorted(self.player_cards[group_id][landlord_id], key=self._card_sort_key)
+        return [f"{session.players[user_id]} 叫了 {score} 分！\n请 {session.players[session.current_player]} 叫分，回复 '叫分 数字' 或 '不叫'"]
+
+    # 辅助方法：不叫
+    @instrument(HELPER, "act_no_bid")
+    def _act_no_bid(self, session, user_id, auto=False):
+        """不叫地主，返回要发送的消息"""
+        try:
+            result = session.no_bid(user_id)
+        except RuleError as e:
+            return [self._rule_message(session, e)]
+            
+        self._journal(OP_NO_BID, session.table_id, user_id)
+        put_no_bid(session.history, session.seat_index(user_id))
         
-        # 结束叫分阶段
-        self.game_data[group_id]['bid_stage'] = False
+        # 如果没有人叫分，重新发牌
+        if result == REDEAL:
+            messages = ["没有人叫分，重新发牌！"]
+            self._init_game(session)
+            
+            # 通知玩家手牌
+            messages.append("重新发牌！正在私聊发送手牌...")
+            messages.extend(self._hand_messages(session))
+            self._touch(session, auto)
+            
+            messages.append(f"请 {session.players[session.current_player]} 开始叫分 (1-3分)，回复 '叫分 数字' 或 '不叫'")
+            return messages
+            
+        # 回到第一个叫分的玩家，结束叫分阶段
+        if result == LANDLORD:
+            return self._end_bidding(session, auto)
         
-        # 地主先出牌
-        self.game_data[group_id]['current_player'] = landlord_id
+        self._touch(session, auto)
+        return [f"{session.players[user_id]} 不叫！\n请 {session.players[session.current_player]} 叫分，回复 '叫分 数字' 或 '不叫'"]
+
+    # 辅助方法：出牌
+    @instrument(HELPER, "act_play")
+    def _act_play(self, session, user_id, cards, auto=False):
+        """出牌，返回要发送的消息"""
+        try:
+            session.check_turn(user_id, False)
+            if not cards:
+                return ["请正确输入出牌，格式为 '出牌 牌1 牌2 ...'"]
+            # 只给出点数的牌从手牌中选出具体的牌
+            card_ids = session.hands[user_id].resolve(cards)
+            if card_ids is None:
+                raise RuleError(NOT_IN_HAND)
+            result = session.play(user_id, card_ids)
+        except RuleError as e:
+            return [self._rule_message(session, e)]
+            
+        self._journal(OP_PLAY, session.table_id, user_id, bytes(card_ids))
+        put_play(session.history, session.seat_index(user_id), card_ids)
+        session.hints = None
+        user_name = session.players[user_id]
+        
+        # 检查是否获胜
+        if result == WIN:
+            scores = session.scores()
+            self._record_result(session, scores)
+            self._save_replay(session)
+            
+            # 输出结果
+            result = f"游戏结束！{user_name} 获胜！\n"
+            if session.winner == session.landlord:
+                result += f"地主胜利！地主得分：+{scores[session.landlord]}，农民得分：{min(scores.values())}\n"
+            else:
+                result += f"农民胜利！农民得分：+{max(scores.values())}，地主得分：{scores[session.landlord]}\n"
+                
+            # 释放牌局
+            self._release_session(session.table_id)
+            return [result]
+            
+        # 轮到下一个玩家
+        self._touch(session, auto)
+        
+        # 输出结果
+        result = f"{user_name} 出牌：{self._format_cards(sorted(card_ids))}\n"
+        result += f"剩余 {len(session.hands[user_id])} 张牌\n"
+        result += f"请 {session.players[session.current_player]} 出牌"
+        result += self._no_move_notice(session)
+        return [result]
+
+    # 辅助方法：不出
+    @instrument(HELPER, "act_pass")
+    def _act_pass(self, session, user_id, auto=False):
+        """不出牌，返回要发送的消息"""
+        try:
+            session.pass_turn(user_id)
+        except RuleError as e:
+            return [self._rule_message(session, e)]
+            
+        self._journal(OP_PASS, session.table_id, user_id)
+        put_pass(session.history, session.seat_index(user_id))
+        session.hints = None
+        self._touch(session, auto)
+        
+        # 输出结果
+        result = f"{session.players[user_id]} 不出\n"
+        result += f"请 {session.players[session.current_player]} 出牌"
+        result += self._no_move_notice(session)
+        return [result]
+
+    # 辅助方法：规则错误提示
+    def _rule_message(self, session, error):
+        """把牌局引擎的错误码转换为提示文本"""
+        code = error.code
+        if code == NOT_TURN:
+            action = "叫分" if session.bid_stage else "出牌"
+            return f"当前轮到 {session.players[session.current_player]} {action}"
+        if code == LOW_SCORE:
+            return f"叫分必须高于当前最高分 {session.bid_score}"
+        return RULE_MESSAGES[code]
+
+    # 辅助方法：超时代为操作
+    def _auto_act(self, session):
+        """当前玩家超时：叫分阶段不叫，能不出时不出，否则打出最小的牌"""
+        player_id = session.current_player
+        if session.bid_stage:
+            messages = self._act_no_bid(session, player_id, auto=True)
+        elif session.required_pattern(player_id) is not None:
+            messages = self._act_pass(session, player_id, auto=True)
+        else:
+            hand = session.hands[player_id]
+            move = next(self.move_tables[session.rules].legal_moves(hand.counts))
+            messages = self._act_play(session, player_id, hand.pick(move.ranks), auto=True)
+        return [f"{session.players[player_id]} 操作超时，已自动处理"] + messages
+
+    # 辅助方法：机器人操作
+    @instrument(HELPER, "act_bot")
+    def _act_bot(self, session, action):
+        """执行机器人的决定：叫分阶段为叫分（0 为不叫），出牌阶段为牌编号（None 为不出）"""
+        player_id = session.current_player
+        if session.bid_stage:
+            if action:
+                return self._act_bid(session, player_id, action)
+            return self._act_no_bid(session, player_id)
+        if action is None:
+            return self._act_pass(session, player_id)
+        return self._act_play(session, player_id, list(action))
+
+    # 辅助方法：安排机器人操作
+    def _schedule_bot(self, session):
+        """轮到机器人时启动替它操作的任务，同一桌只有一个"""
+        if session.status != PLAYING or not is_bot(session.current_player):
+            return
+        if session.table_id in self._bot_tasks:
+            return
+        task = asyncio.get_running_loop().create_task(self._bot_loop(session.table_id))
+        self._bot_tasks[session.table_id] = task
+
+    # 辅助方法：机器人操作循环
+    async def _bot_loop(self, table_id):
+        """在进程池中搜索，再持锁确认牌局没有变化后执行，直到轮到真人玩家"""
+        try:
+            while True:
+                session = self.sessions.get(table_id)
+                if session is None or session.status != PLAYING or not is_bot(session.current_player):
+                    return
+                version = len(session.history)
+                action = await self._bot_decide(session)
+                async with self.locks.hold(table_id):
+                    # 思考期间牌局可能已结束或被超时代为操作
+                    if self.sessions.get(table_id) is not session or len(session.history) != version:
+                        continue
+                    messages = self._act_bot(session, action)
+                await self._send_group(session, messages)
+                if len(session.history) == version:
+                    # 操作没有被接受，交给回合超时代为处理
+                    logger.warning(f"斗地主机器人操作无效: {messages}")
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"斗地主机器人操作失败: {e}")
+        finally:
+            self._bot_tasks.pop(table_id, None)
+
+    # 辅助方法：机器人决策
+    async def _bot_decide(self, session):
+        """在进程池中按思考时间搜索；没有进程池、超时或进程池损坏时改用不搜索的出牌"""
+        game = session.copy()
+        player_id = session.current_player
+        seed = random.getrandbits(32)
+        if self.bot_workers > 0 and self.bot_think_time > 0:
+            if game.bid_stage:
+                wins, games = await self._bid_estimate(game, player_id, self.bot_think_time)
+                if games:
+                    return recommend_bid(wins, games, game.bid_score)
+                return decide(game, player_id, 0, seed)
+            try:
+                return await self._run_search(
+                    self.bot_think_time + BOT_GRACE, decide, game, player_id, self.bot_think_time, seed,
+                    session.tracker.copy())
+            except asyncio.TimeoutError:
+                logger.warning("斗地主机器人搜索超时，改用启发式出牌")
+            except BrokenProcessPool:
+                logger.warning("斗地主机器人进程池已损坏，改用启发式出牌")
+        return decide(game, player_id, 0, seed)
+
+    # 辅助方法：执行搜索
+    async def _run_search(self, timeout, func, *args):
+        """在搜索进程池中执行 func（没有搜索进程时在线程中执行），超时抛出 asyncio.TimeoutError；
+        进程池损坏时丢弃，下次重新创建"""
+        loop = asyncio.get_running_loop()
+        if self.bot_workers > 0:
+            if self._search_pool is None:
+                self._search_pool = ProcessPoolExecutor(max_workers=self.bot_workers)
+            future = loop.run_in_executor(self._search_pool, func, *args)
+        else:
+            future = loop.run_in_executor(None, func, *args)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except BrokenProcessPool:
+            self._search_pool = None
+            raise
+
+    # 辅助方法：绘制图片
+    async def _render_image(self, key):
+        """取出缓存的图片，没有时在绘制线程池中绘制；不绘制图片或绘制失败时返回 None"""
+        if self.renderer is None:
+            return None
+        png = self.renderer.cached(key)
+        if png is not None:
+            return png
+        if self._render_pool is None:
+            self._render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='doudizhu-render')
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._render_pool, self.renderer.render, key)
+        except Exception as e:
+            logger.warning(f"斗地主图片绘制失败: {e}")
+            return None
+
+    # 辅助方法：并行估计地主胜率
+    async def _bid_estimate(self, game, player_id, budget):
+        """把叫分模拟同时提交到每个搜索进程，合并为 (地主获胜局数, 模拟局数)"""
+        cards = tuple(game.hands[player_id])
+        deadline = time.time() + budget
+        results = await asyncio.gather(*(
+            self._run_search(budget + BOT_GRACE, estimate, cards, game.rules, deadline, random.getrandbits(32))
+            for _ in range(max(1, self.bot_workers))
+        ), return_exceptions=True)
+        wins = games = 0
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning(f"斗地主叫分模拟失败: {result!r}")
+                continue
+            wins += result[0]
+            games += result[1]
+        return wins, games
+
+    # 辅助方法：叫分建议的前置检查
+    def _bid_advice_error(self, session, user_id):
+        """不能给出叫分建议时返回原因，否则返回 None"""
+        if session is None or session.status != PLAYING:
+            return "当前没有进行中的游戏"
+        if not session.bid_stage:
+            return "当前不是抢地主阶段"
+        if user_id not in session.players:
+            return "您不在当前游戏中"
+        return None
+
+    # 辅助方法：必胜提示的前置检查
+    def _endgame_error(self, session, user_id):
+        """不能给出必胜提示时返回原因，否则返回 None"""
+        if session is None or session.status != PLAYING:
+            return "当前没有进行中的游戏"
+        if session.bid_stage:
+            return "当前不是出牌阶段"
+        if session.current_player != user_id:
+            return f"当前轮到 {session.players[session.current_player]} 出牌"
+        if not in_endgame(session):
+            return f"每位玩家都不超过 {ENDGAME_CARDS} 张牌时才能使用必胜提示"
+        return None
+
+    # 辅助方法：必胜提示文本
+    def _endgame_text(self, game, user_id, verdict):
+        """把求解结果 (是否必胜, 出牌) 转换为提示文本"""
+        if verdict is None:
+            return "残局计算量过大，暂时无法给出必胜提示"
+        win, move = verdict
+        action = "不出" if move is None else f"出牌 {self._format_cards(game.hands[user_id].pick(move.ranks))}"
+        if win:
+            return f"必胜提示：{action}（之后每一手都按最优应对即可获胜）"
+        return f"对手应对无误时无法取胜，建议：{action}"
+
+    # 辅助方法：手牌通知
+    def _hand_messages(self, session, player_ids=None, title="手牌"):
+        """在后台同时私聊发送手牌，返回不能私聊时要在群里发送的手牌消息"""
+        messages = []
+        for player_id in session.players if player_ids is None else player_ids:
+            if is_bot(player_id):
+                continue
+            cards_str = self._hand_text(session, player_id)
+            origin = self._hand_origin(session, player_id)
+            if origin is None:
+                messages.append(f"[私聊] {session.players[player_id]} 的{title}:\n{cards_str}")
+                continue
+            self._submit_private(session, player_id, origin, f"斗地主{title}:\n{cards_str}")
+        return messages
+
+    # 辅助方法：手牌的私聊来源
+    def _hand_origin(self, session, player_id):
+        """开启私聊发送手牌时玩家的私聊来源（手牌和记牌都按此发送），需要在群里发送时返回 None"""
+        if not self.private_hands or not session.origin or self._replaying:
+            return None
+        return private_origin(session.origins.get(player_id, session.origin), player_id)
+
+    # 辅助方法：私聊发送手牌或记牌
+    def _submit_private(self, session, player_id, origin, text, command="手牌"):
+        """在后台私聊发送，发送失败时只在群里提醒重新发送 command，不在群里展示内容
+
+        手牌和记牌分别按 (群, 玩家, 命令) 投递，新的手牌取代还没发出的旧手牌，不会取代记牌。
+        """
+        notice = f"无法私聊 {session.players[player_id]}，请添加好友后发送 '{command}' 重新私聊发送"
+        self.delivery.submit((session.group_id, player_id, command), origin, text,
+                             partial(self._send_group, session, [notice]))
+
+    # 辅助方法：主动发送私聊消息
+    async def _send_private(self, origin, text):
+        """按私聊来源发送消息（计入全局发送速率），平台不存在时返回 False"""
+        await self.outbox.throttle()
+        return await self._send_origin(origin, text)
+
+    # 辅助方法：记牌文本
+    def _tracker_text(self, session, player_id):
+        """其余两家合计的牌、可能的炸弹、各家剩余张数和出过的牌"""
+        tracker = session.tracker
+        hand = session.hands[player_id]
+        unseen = tracker.unseen_counts(hand)
+        rank_names = RANKS + (CARD_NAMES[-2], CARD_NAMES[-1])
+        remaining = ' '.join(
+            rank_names[rank] if unseen[rank] == 1 else f"{rank_names[rank]}×{unseen[rank]}"
+            for rank in reversed(range(RANK_SLOTS)) if unseen[rank]
+        )
+        # 叫分阶段地主牌还没有亮出，也算在看不到的牌中
+        label = "其余的牌（含地主牌）" if session.bid_stage else "其余两家的牌"
+        lines = [f"{label}：{remaining or '无'}"]
+        bombs = [rank_names[rank] for rank in reversed(tracker.bomb_ranks(hand))]
+        if tracker.rocket_possible(hand):
+            bombs.append("火箭")
+        lines.append(f"可能的炸弹：{'、'.join(bombs) or '无'}")
+        for other, name in session.players.items():
+            role = "（地主）" if other == tracker.landlord else ""
+            played = self._format_cards(tracker.played[other])
+            lines.append(f"{name}{role} 剩 {tracker.sizes[other]} 张，出过：{played}")
+        return "\n".join(lines)
+
+    # 辅助方法：手牌文本
+    def _hand_text(self, session, player_id):
+        """手牌和最少手数（重放日志时不计算手数；手数在事件循环中限量求解，没算完时不显示）"""
+        hand = session.hands[player_id]
+        cards_str = self._format_cards(hand)
+        if self._replaying:
+            return cards_str
+        hands = self.solvers[session.rules].min_hands(hand.counts, HAND_SOLVE_BUDGET)
+        if hands is None:
+            return f"{cards_str}\n最少手数还在计算，稍后发送 '手牌' 查看"
+        return f"{cards_str}\n最少 {hands} 手出完"
+
+    # 辅助方法：主动发送群消息
+    async def _send_group(self, session, messages):
+        """向牌局所在的群（匹配桌为每名玩家所在的群）发送消息，超出发送速率时排队合并发送"""
+        table_id = session.table_id
+        if session.group_id == MATCH_GROUP:
+            for origin in self.match_rooms.get(table_id, ()):
+                await self.outbox.deliver((table_id, origin), origin, self._label(table_id, messages))
+            return
+        if not session.origin:
+            return
+        await self.outbox.deliver(table_id, session.origin, self._label(table_id, messages))
+
+    # 辅助方法：主动发送消息
+    async def _send_origin(self, origin, text):
+        """按消息来源发送一条消息"""
+        return await self.context.send_message(origin, MessageChain().message(text))
+
+    # 辅助方法：命令回复
+    def _replies(self, event, table_id, messages):
+        """合并命令产生的消息，返回可以直接回复的消息；超出发送速率时改为排队发送，不直接回复"""
+        messages = self._label(table_id, messages)
+        key = table_id
+        if split_table_key(table_id)[0] == MATCH_GROUP:
+            # 匹配桌的消息同时发送到其他玩家所在的群，各群分别排队
+            key = (table_id, event.unified_msg_origin)
+            for origin in self.match_rooms.get(table_id, ()):
+                if origin != event.unified_msg_origin:
+                    self.outbox.post((table_id, origin), origin, messages)
+        replies = self.outbox.acquire(key, messages)
+        if not replies:
+            self.outbox.post(key, event.unified_msg_origin, messages)
+        return replies
+
+    # 辅助方法：发送限速的键
+    def _send_bucket(self, key):
+        """群里各桌的消息按群限速；匹配桌的队列键为 (桌, 消息来源)，按收到消息的群限速"""
+        if isinstance(key, tuple):
+            return key[1]
+        return split_table_key(key)[0]
+
+    # 辅助方法：标注桌号
+    def _label(self, table_id, messages):
+        """本群有多桌时在第一条消息前标注桌号"""
+        group_id, table = split_table_key(table_id)
+        if messages and group_id == MATCH_GROUP:
+            # 匹配桌的消息总是标注，与各群自己的桌区分
+            messages = [f"[匹配{table}号桌] {messages[0]}", *messages[1:]]
+        elif messages and (table != 1 or any(other != 1 for other in self.tables.tables(group_id))):
+            messages = [f"[{table}号桌] {messages[0]}", *messages[1:]]
+        return messages
+
+    # 辅助方法：桌的名称
+    def _table_name(self, table_id):
+        """用于提示的桌名，如 '2 号桌'、'匹配 3 号桌'"""
+        group_id, table = split_table_key(table_id)
+        return f"匹配 {table} 号桌" if group_id == MATCH_GROUP else f"{table} 号桌"
+
+    # 辅助方法：查找玩家所在的桌
+    def _seated_table(self, group_id, user_id):
+        """玩家在本群所在的桌，其次是所在的匹配桌（在任何群都可以操作），都不在时返回 None"""
+        table = self.tables.find(group_id, user_id)
+        if table is not None:
+            return table_key(group_id, table)
+        table = self.tables.find(MATCH_GROUP, user_id)
+        return None if table is None else table_key(MATCH_GROUP, table)
+
+    # 辅助方法：查找命令作用的桌
+    def _table_of(self, group_id, user_id):
+        """玩家所在的桌；不在任何一桌时为本群桌号最小的桌（没有牌局时为 1 号桌）"""
+        table_id = self._seated_table(group_id, user_id)
+        if table_id is None:
+            tables = self.tables.tables(group_id)
+            table_id = table_key(group_id, tables[0] if tables else 1)
+        return table_id
+
+    # 辅助方法：查找等待加入的桌
+    def _open_table(self, group_id):
+        """桌号最小的、等待加入且还有空位的桌；没有时为 1 号桌"""
+        for table in self.tables.tables(group_id):
+            session = self.sessions.get(table_key(group_id, table))
+            if session is not None and session.status == WAITING and len(session.players) < SEAT_COUNT:
+                return session.table_id
+        return table_key(group_id, 1)
+
+    # 辅助方法：加入命令
+    def _join_command(self, session):
+        """加入这一桌的命令，1 号桌不需要桌号"""
+        return "加入" if session.table == 1 else f"加入 {session.table}"
+
+    # 辅助方法：本群各桌概况
+    def _tables_text(self, group_id):
+        """列出本群所有桌的状态和玩家"""
+        lines = []
+        for table in self.tables.tables(group_id):
+            session = self.sessions[table_key(group_id, table)]
+            lines.append(f"{table} 号桌：{self._get_status_text(session)}，玩家 {', '.join(session.players.values())}")
+        lines.append("发送 '状态 桌号' 查看某一桌，发送 '加入' 坐到第一张等待加入的桌")
+        return f"本群共有 {len(lines) - 1} 桌游戏：\n" + "\n".join(lines)
+
+    # 辅助方法：匹配积分
+    def _match_rating(self, user_id):
+        """玩家在匹配桌累计的积分，没有积分记录时为 0"""
+        record = self.ledger.player(MATCH_GROUP, user_id) if self.ledger is not None else None
+        return record.score if record is not None else 0
+
+    # 辅助方法：匹配成桌
+    async def _form_match(self, tickets):
+        """在空闲的匹配桌号上发起、加入、开始，并通知每名玩家所在的群"""
+        # 排队期间已经在某个群坐下的玩家不能再开匹配桌，其余的人按原来的等待时间重新排队
+        seated = [ticket for ticket in tickets if self.tables.seat_of(ticket.player_id) is not None]
+        if seated:
+            for ticket in tickets:
+                if ticket not in seated:
+                    regrouped = self.matchmaker.enqueue(ticket.player_id, ticket.name, ticket.origin, ticket.rating,
+                                                        ticket.since)
+                    if regrouped is not None:
+                        await self._form_match(regrouped)
+            return
+        table_id = table_key(MATCH_GROUP, self.tables.free_table(MATCH_GROUP))
+        # 新桌号上没有牌局，发起到开始之间不等待，不会有其他命令插入
+        first, *others = tickets
+        self._act_start(table_id, first.player_id, first.name, first.origin, self.default_rules)
+        for ticket in others:
+            self._act_join(table_id, ticket.player_id, ticket.name, ticket.origin)
+        messages = self._act_begin(table_id)
+        session = self.sessions.get(table_id)
+        if session is None:
+            return
+        if session.status != PLAYING:
+            logger.warning(f"斗地主匹配开桌失败: {messages}")
+            self._release_session(table_id)
+            return
+        names = '、'.join(f"{ticket.name}（{ticket.rating:+d}）" for ticket in tickets)
+        await self._send_group(session, [f"匹配成功：{names}", *messages])
+
+    # 辅助方法：定期匹配
+    async def _sweep_matches(self):
+        """按等待时间放宽积分范围重新匹配，通知等待超时的玩家"""
+        if not len(self.matchmaker):
+            return
+        matches, expired = self.matchmaker.sweep(time.monotonic())
+        for tickets in matches:
+            await self._form_match(tickets)
+        for ticket in expired:
+            notice = f"{ticket.name} 等待匹配超时，已退出匹配队列"
+            self.outbox.post((MATCH_GROUP, ticket.origin), ticket.origin, [notice])
+
+    # 辅助方法：比赛名次
+    def _standings_text(self, tournament):
+        """比赛的轮次、进行中的桌和名次"""
+        if not tournament.started:
+            return f"比赛报名中，已报名 {len(tournament.names)} 人：{'、'.join(tournament.names.values())}\n发起者发送 '开始比赛' 开赛"
+        champion = tournament.champion
+        if champion is not None:
+            lines = [f"比赛结束！冠军：{tournament.names[champion]}"]
+        else:
+            lines = [f"第 {tournament.round} 轮：进行中 {len(tournament.running)} 桌，等待开桌 {len(tournament.waiting)} 组，已晋级 {len(tournament.advanced)} 人"]
+        lines.append("名次：")
+        for rank, (player_id, name, points, reached) in enumerate(tournament.standings(), 1):
+            lines.append(f"{rank}. {name}  第 {reached} 轮  {points:+d} 分")
+        return "\n".join(lines)
+
+    # 辅助方法：比赛开桌
+    def _fill_tournament(self, tournament):
+        """为等待开桌的分组开桌：组里的选手都空闲且本群还有空桌时发起、加入、由机器人补位并开始，
+        返回 [(牌局, 要发送的消息)]"""
+        group_id = tournament.group_id
+        started = []
+        for players in list(tournament.waiting):
+            if len(self.tables.tables(group_id)) >= self.max_tables:
+                break
+            if any(self._seated_table(group_id, player_id) is not None for player_id in players):
+                continue
+            # 新桌号上没有牌局，开桌到开始之间不等待，不会有其他命令插入
+            table_id = table_key(group_id, self.tables.free_table(group_id))
+            first, *others = players
+            self._act_start(table_id, first, tournament.names[first], tournament.origin, self.default_rules)
+            for player_id in others:
+                self._act_join(table_id, player_id, tournament.names[player_id])
+            while len(self.sessions[table_id].players) < SEAT_COUNT:
+                self._act_add_bot(table_id)
+            names = '、'.join(tournament.names[player_id] for player_id in players)
+            messages = [f"比赛第 {tournament.round} 轮：{names}"] + self._act_begin(table_id)
+            tournament.assign(table_id, players)
+            started.append((self.sessions[table_id], messages))
+        return started
+
+    # 辅助方法：推进比赛
+    async def _advance_tournament(self, group_id, notices=()):
+        """一轮结束时公布晋级并开始下一轮（决出冠军时公布名次），再为等待的分组开桌"""
+        tournament = self.tournaments.get(group_id)
+        if tournament is None:
+            return
+        notices = list(notices)
+        if tournament.round_over:
+            if tournament.champion is not None:
+                del self.tournaments[group_id]
+                notices.append(self._standings_text(tournament))
+            else:
+                if tournament.started:
+                    advanced = '、'.join(tournament.names[player_id] for player_id in tournament.advanced)
+                    notices.append(f"第 {tournament.round} 轮结束，晋级：{advanced}")
+                groups = tournament.next_round()
+                notices.append(f"比赛第 {tournament.round} 轮开始：{len(tournament.names) - len(tournament.eliminated)} 人分为 {len(groups)} 桌")
+        started = self._fill_tournament(tournament) if group_id in self.tournaments else []
+        if notices and tournament.origin:
+            await self.outbox.deliver(group_id, tournament.origin, notices)
+        for session, messages in started:
+            await self._send_group(session, messages)
+
+    # 辅助方法：比赛的一桌结束
+    def _table_closed(self, session):
+        """比赛的一桌结束时记录结果；本群有比赛时在后台推进赛程（空出的桌也可能让等待的分组开桌）"""
+        tournament = self.tournaments.get(session.group_id)
+        if tournament is None or not tournament.started or self._replaying:
+            return
+        notices = []
+        if session.table_id in tournament.running:
+            scores = session.scores() if session.winner is not None else {}
+            advancer = tournament.report(session.table_id, session.winner, scores)
+            notices.append(f"比赛 {session.table} 号桌结束，{tournament.names[advancer]} 晋级")
+        task = asyncio.get_running_loop().create_task(self._advance_tournament(session.group_id, notices))
+        self._tournament_tasks.add(task)
+        task.add_done_callback(self._tournament_tasks.discard)
+
+    # 辅助方法：释放牌局
+    def _release_session(self, table_id):
+        """游戏结束后释放这一桌占用的全部状态"""
+        session = self.sessions.pop(table_id, None)
+        if session is not None:
+            self._journal(OP_END, table_id)
+            self.tables.close(session.group_id, session.table, session.players)
+            self._table_closed(session)
+        self.timers.cancel((table_id, IDLE_TIMER))
+        self.timers.cancel((table_id, GAME_TIMER))
+        self.timers.cancel((table_id, TURN_TIMER))
+
+    # 辅助方法：刷新超时
+    def _touch(self, session, auto=False):
+        """重新设置回合超时；玩家主动操作时同时按当前阶段重设无人操作的超时"""
+        if self._replaying:
+            return
+        now = time.monotonic()
+        if session.status == WAITING:
+            phase = 'lobby'
+        elif session.bid_stage:
+            phase = 'bid'
+        else:
+            phase = 'play'
+        if not auto:
+            self.timers.schedule((session.table_id, IDLE_TIMER), self.phase_timeouts[phase], now)
+        if session.status == PLAYING and self.turn_timeout > 0:
+            self.timers.schedule((session.table_id, TURN_TIMER), self.turn_timeout, now)
+        self._schedule_bot(session)
+
+    # 辅助方法：超时处理循环
+    async def _reaper_loop(self):
+        """每个 tick 推进时间轮，处理到期的定时器"""
+        while True:
+            await asyncio.sleep(self.timers.resolution)
+            for table_id, kind in self.timers.advance(time.monotonic()):
+                try:
+                    await self._on_timer(table_id, kind)
+                except Exception as e:
+                    logger.error(f"斗地主超时处理失败: {e}")
+            try:
+                await self._sweep_matches()
+            except Exception as e:
+                logger.error(f"斗地主匹配失败: {e}")
+
+    # 辅助方法：处理到期的定时器
+    async def _on_timer(self, table_id, kind):
+        """回合超时时代为操作，其他超时结束牌局并通知群聊"""
+        async with self.locks.hold(table_id):
+            session = self.sessions.get(table_id)
+            if session is None:
+                return
+            if kind == TURN_TIMER:
+                messages = self._auto_act(session)
+            else:
+                status = self._get_status_text(session)
+                self._release_session(table_id)
+                if kind == GAME_TIMER:
+                    messages = ["斗地主游戏超过最长时间，已自动结束"]
+                else:
+                    messages = [f"斗地主游戏长时间无人操作（{status}），已自动结束"]
+        await self._send_group(session, messages)
+
+    # 辅助方法：记录结算结果
+    def _record_result(self, session, scores):
+        """把一局的得分记入积分账本（机器人不记个人战绩），重放日志时不再记录"""
+        if self.ledger is not None and not self._replaying:
+            names = {player_id: name for player_id, name in session.players.items() if not is_bot(player_id)}
+            self.ledger.record_game(session.group_id, names, session.landlord, scores, session.bid_score)
+
+    # 辅助方法：保存回放
+    def _save_replay(self, session):
+        """对局结束时编码回放，保存到群的最近对局并等待写入回放文件"""
+        record = encode_game(list(session.players.values()), int(time.time()), session.history)
+        recent = self.recent_replays.get(session.group_id)
+        if recent is None:
+            recent = self.recent_replays[session.group_id] = deque(maxlen=RECENT_REPLAYS)
+        recent.append(record)
+        if self.replay_archive and self.data_dir is not None and not self._replaying:
+            self._replay_buffer.append(record)
+
+    # 辅助方法：写入回放文件
+    async def _flush_replays(self):
+        """把等待写入的回放追加到回放文件"""
+        if not self._replay_buffer:
+            return
+        records = self._replay_buffer
+        self._replay_buffer = []
+        await asyncio.to_thread(write_replays, Path(self.data_dir) / 'replays.ddzr', records)
+
+    # 辅助方法：后台写入循环
+    async def _writer_loop(self):
+        """定期把积分变动和回放记录批量写入磁盘"""
+        while True:
+            await asyncio.sleep(WRITER_INTERVAL)
+            try:
+                if self.ledger is not None:
+                    await self.ledger.flush()
+                await self._flush_replays()
+            except Exception as e:
+                logger.error(f"斗地主积分和回放写入失败: {e}")
+
+    # 辅助方法：回放文本
+    def _replay_lines(self, replay):
+        """把一局回放逐步转换为文本，每个操作一行"""
+        names = replay.names
+        lines = [f"回放：{time.strftime('%Y-%m-%d %H:%M', time.localtime(replay.ended_at))} 结束的对局"]
+        step = 0
+        for action, game, result in replay_steps(replay):
+            name = names[action.seat]
+            if action.tag == TAG_RULES:
+                lines.append(f"玩法：{RULE_SETS[action.rules].label}")
+                continue
+            if action.tag == TAG_DEAL:
+                lines.append("发牌：")
+                for seat, player_name in enumerate(names):
+                    lines.append(f"  {player_name}: {self._format_cards(game.hands[seat])}")
+                lines.append(f"  地主牌: {self._format_cards(game.landlord_cards)}")
+                continue
+            step += 1
+            if action.tag == TAG_BID:
+                line = f"{step}. {name} 叫 {action.score} 分"
+            elif action.tag == TAG_NO_BID:
+                line = f"{step}. {name} 不叫"
+            elif action.tag == TAG_PLAY:
+                line = f"{step}. {name} 出牌：{self._format_cards(action.cards)}（剩 {len(game.hands[action.seat])} 张）"
+            else:
+                line = f"{step}. {name} 不出"
+            if result == LANDLORD:
+                line += f"\n{names[game.landlord]} 成为地主，分数：{game.bid_score}分"
+            elif result == REDEAL:
+                line += "\n没有人叫分，重新发牌"
+            elif result == WIN:
+                winner = "地主" if game.winner == game.landlord else "农民"
+                line += f"\n{name} 出完手牌，{winner}胜利！"
+            lines.append(line)
+        return lines
+
+    # 辅助方法：各阶段牌局数
+    def _phase_counts(self):
+        """统计等待加入、叫分、出牌阶段的牌局数"""
+        phases = {'lobby': 0, 'bid': 0, 'play': 0}
+        for session in self.sessions.values():
+            if session.status == WAITING:
+                phases['lobby'] += 1
+            elif session.bid_stage:
+                phases['bid'] += 1
+            else:
+                phases['play'] += 1
+        return phases
+
+    # 辅助方法：导出统计
+    def _prometheus_text(self):
+        """生成 Prometheus 文本格式的统计，包括牌局数等实时指标"""
+        gauges = [('sessions', "live sessions by phase", {'phase': phase}, count)
+                  for phase, count in self._phase_counts().items()]
+        gauges.append(('locks', "group locks held or awaited", {}, len(self.locks)))
+        gauges.append(('timers', "pending timers", {}, len(self.timers)))
+        gauges.append(('private_sends', "private messages delivered", {'result': 'sent'}, self.delivery.sent))
+        gauges.append(('private_sends', "private messages delivered", {'result': 'failed'}, self.delivery.failures))
+        gauges.append(('private_send_retries', "private message retries", {}, self.delivery.retries))
+        gauges.append(('private_sends_in_flight', "private messages pending", {}, len(self.delivery)))
+        gauges.append(('group_sends', "group messages sent", {}, self.outbox.sent))
+        gauges.append(('group_messages_merged', "group messages merged into another send", {}, self.outbox.merged))
+        gauges.append(('group_messages_queued', "group messages queued by the rate limit", {}, self.outbox.queued))
+        gauges.append(('group_prompts_collapsed', "stale prompt lines dropped from the queue", {}, self.outbox.collapsed))
+        gauges.append(('group_messages_pending', "group messages waiting to be sent", {}, len(self.outbox)))
+        gauges.append(('match_queue', "players waiting in the match queue", {}, len(self.matchmaker)))
+        gauges.append(('matches_formed', "tables formed by the match queue", {}, self.matchmaker.matched))
+        gauges.append(('match_expired', "players dropped from the match queue after waiting too long", {}, self.matchmaker.expired))
+        gauges.append(('tournaments', "tournaments in progress", {}, len(self.tournaments)))
+        if self.renderer is not None:
+            for cache, lru in (('png', self.renderer.pngs), ('tile', self.renderer.tiles)):
+                gauges.append(('render_cache_lookups', "image cache lookups", {'cache': cache, 'result': 'hit'}, lru.hits))
+                gauges.append(('render_cache_lookups', "image cache lookups", {'cache': cache, 'result': 'miss'}, lru.misses))
+        if self.journal is not None:
+            gauges.append(('journal_records', "journal records since last snapshot", {}, self.journal.records))
+        return self.metrics.prometheus(gauges)
+
+    # 辅助方法：统计导出循环
+    async def _metrics_loop(self):
+        """定期把统计写入数据目录下的 metrics.prom"""
+        path = Path(self.data_dir) / 'metrics.prom'
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            try:
+                await asyncio.to_thread(self._write_metrics, path, self._prometheus_text())
+            except Exception as e:
+                logger.error(f"斗地主统计导出失败: {e}")
+
+    # 辅助方法：写入统计文件
+    def _write_metrics(self, path, text):
+        """先写临时文件再替换，读取方不会看到写了一半的文件"""
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(text, encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    # 辅助方法：记录日志
+    def _journal(self, op, table_id, *fields):
+        """把被接受的命令追加到牌局日志（按桌记录），重放日志时不再记录"""
+        if self.journal is not None and not self._replaying:
+            self.journal.append(op, table_id, *fields)
+
+    # 辅助方法：快照内容
+    def _snapshot_state(self):
+        """各桌牌局与实时对象脱离的状态，由日志在线程中序列化"""
+        # 取状态只产生无环的临时对象，暂停循环垃圾回收，避免在此触发遍历所有牌局的完整回收
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return {table_id: session.__getstate__() for table_id, session in self.sessions.items()}
+        finally:
+            if enabled:
+                gc.enable()
+
+    # 辅助方法：恢复牌局
+    def _restore_sessions(self):
+        """加载快照并重放之后的日志"""
+        start = time.perf_counter()
+        # 恢复期间只新建对象，暂停循环垃圾回收可以明显加快加载
+        enabled = gc.isenabled()
+        gc.disable()
+        self._replaying = True
+        try:
+            state, records = self.journal.recover()
+            if state:
+                self.sessions = {table_id: GameSession.from_state(value) for table_id, value in state.items()}
+                for session in self.sessions.values():
+                    self.tables.open(session.group_id, session.table)
+                    for player_id in session.players:
+                        if not is_bot(player_id):
+                            self.tables.seat(session.group_id, player_id, session.table)
+                    if session.origins:
+                        self.match_rooms[session.table_id] = tuple(dict.fromkeys(session.origins.values()))
+            for record in records:
+                self._replay(record)
+                # 重放过的记录计入下一次快照的阈值，日志较长时尽快生成快照
+                self.journal.records += 1
+        finally:
+            self._replaying = False
+            if enabled:
+                gc.enable()
+            # 重放产生的耗时不计入统计
+            self.metrics = Metrics()
+        # 恢复完成后统一重新设置超时
+        now = time.monotonic()
+        for session in self.sessions.values():
+            if session.status == PLAYING:
+                self.timers.schedule((session.table_id, GAME_TIMER), self.game_timeout, now)
+            self._touch(session)
+        if self.sessions:
+            logger.info(f"斗地主恢复了 {len(self.sessions)} 局游戏，用时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # 辅助方法：重放一条日志
+    def _replay(self, record):
+        """按日志记录重新执行命令，和实时命令走同一套规则"""
+        op, table_id, *fields = record
+        if op == OP_START:
+            user_id, user_name, origin, rules = fields
+            self._act_start(table_id, user_id, user_name, origin or None, rules)
+        elif op == OP_JOIN:
+            self._act_join(table_id, *fields)
+        elif op == OP_BEGIN:
+            self._act_begin(table_id, seed=fields[0])
+        elif op == OP_END:
+            self._release_session(table_id)
+        else:
+            session = self.sessions.get(table_id)
+            if session is None:
+                return
+            if op == OP_BID:
+                self._act_bid(session, *fields)
+            elif op == OP_NO_BID:
+                self._act_no_bid(session, *fields)
+            elif op == OP_PLAY:
+                user_id, card_ids = fields
+                self._act_play(session, user_id, list(card_ids))
+            elif op == OP_PASS:
+                self._act_pass(session, *fields)
+
+    # 辅助方法：日志刷盘循环
+    async def _journal_loop(self):
+        """定期批量刷盘，并按间隔或日志长度生成快照、截断日志"""
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(self.journal.flush_interval)
+            try:
+                if (time.monotonic() - last_snapshot >= self.snapshot_interval
+                        or self.journal.records >= SNAPSHOT_RECORDS):
+                    await self.journal.snapshot(self._snapshot_state)
+                    last_snapshot = time.monotonic()
+                else:
+                    await self.journal.flush()
+            except Exception as e:
+                logger.error(f"斗地主日志写入失败: {e}")
+
+    # 辅助方法：牌局随机数
+    def _session_random(self, session, salt):
+        """由发牌种子、发牌次数和用途派生的随机数生成器，重放日志时结果一致"""
+        return random.Random((session.seed << 20) | (session.deals << 4) | salt)
+
+    # 辅助方法：初始化游戏
+    def _init_game(self, session):
+        """洗牌、发牌，并随机选择一个玩家开始叫分"""
+        session.deals += 1
+        session.hints = None
+        deck = new_deck(self._session_random(session, 0))
+        start_player = self._session_random(session, 1).choice(list(session.players))
+        session.deal(deck, start_player)
+        put_deal(session.history, session.seat_index(start_player), deck)
+
+    # 辅助方法：结束叫分阶段
+    def _end_bidding(self, session, auto=False):
+        """叫分结束、地主已确定，返回要发送的消息"""
+        landlord_id = session.landlord
+        self._touch(session, auto)
         
         # 输出结果
-        landlord_name = self.players[group_id][landlord_id]
-        score = self.game_data[group_id]['bid_score']
+        landlord_name = session.players[landlord_id]
+        score = session.bid_score
         
         result = f"{landlord_name} 成为地主，分数：{score}分！\n"
-        result += f"地主牌：{self._format_cards(landlord_cards)}\n"
+        result += f"地主牌：{self._format_cards(session.landlord_cards)}\n"
         result += f"请 {landlord_name} 出牌"
         
         # 更新地主的手牌信息
-        cards_str = self._format_cards(self.player_cards[group_id][landlord_id])
-        yield event.plain_result(f"[私聊] {landlord_name} 的手牌更新:\n{cards_str}")
-        
-        yield event.plain_result(result)
+        return self._hand_messages(session, (landlord_id,), "手牌更新") + [result]
 
-    # 辅助方法：下一个玩家
-    def _next_player(self, group_id):
-        """轮到下一个玩家"""
-        player_ids = list(self.players[group_id].keys())
-        current_index = player_ids.index(self.game_data[group_id]['current_player'])
-        next_index = (current_index + 1) % len(player_ids)
-        self.game_data[group_id]['current_player'] = player_ids[next_index]
+    # 辅助方法：无牌可出提示
+    def _no_move_notice(self, session):
+        """当前玩家没有能大过上家的牌时，返回建议不出的提示文本"""
+        player_id = session.current_player
+        last_pattern = session.required_pattern(player_id)
+        if last_pattern is None or self._replaying:
+            return ""
+        if self.move_tables[session.rules].has_move(session.hands[player_id].counts, last_pattern):
+            return ""
+        return f"\n{session.players[player_id]} 没有能大过上家的牌，可发送 '不出'"
 
     # 辅助方法：获取游戏状态文本
-    def _get_status_text(self, group_id):
+    def _get_status_text(self, session):
         """获取游戏状态文本"""
-        status = self.game_status[group_id]
-        if status == 0:
-            return "未开始"
-        elif status == 1:
+        if session.status == WAITING:
             return "等待加入"
-        elif status == 2:
-            if self.game_data[group_id].get('bid_stage', False):
+        elif session.status == PLAYING:
+            if session.bid_stage:
                 return "叫分阶段"
             else:
                 return "出牌阶段"
@@ -677,180 +2084,51 @@ class DouDiZhuPlugin(Star):
 
     # 辅助方法：格式化牌
     def _format_cards(self, cards):
-        """格式化牌"""
+        """格式化牌：手牌或牌编号序列"""
         if not cards:
             return "无"
-        return " ".join(cards)
+        return format_cards(cards)
 
     # 辅助方法：解析牌
     def _parse_cards(self, cards_str):
-        """解析牌"""
+        """解析牌，返回牌编号或只给出点数的记号，无法识别时返回 None"""
         if not cards_str:
             return []
-        return cards_str.split()
-
-    # 辅助方法：检查玩家是否有这些牌
-    def _has_cards(self, group_id, player_id, cards):
-        """检查玩家是否有这些牌"""
-        player_cards = self.player_cards[group_id][player_id].copy()
-        for card in cards:
-            if card in player_cards:
-                player_cards.remove(card)
-            else:
-                return False
-        return True
-
-    # 辅助方法：移除玩家的牌
-    def _remove_cards(self, group_id, player_id, cards):
-        """移除玩家的牌"""
-        for card in cards:
-            self.player_cards[group_id][player_id].remove(card)
-
-    # 辅助方法：获取牌的排序键
-    def _card_sort_key(self, card):
-        """获取牌的排序键"""
-        if card == 'joker':
-            return (16, 0)
-        elif card == 'JOKER':
-            return (17, 0)
-        else:
-            suit = card[0]
-            rank = card[1:]
-            suit_value = {'♠': 3, '♥': 2, '♦': 1, '♣': 0}.get(suit, 0)
-            rank_value = self.card_values.get(rank, 0)
-            return (rank_value, suit_value)
-
-    # 辅助方法：获取牌型
-    def _get_card_type(self, cards):
-        """获取牌型和牌值"""
-        if not cards:
-            return None, None
-            
-        # 统计牌的数量
-        card_count = {}
-        for card in cards:
-            if card == 'joker' or card == 'JOKER':
-                rank = card
-            else:
-                rank = card[1:]
-            card_count[rank] = card_count.get(rank, 0) + 1
-            
-        # 获取牌的值
-        card_values = []
-        for card in cards:
-            if card == 'joker' or card == 'JOKER':
-                rank = card
-            else:
-                rank = card[1:]
-            card_values.append(self.card_values.get(rank, 0))
-            
-        # 火箭（大小王）
-        if len(cards) == 2 and 'joker' in card_count and 'JOKER' in card_count:
-            return self.card_types['rocket'], 0
-            
-        # 炸弹（四张相同点数的牌）
-        if len(cards) == 4 and len(card_count) == 1:
-            return self.card_types['bomb'], card_values[0]
-            
-        # 单牌
-        if len(cards) == 1:
-            return self.card_types['single'], card_values[0]
-            
-        # 对子
-        if len(cards) == 2 and len(card_count) == 1:
-            return self.card_types['pair'], card_values[0]
-            
-        # 三张
-        if len(cards) == 3 and len(card_count) == 1:
-            return self.card_types['trio'], card_values[0]
-            
-        # 三带一
-        if len(cards) == 4 and len(card_count) == 2:
-            for rank, count in card_count.items():
-                if count == 3:
-                    return self.card_types['trio_single'], self.card_values.get(rank, 0)
-                    
-        # 三带二
-        if len(cards) == 5 and len(card_count) == 2:
-            for rank, count in card_count.items():
-                if count == 3:
-                    return self.card_types['trio_pair'], self.card_values.get(rank, 0)
-                    
-        # 顺子（五张或更多的连续单牌）
-        if len(cards) >= 5 and len(card_count) == len(cards) and max(card_values) <= 14:  # 不能超过A
-            card_values.sort()
-            is_straight = True
-            for i in range(1, len(card_values)):
-                if card_values[i] != card_values[i-1] + 1:
-                    is_straight = False
-                    break
-            if is_straight:
-                return self.card_types['straight'], card_values[0]
-                
-        # 连对（三对或更多的连续对子）
-        if len(cards) >= 6 and len(cards) % 2 == 0 and len(card_count) == len(cards) // 2 and max(card_values) <= 14:  # 不能超过A
-            # 检查是否都是对子
-            is_pairs = True
-            for count in card_count.values():
-                if count != 2:
-                    is_pairs = False
-                    break
-                    
-            if is_pairs:
-                # 检查是否连续
-                unique_values = sorted(set(card_values))
-                is_consecutive = True
-                for i in range(1, len(unique_values)):
-                    if unique_values[i] != unique_values[i-1] + 1:
-                        is_consecutive = False
-                        break
-                if is_consecutive:
-                    return self.card_types['pairs'], unique_values[0]
-                    
-        # 飞机（两个或更多的连续三张）
-        if len(cards) >= 6 and len(cards) % 3 == 0:
-            # 检查是否都是三张
-            trio_ranks = []
-            for rank, count in card_count.items():
-                if count == 3:
-                    trio_ranks.append(rank)
-                    
-            if len(trio_ranks) == len(cards) // 3:
-                # 检查是否连续
-                trio_values = [self.card_values.get(rank, 0) for rank in trio_ranks]
-                trio_values.sort()
-                is_consecutive = True
-                for i in range(1, len(trio_values)):
-                    if trio_values[i] != trio_values[i-1] + 1:
-                        is_consecutive = False
-                        break
-                if is_consecutive:
-                    return self.card_types['plane'], trio_values[0]
-                    
-        # 不符合任何牌型
-        return None, None
-
-    # 辅助方法：检查是否可以大过上一手牌
-    def _can_beat(self, card_type, card_value, last_type, last_value):
-        """检查是否可以大过上一手牌"""
-        # 火箭可以大过任何牌
-        if card_type == self.card_types['rocket']:
-            return True
-            
-        # 炸弹可以大过除火箭外的任何牌
-        if card_type == self.card_types['bomb']:
-            if last_type == self.card_types['rocket']:
-                return False
-            if last_type == self.card_types['bomb']:
-                return card_value > last_value
-            return True
-            
-        # 其他牌型必须相同，且牌值更大
-        if card_type == last_type:
-            return card_value > last_value
-            
-        return False
+        return parse_cards(cards_str)
 
     async def terminate(self):
         """插件销毁方法，当插件被卸载/停用时会调用。"""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        if self._journal_task is not None:
+            self._journal_task.cancel()
+            self._journal_task = None
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            self._metrics_task = None
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        for task in list(self._bot_tasks.values()):
+            task.cancel()
+        self._bot_tasks.clear()
+        for task in list(self._tournament_tasks):
+            task.cancel()
+        self._tournament_tasks.clear()
+        self.matchmaker.clear()
+        if self._search_pool is not None:
+            self._search_pool.shutdown(wait=False, cancel_futures=True)
+            self._search_pool = None
+        if self._render_pool is not None:
+            self._render_pool.shutdown(wait=False, cancel_futures=True)
+            self._render_pool = None
+        await self._flush_replays()
+        await self.delivery.close()
+        await self.outbox.close()
+        if self.ledger is not None:
+            await self.ledger.close()
+        if self.journal is not None:
+            await self.journal.snapshot(self._snapshot_state)
+            await self.journal.close()
         logger.info("斗地主插件已卸载")
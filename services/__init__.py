@@ -0,0 +1 @@
+"""插件运行时服务（定时、持久化等），不依赖 AstrBot"""
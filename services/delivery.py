@@ -0,0 +1,98 @@
+"""私聊消息投递
+
+发牌时同时向三名玩家私聊发送手牌。每条消息是一个后台任务，全局信号量限制同时
+进行的发送数；发送抛出异常视为暂时失败，按指数退避重试；平台不存在或重试用完
+后调用失败回调（例如在群里提示玩家添加好友）。投递不阻塞牌局流程。
+
+同一个键（如 (群, 玩家)）的新消息会取代还没发出的旧消息，重新发牌后不会再收到
+上一副牌的手牌。
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set
+
+# 同时进行的发送数上限
+MAX_IN_FLIGHT = 8
+# 每条消息的最多尝试次数
+MAX_ATTEMPTS = 3
+# 第一次重试前的等待时间（秒），之后每次加倍
+RETRY_DELAY = 0.5
+
+
+def private_origin(group_origin: str, user_id) -> Optional[str]:
+    """由群聊的消息来源（平台:GroupMessage:群号）得到同一平台上与该用户的私聊来源"""
+    parts = group_origin.split(':', 2) if group_origin else ()
+    if len(parts) != 3:
+        return None
+    return f"{parts[0]}:FriendMessage:{user_id}"
+
+
+class PrivateDelivery:
+    """后台私聊投递：限制并发、重试暂时失败、最新消息优先"""
+
+    __slots__ = ('send', 'max_attempts', 'retry_delay', '_slots', '_versions', '_tasks',
+                 'sent', 'retries', 'failures')
+
+    def __init__(self, send: Callable[[str, str], Awaitable[bool]], max_in_flight: int = MAX_IN_FLIGHT,
+                 max_attempts: int = MAX_ATTEMPTS, retry_delay: float = RETRY_DELAY):
+        # send(origin, text)，平台不存在时返回 False，发送失败时抛出异常
+        self.send = send
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # 每个键最新消息的版本号
+        self._versions: Dict[Hashable, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.sent = 0
+        self.retries = 0
+        self.failures = 0
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def submit(self, key: Hashable, origin: str, text: str,
+               on_failure: Optional[Callable[[], Awaitable]] = None):
+        """在后台投递一条消息，取代同一个键还没发出的消息"""
+        version = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        task = asyncio.get_running_loop().create_task(self._deliver(key, version, origin, text, on_failure))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _stale(self, key, version) -> bool:
+        return self._versions.get(key) != version
+
+    async def _deliver(self, key, version, origin, text, on_failure):
+        try:
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    self.retries += 1
+                    await asyncio.sleep(self.retry_delay * (1 << (attempt - 1)))
+                if self._stale(key, version):
+                    return
+                async with self._slots:
+                    if self._stale(key, version):
+                        return
+                    try:
+                        delivered = await self.send(origin, text)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:
+                        continue
+                if delivered is False:
+                    break
+                self.sent += 1
+                return
+            self.failures += 1
+            if on_failure is not None and not self._stale(key, version):
+                await on_failure()
+        finally:
+            if not self._stale(key, version):
+                del self._versions[key]
+
+    async def close(self):
+        """取消还没完成的投递"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._versions.clear()
@@ -0,0 +1,277 @@
+"""牌局日志：追加写入的二进制命令记录 + 定期快照
+
+每条被接受的命令编码为一条紧凑的二进制记录追加到当前代的日志文件，
+记录先进入内存缓冲区，由后台任务定期调用 flush 批量写入并 fsync。定期把所有进行中的牌局
+写成快照，快照写入成功后开始新一代日志并删除旧日志，恢复时只需加载快照
+再重放之后的日志。事件循环上只取得与实时对象脱离的各项状态，序列化和写入都在线程中分批完成。
+
+文件布局（目录下）：
+    snapshot.bin            快照：魔数、代号、CRC，之后每批为 长度(u32) + pickle 的 [(键, 状态), ...]
+    journal.<代号>.log      日志：每条记录为 长度(u32) + CRC(u32) + 内容
+    snapshot.bad            恢复时无法识别（魔数或 CRC 不符、长度不足）而改名保留的快照
+
+记录内容为操作码(u8) + 字段，字段按操作码的格式依次编码：
+    s 字符串（varint 长度 + UTF-8），i 无符号整数（varint），b 字节串（varint 长度 + 原始字节）
+"""
+import asyncio
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# 操作码
+OP_START = 1   # 发起游戏：群、玩家、昵称、消息来源、玩法
+OP_JOIN = 2    # 加入游戏：群、玩家、昵称、消息来源（跨群匹配时为玩家所在的群）
+OP_BEGIN = 3   # 开始游戏：群、发牌种子
+OP_BID = 4     # 叫分：群、玩家、分数
+OP_NO_BID = 5  # 不叫：群、玩家
+OP_PLAY = 6    # 出牌：群、玩家、牌编号
+OP_PASS = 7    # 不出：群、玩家
+OP_END = 8     # 牌局结束：群
+
+# 各操作码的字段格式（不含第一个字段“群”）
+OP_FIELDS = {
+    OP_START: 'ssss',
+    OP_JOIN: 'sss',
+    OP_BEGIN: 'i',
+    OP_BID: 'si',
+    OP_NO_BID: 's',
+    OP_PLAY: 'sb',
+    OP_PASS: 's',
+    OP_END: '',
+}
+
+# 自上次快照以来的记录数达到该值时提前生成快照，限制恢复时需要重放的日志长度
+SNAPSHOT_RECORDS = 20000
+
+# 快照格式变化时更换魔数，不同格式的快照不会被加载
+SNAPSHOT_MAGIC = b'DDZ2'
+SNAPSHOT_NAME = 'snapshot.bin'
+# 无法识别的快照改名保留，不直接丢弃
+BAD_SNAPSHOT_NAME = 'snapshot.bad'
+RECORD_HEADER = struct.Struct('<II')
+SNAPSHOT_HEADER = struct.Struct('<4sII')
+SNAPSHOT_CHUNK = struct.Struct('<I')
+# 快照每批序列化的项数，批与批之间写入线程让出 GIL
+SNAPSHOT_BATCH = 256
+
+
+def _put_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_record(op: int, group_id: str, *fields) -> bytes:
+    """编码一条记录（含长度和 CRC）"""
+    payload = bytearray((op,))
+    raw = group_id.encode('utf-8')
+    _put_varint(payload, len(raw))
+    payload += raw
+    for kind, value in zip(OP_FIELDS[op], fields):
+        if kind == 'i':
+            _put_varint(payload, value)
+            continue
+        raw = value.encode('utf-8') if kind == 's' else bytes(value)
+        _put_varint(payload, len(raw))
+        payload += raw
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_payload(payload) -> tuple:
+    """解码记录内容，返回 (操作码, 群, 字段...)"""
+    op = payload[0]
+    values = [op]
+    pos = 1
+    for kind in 's' + OP_FIELDS[op]:
+        if kind == 'i':
+            value, pos = _get_varint(payload, pos)
+            values.append(value)
+            continue
+        size, pos = _get_varint(payload, pos)
+        raw = bytes(payload[pos:pos + size])
+        pos += size
+        values.append(raw.decode('utf-8') if kind == 's' else raw)
+    return tuple(values)
+
+
+def read_records(path: Path) -> Iterator[tuple]:
+    """以内存映射方式读取日志文件，遇到不完整或损坏的记录时停止"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            while pos + RECORD_HEADER.size <= size:
+                length, crc = RECORD_HEADER.unpack_from(data, pos)
+                start = pos + RECORD_HEADER.size
+                end = start + length
+                if end > size:
+                    return
+                payload = data[start:end]
+                if zlib.crc32(payload) != crc:
+                    return
+                yield decode_payload(payload)
+                pos = end
+
+
+class Journal:
+    """日志写入与恢复"""
+
+    def __init__(self, directory, flush_interval: float = 0.2, on_warning: Optional[Callable[[str], None]] = None):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        # 恢复时发现异常（例如快照无法识别）时调用 on_warning(说明)，例如记录日志
+        self.on_warning = on_warning
+        # 当前日志代号
+        self.generation = 0
+        # 等待写入的记录
+        self._buffer = bytearray()
+        # 自上次快照以来追加的记录数
+        self.records = 0
+        self._file = None
+        self._file_generation = None
+        self._io_lock = asyncio.Lock()
+
+    def _journal_path(self, generation: int) -> Path:
+        return self.directory / f"journal.{generation}.log"
+
+    def _journal_generations(self) -> List[int]:
+        generations = []
+        for path in self.directory.glob('journal.*.log'):
+            try:
+                generations.append(int(path.name.split('.')[1]))
+            except ValueError:
+                continue
+        return sorted(generations)
+
+    def recover(self) -> Tuple[Optional[dict], Iterator[tuple]]:
+        """读取快照和之后的日志，返回 ({键: 状态}, 记录迭代器)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        state = None
+        snapshot_generation = -1
+        snapshot_path = self.directory / SNAPSHOT_NAME
+        if snapshot_path.exists():
+            data = snapshot_path.read_bytes()
+            magic = generation = crc = None
+            if len(data) >= SNAPSHOT_HEADER.size:
+                magic, generation, crc = SNAPSHOT_HEADER.unpack_from(data)
+            body = memoryview(data)[SNAPSHOT_HEADER.size:]
+            if magic != SNAPSHOT_MAGIC or zlib.crc32(body) != crc:
+                # 快照覆盖的日志已经删除，改名保留以便排查，不能悄悄丢弃
+                bad_path = self.directory / BAD_SNAPSHOT_NAME
+                os.replace(snapshot_path, bad_path)
+                if self.on_warning is not None:
+                    reason = "格式不符" if magic != SNAPSHOT_MAGIC else "校验失败"
+                    self.on_warning(f"快照{reason}，已改名为 {bad_path}，其中的牌局无法恢复")
+            else:
+                state = {}
+                pos = 0
+                while pos < len(body):
+                    size, = SNAPSHOT_CHUNK.unpack_from(body, pos)
+                    pos += SNAPSHOT_CHUNK.size
+                    state.update(pickle.loads(body[pos:pos + size]))
+                    pos += size
+                snapshot_generation = generation
+        generations = [g for g in self._journal_generations() if g > snapshot_generation]
+        self.generation = max([snapshot_generation] + generations) + 1
+
+        def records():
+            for generation in generations:
+                yield from read_records(self._journal_path(generation))
+
+        return state, records()
+
+    def append(self, op: int, group_id: str, *fields):
+        """追加一条记录到缓冲区"""
+        self._buffer += encode_record(op, group_id, *fields)
+        self.records += 1
+
+    def _write(self, data: bytes, generation: int):
+        """写入并落盘（在线程中执行）"""
+        if self._file is None or self._file_generation != generation:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self._journal_path(generation), 'ab')
+            self._file_generation = generation
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def flush(self):
+        """把缓冲区中的记录写入当前日志并 fsync"""
+        async with self._io_lock:
+            if not self._buffer:
+                return
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            await asyncio.to_thread(self._write, data, self.generation)
+
+    async def snapshot(self, capture: Callable[[], Dict[str, object]]):
+        """写入快照并切换到新一代日志，随后删除旧日志
+
+        取得写入锁后调用 capture 得到 {键: 状态}，与缓冲区的截断在同一时刻完成，
+        此后追加的记录都进入新一代日志。各项状态必须与实时对象脱离，序列化在线程中进行。
+        """
+        async with self._io_lock:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            self.records = 0
+            old_generation = self.generation
+            state = capture()
+            self.generation += 1
+            await asyncio.to_thread(self._write_snapshot, data, old_generation, state)
+
+    def _write_snapshot(self, pending: bytes, old_generation: int, state: Dict[str, object]):
+        """先落盘旧日志的剩余记录，再原子替换快照，最后删除被快照覆盖的日志
+
+        分批序列化，批与批之间线程可以让出 GIL，不会长时间阻塞事件循环。
+        """
+        if pending:
+            self._write(pending, old_generation)
+        items = list(state.items())
+        chunks = []
+        for start in range(0, len(items), SNAPSHOT_BATCH):
+            chunk = pickle.dumps(items[start:start + SNAPSHOT_BATCH], protocol=pickle.HIGHEST_PROTOCOL)
+            chunks.append(SNAPSHOT_CHUNK.pack(len(chunk)))
+            chunks.append(chunk)
+        body = b''.join(chunks)
+        tmp_path = self.directory / (SNAPSHOT_NAME + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, old_generation, zlib.crc32(body)))
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.directory / SNAPSHOT_NAME)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_generation = None
+        for generation in self._journal_generations():
+            if generation <= old_generation:
+                self._journal_path(generation).unlink(missing_ok=True)
+
+    async def close(self):
+        """刷盘并关闭文件"""
+        await self.flush()
+        async with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,207 @@
+"""积分账本：玩家积分、按角色的胜负和群内排行
+
+战绩常驻内存，结算时只修改内存并把变动的玩家标记为待写入，由后台任务定期调用
+flush 在线程中批量写入 SQLite（WAL 模式），同一玩家多次变动只写一次，结算不会
+在事件循环中等待磁盘。每个群的排行榜缓存前 N 名，积分变动时增量调整，只有
+榜上玩家的排名可能被榜外玩家超过时才作废，下次查询时重新计算。
+"""
+import asyncio
+import heapq
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    group_id TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    landlord_games INTEGER NOT NULL,
+    landlord_wins INTEGER NOT NULL,
+    farmer_games INTEGER NOT NULL,
+    farmer_wins INTEGER NOT NULL,
+    PRIMARY KEY (group_id, player_id)
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id TEXT NOT NULL,
+    ended_at REAL NOT NULL,
+    landlord TEXT NOT NULL,
+    bid_score INTEGER NOT NULL,
+    landlord_win INTEGER NOT NULL
+);
+"""
+
+RECORD_FIELDS = (
+    'name', 'score', 'games', 'wins', 'landlord_games', 'landlord_wins', 'farmer_games', 'farmer_wins',
+)
+
+
+class PlayerRecord:
+    """一名玩家在一个群（或全部群合计）的战绩"""
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, name='', score=0, games=0, wins=0, landlord_games=0, landlord_wins=0,
+                 farmer_games=0, farmer_wins=0):
+        self.name = name
+        self.score = score
+        self.games = games
+        self.wins = wins
+        self.landlord_games = landlord_games
+        self.landlord_wins = landlord_wins
+        self.farmer_games = farmer_games
+        self.farmer_wins = farmer_wins
+
+    def rank_key(self):
+        """排行依据：积分、胜场，越大越靠前"""
+        return self.score, self.wins
+
+
+class Ledger:
+    """积分账本"""
+
+    def __init__(self, path, top_size: int = 10):
+        self.path = Path(path)
+        self.top_size = top_size
+        # {group_id: {player_id: PlayerRecord}}
+        self.groups: Dict[str, Dict[str, PlayerRecord]] = {}
+        # 玩家参与过的群 {player_id: {group_id}}
+        self.player_groups: Dict[str, Set[str]] = {}
+        # 排行榜缓存 {group_id: [(player_id, PlayerRecord)]}，作废时删除
+        self._top: Dict[str, List[Tuple[str, PlayerRecord]]] = {}
+        # 待写入的玩家和对局
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._games: List[tuple] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._io_lock = asyncio.Lock()
+
+    def load(self):
+        """打开数据库并读入全部战绩"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        rows = self._conn.execute(f"SELECT group_id, player_id, {', '.join(RECORD_FIELDS)} FROM players")
+        for group_id, player_id, *fields in rows:
+            self.groups.setdefault(group_id, {})[player_id] = PlayerRecord(*fields)
+            self.player_groups.setdefault(player_id, set()).add(group_id)
+
+    def record_game(self, group_id: str, names: Dict[Hashable, str], landlord, scores: Dict[Hashable, int],
+                    bid_score: int):
+        """记录一局的结算结果，names 中没有的玩家（机器人）只计入对局记录"""
+        records = self.groups.setdefault(group_id, {})
+        top = self._top.get(group_id)
+        for player_id, delta in scores.items():
+            if player_id not in names:
+                continue
+            record = records.get(player_id)
+            if record is None:
+                record = records[player_id] = PlayerRecord(names[player_id])
+                self.player_groups.setdefault(player_id, set()).add(group_id)
+            record.name = names[player_id]
+            won = delta > 0
+            record.score += delta
+            record.games += 1
+            record.wins += won
+            if player_id == landlord:
+                record.landlord_games += 1
+                record.landlord_wins += won
+            else:
+                record.farmer_games += 1
+                record.farmer_wins += won
+            self._dirty.add((group_id, player_id))
+            if top is not None:
+                top = self._update_top(group_id, top, player_id, record, delta)
+        self._games.append((group_id, time.time(), landlord, bid_score, int(scores[landlord] > 0)))
+
+    def _update_top(self, group_id, top, player_id, record, delta):
+        """积分变动后调整排行榜缓存，无法确定新排名时作废"""
+        on_board = any(entry[0] == player_id for entry in top)
+        full = len(top) >= self.top_size
+        if on_board and delta < 0 and full and len(self.groups[group_id]) > len(top):
+            # 榜上玩家降分，可能被榜外玩家超过
+            del self._top[group_id]
+            return None
+        if not on_board:
+            if full and record.rank_key() <= top[-1][1].rank_key():
+                return top
+            top.append((player_id, record))
+        top.sort(key=lambda entry: entry[1].rank_key(), reverse=True)
+        del top[self.top_size:]
+        return top
+
+    def top(self, group_id: str) -> List[Tuple[str, PlayerRecord]]:
+        """群内积分排行前 N 名"""
+        top = self._top.get(group_id)
+        if top is None:
+            records = self.groups.get(group_id, {})
+            top = heapq.nlargest(self.top_size, records.items(), key=lambda entry: entry[1].rank_key())
+            self._top[group_id] = top
+        return top
+
+    def rank(self, group_id: str, player_id: str) -> Optional[int]:
+        """玩家在群内的名次"""
+        records = self.groups.get(group_id, {})
+        record = records.get(player_id)
+        if record is None:
+            return None
+        key = record.rank_key()
+        return 1 + sum(1 for other in records.values() if other.rank_key() > key)
+
+    def player(self, group_id: str, player_id: str) -> Optional[PlayerRecord]:
+        """玩家在群内的战绩"""
+        return self.groups.get(group_id, {}).get(player_id)
+
+    def totals(self, player_id: str) -> Optional[PlayerRecord]:
+        """玩家在所有群的合计战绩"""
+        group_ids = self.player_groups.get(player_id)
+        if not group_ids:
+            return None
+        total = PlayerRecord()
+        for group_id in group_ids:
+            record = self.groups[group_id][player_id]
+            total.name = record.name
+            for field in RECORD_FIELDS[1:]:
+                setattr(total, field, getattr(total, field) + getattr(record, field))
+        return total
+
+    async def flush(self):
+        """把待写入的战绩和对局批量写入数据库"""
+        async with self._io_lock:
+            if self._conn is None or (not self._dirty and not self._games):
+                return
+            rows = []
+            for group_id, player_id in self._dirty:
+                record = self.groups[group_id][player_id]
+                rows.append((group_id, player_id, *(getattr(record, field) for field in RECORD_FIELDS)))
+            games = self._games
+            self._dirty = set()
+            self._games = []
+            await asyncio.to_thread(self._write, rows, games)
+
+    def _write(self, rows, games):
+        """在一个事务中写入（在线程中执行）"""
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO players (group_id, player_id, {', '.join(RECORD_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(RECORD_FIELDS) + 2))})",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO games (group_id, ended_at, landlord, bid_score, landlord_win) VALUES (?, ?, ?, ?, ?)",
+                games,
+            )
+
+    async def close(self):
+        """写入剩余数据并关闭数据库"""
+        await self.flush()
+        async with self._io_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
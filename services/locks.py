@@ -0,0 +1,47 @@
+"""按群划分的 asyncio 锁
+
+同一个群的命令串行执行，不同群之间互不阻塞。锁在第一次使用时创建，
+没有持有者和等待者时立即回收，因此牌局结束后不会留下任何锁对象。
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+
+class _Entry:
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # 持有和等待该锁的协程数
+        self.users = 0
+
+
+class GroupLocks:
+    """键 -> asyncio.Lock 的懒创建表"""
+
+    __slots__ = ('_entries',)
+
+    def __init__(self):
+        self._entries: Dict[Hashable, _Entry] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        """持有 key 对应的锁"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._entries[key]
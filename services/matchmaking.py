@@ -0,0 +1,194 @@
+"""跨群匹配队列
+
+各群发送 '匹配' 的玩家进入同一个队列，按匹配积分分段：每个分段是一个先进先出的
+队列，非空的分段号保存在有序列表中。玩家加入时用二分查找定位自己的分段，只在该分段
+和两侧相邻的几个分段中凑满三人，与队列总人数无关。等待越久可以向两侧放宽的分段越多，
+由后台定期对每个分段最早加入的玩家重新尝试；等待超时的玩家移出队列。
+
+退出队列的玩家只做标记，在出队时跳过（分段里的无效票过多时压缩一次）。匹配成功的
+玩家在 MATCH_GROUP 下开桌，与各群自己的桌互不占用桌号。
+"""
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+# 匹配桌所属的“群”：桌号、积分和回放都记在该键下
+MATCH_GROUP = 'match'
+# 每桌人数
+MATCH_SIZE = 3
+# 每个分段的积分宽度
+RATING_BAND = 50
+# 加入时最多向两侧各放宽的分段数
+MATCH_SPREAD = 1
+# 每多等待这么久（秒）多放宽一个分段
+WIDEN_AFTER = 15.0
+# 等待超过该时间（秒）移出队列
+MATCH_TIMEOUT = 600.0
+
+
+class Ticket:
+    """队列中的一名玩家"""
+
+    __slots__ = ('player_id', 'name', 'origin', 'rating', 'band', 'since', 'active')
+
+    def __init__(self, player_id, name: str, origin: str, rating: int, band: int, since: float):
+        self.player_id = player_id
+        self.name = name
+        # 玩家发送 '匹配' 的群的消息来源
+        self.origin = origin
+        self.rating = rating
+        self.band = band
+        self.since = since
+        # 退出队列或匹配成功后为 False
+        self.active = True
+
+
+class Matchmaker:
+    """按积分分段的匹配队列"""
+
+    __slots__ = ('band_width', 'spread', 'widen_after', 'timeout', 'size', '_tickets', '_bands', '_counts', '_keys',
+                 'matched', 'expired')
+
+    def __init__(self, band_width: int = RATING_BAND, spread: int = MATCH_SPREAD, widen_after: float = WIDEN_AFTER,
+                 timeout: float = MATCH_TIMEOUT, size: int = MATCH_SIZE):
+        self.band_width = max(1, band_width)
+        self.spread = spread
+        self.widen_after = widen_after
+        # 0 表示不限制等待时间
+        self.timeout = timeout
+        self.size = size
+        # {玩家: 票}，只含有效的票
+        self._tickets: Dict[Hashable, Ticket] = {}
+        # {分段号: 按加入顺序的票（可能含无效票）}、{分段号: 有效票数}
+        self._bands: Dict[int, Deque[Ticket]] = {}
+        self._counts: Dict[int, int] = {}
+        # 非空的分段号，从小到大
+        self._keys: List[int] = []
+        # 组成的桌数、超时移出的人数
+        self.matched = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __contains__(self, player_id):
+        return player_id in self._tickets
+
+    def get(self, player_id) -> Optional[Ticket]:
+        return self._tickets.get(player_id)
+
+    def enqueue(self, player_id, name: str, origin: str, rating: int, now: float) -> Optional[List[Ticket]]:
+        """加入队列；能凑满一桌时取出并返回这一桌的票（按加入顺序），否则返回 None"""
+        band = rating // self.band_width
+        ticket = Ticket(player_id, name, origin, rating, band, now)
+        self._tickets[player_id] = ticket
+        queue = self._bands.get(band)
+        if queue is None:
+            queue = self._bands[band] = deque()
+            self._counts[band] = 0
+            insort(self._keys, band)
+        queue.append(ticket)
+        self._counts[band] += 1
+        return self._match(band, self.spread)
+
+    def cancel(self, player_id) -> bool:
+        """退出队列，不在队列中时返回 False"""
+        ticket = self._tickets.pop(player_id, None)
+        if ticket is None:
+            return False
+        ticket.active = False
+        band = ticket.band
+        self._counts[band] -= 1
+        if not self._counts[band]:
+            self._drop(band)
+        elif len(self._bands[band]) > 2 * self._counts[band] + self.size:
+            # 无效票过多时压缩，队列长度保持与有效票数同阶
+            self._bands[band] = deque(entry for entry in self._bands[band] if entry.active)
+        return True
+
+    def sweep(self, now: float) -> Tuple[List[List[Ticket]], List[Ticket]]:
+        """按等待时间放宽分段重新匹配，并移出等待超时的票；返回 (组成的各桌, 超时的票)
+
+        只看每个分段最早加入的票，开销与分段数成正比，与队列人数无关。
+        """
+        matches = []
+        expired = []
+        for band in list(self._keys):
+            head = self._head(band)
+            while head is not None and self.timeout and now - head.since >= self.timeout:
+                self.cancel(head.player_id)
+                self.expired += 1
+                expired.append(head)
+                head = self._head(band)
+            if head is None or self.widen_after <= 0:
+                continue
+            extra = int((now - head.since) // self.widen_after)
+            if extra:
+                tickets = self._match(band, self.spread + extra)
+                if tickets is not None:
+                    matches.append(tickets)
+        return matches, expired
+
+    def _head(self, band) -> Optional[Ticket]:
+        """分段中最早加入的有效票，顺便丢掉队首的无效票"""
+        queue = self._bands.get(band)
+        if queue is None:
+            return None
+        while queue and not queue[0].active:
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def _match(self, band: int, spread: int) -> Optional[List[Ticket]]:
+        """在 band 两侧各 spread 个分段内凑一桌，近的分段优先，同一分段先来的优先"""
+        keys = self._keys
+        lo = hi = bisect_left(keys, band)
+        if hi >= len(keys) or keys[hi] != band:
+            return None
+        # 由近到远依次取分段，直到人数够一桌
+        order = [band]
+        total = self._counts[band]
+        lo -= 1
+        hi += 1
+        while total < self.size:
+            left = band - keys[lo] if lo >= 0 and band - keys[lo] <= spread else None
+            right = keys[hi] - band if hi < len(keys) and keys[hi] - band <= spread else None
+            if left is None and right is None:
+                return None
+            if right is None or (left is not None and left <= right):
+                order.append(keys[lo])
+                total += self._counts[keys[lo]]
+                lo -= 1
+            else:
+                order.append(keys[hi])
+                total += self._counts[keys[hi]]
+                hi += 1
+        tickets = []
+        for key in order:
+            while len(tickets) < self.size and key in self._counts:
+                tickets.append(self._pop(key))
+        tickets.sort(key=lambda ticket: ticket.since)
+        self.matched += 1
+        return tickets
+
+    def _pop(self, band: int) -> Ticket:
+        """取出分段中最早加入的有效票"""
+        ticket = self._head(band)
+        self._bands[band].popleft()
+        ticket.active = False
+        del self._tickets[ticket.player_id]
+        self._counts[band] -= 1
+        if not self._counts[band]:
+            self._drop(band)
+        return ticket
+
+    def _drop(self, band: int):
+        """移除没有有效票的分段"""
+        del self._bands[band]
+        del self._counts[band]
+        del self._keys[bisect_left(self._keys, band)]
+
+    def clear(self):
+        self._tickets.clear()
+        self._bands.clear()
+        self._counts.clear()
+        self._keys.clear()
@@ -0,0 +1,166 @@
+"""命令和热点方法的耗时统计
+
+每个命令和被标记的方法记录调用次数、出错次数和固定分桶的耗时直方图。记录一次
+只需两次读取时钟和一次二分查找，开销远小于命令本身。统计可以格式化为简要文本，
+也可以导出为 Prometheus 文本格式。
+"""
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from time import perf_counter_ns
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 直方图分桶上界（微秒）
+LATENCY_BUCKETS_US = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000, 1000000)
+_BUCKET_BOUNDS_NS = tuple(bound * 1000 for bound in LATENCY_BUCKETS_US)
+
+# 统计类别：命令处理函数、牌局动作（插件的每个 _act_* 方法各一项，按方法名去掉前缀的下划线命名）
+COMMAND = 'command'
+HELPER = 'helper'
+
+PREFIX = 'doudizhu'
+
+
+class Histogram:
+    """固定分桶的耗时直方图"""
+
+    __slots__ = ('buckets', 'count', 'errors', 'total_ns')
+
+    def __init__(self):
+        # 最后一个桶对应 +Inf
+        self.buckets = [0] * (len(_BUCKET_BOUNDS_NS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+
+    def observe(self, elapsed_ns: int):
+        self.buckets[bisect_left(_BUCKET_BOUNDS_NS, elapsed_ns)] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+
+    def quantile_us(self, q: float) -> float:
+        """按分桶估计分位数，返回所在桶的上界（微秒）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_US, self.buckets):
+            seen += count
+            if seen >= target:
+                return float(bound)
+        return float('inf')
+
+
+class Metrics:
+    """按 (类别, 名称) 汇总的耗时直方图"""
+
+    __slots__ = ('histograms', 'started_at')
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.started_at = time.time()
+
+    def histogram(self, kind: str, name: str) -> Histogram:
+        histogram = self.histograms.get((kind, name))
+        if histogram is None:
+            histogram = self.histograms[(kind, name)] = Histogram()
+        return histogram
+
+    def observe(self, kind: str, name: str, elapsed_ns: int, error: bool = False):
+        histogram = self.histograms.get((kind, name)) or self.histogram(kind, name)
+        histogram.observe(elapsed_ns)
+        if error:
+            histogram.errors += 1
+
+    def summary(self, kind: str) -> List[str]:
+        """每个名称一行：次数、出错次数、平均耗时、P50、P99"""
+        lines = []
+        for (hist_kind, name), histogram in sorted(self.histograms.items()):
+            if hist_kind != kind or not histogram.count:
+                continue
+            mean = histogram.total_ns / histogram.count / 1000
+            lines.append(
+                f"{name}: {histogram.count} 次，出错 {histogram.errors}，平均 {mean:.0f}µs，"
+                f"P50≤{histogram.quantile_us(0.5):.0f}µs，P99≤{histogram.quantile_us(0.99):.0f}µs"
+            )
+        return lines
+
+    def prometheus(self, gauges: Iterable[Tuple[str, str, Dict[str, str], float]] = ()) -> str:
+        """导出为 Prometheus 文本格式，gauges 为 (指标名, 说明, 标签, 值)"""
+        lines = []
+        for kind in (COMMAND, HELPER):
+            entries = [(name, histogram) for (hist_kind, name), histogram in sorted(self.histograms.items())
+                       if hist_kind == kind]
+            if not entries:
+                continue
+            metric = f"{PREFIX}_{kind}_duration_seconds"
+            lines.append(f"# HELP {metric} {kind} latency")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in entries:
+                label = f'{kind}="{_escape(name)}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS_US, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound / 1e6:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{{label}}} {histogram.total_ns / 1e9:.9f}')
+                lines.append(f'{metric}_count{{{label}}} {histogram.count}')
+            errors = f"{PREFIX}_{kind}_errors_total"
+            lines.append(f"# TYPE {errors} counter")
+            for name, histogram in entries:
+                lines.append(f'{errors}{{{kind}="{_escape(name)}"}} {histogram.errors}')
+
+        typed = set()
+        for metric, help_text, labels, value in gauges:
+            metric = f"{PREFIX}_{metric}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} gauge")
+            label = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{metric}{{{label}}} {value}" if label else f"{metric} {value}")
+        lines.append(f"{PREFIX}_start_time_seconds {self.started_at:.0f}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def instrument(kind: str, name: str) -> Callable:
+    """记录方法耗时的装饰器，统计写入 self.metrics
+
+    用于异步生成器（命令处理函数）时只累计处理函数自身运行的时间，不包括
+    产出消息后等待框架发送的时间。
+    """
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                elapsed = 0
+                error = True
+                start = perf_counter_ns()
+                try:
+                    async for result in func(self, *args, **kwargs):
+                        elapsed += perf_counter_ns() - start
+                        yield result
+                        start = perf_counter_ns()
+                    error = False
+                finally:
+                    elapsed += perf_counter_ns() - start
+                    self.metrics.observe(kind, name, elapsed, error)
+            return wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                result = func(self, *args, **kwargs)
+            except BaseException:
+                self.metrics.observe(kind, name, perf_counter_ns() - start, True)
+                raise
+            self.metrics.observe(kind, name, perf_counter_ns() - start)
+            return result
+        return wrapper
+    return decorator
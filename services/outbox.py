@@ -0,0 +1,230 @@
+"""群消息发送限速
+
+一次操作产生的多条消息合并成尽量少的平台消息（不超过 MAX_LENGTH 字）。每个群和
+全局各有一个令牌桶，发送一条平台消息消耗两个桶各一个令牌。令牌足够时直接发送（或
+作为命令的回复）；不够时消息进入队列，由后台任务等到有令牌时合并发送。队列按键
+（例如群里的每一桌）区分，令牌桶按 bucket_of(键) 得到的群区分。队列中被后来的
+消息取代的状态行（例如 "请 X 出牌"）在合并时丢弃，只保留最新的一条。
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# 单条平台消息的最大字数，超过时分成多条
+MAX_LENGTH = 1500
+# 合并消息之间的分隔
+SEPARATOR = "\n"
+# 令牌桶数超过该值时清理已经回满的桶
+PRUNE_SIZE = 1024
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'stamp')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = now
+
+    def _refill(self, now: float):
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def delay(self, now: float) -> float:
+        """还要等多久（秒）才有一个令牌"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        """消耗一个令牌（可以透支，透支的部分由之后的补充抵消）"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def coalesce(messages: Iterable[str], max_length: int = MAX_LENGTH) -> List[str]:
+    """按顺序把消息合并成尽量少的、每条不超过 max_length 字的消息（单条超长的消息保持原样）"""
+    merged = []
+    for text in messages:
+        if merged and len(merged[-1]) + len(SEPARATOR) + len(text) <= max_length:
+            merged[-1] += SEPARATOR + text
+        else:
+            merged.append(text)
+    return merged
+
+
+class Outbox:
+    """按群和全局限速的消息发送"""
+
+    __slots__ = ('send', 'is_status', 'bucket_of', 'on_error', 'group_rate', 'group_burst', 'max_length', '_global', '_buckets',
+                 '_queues', '_tasks', 'sent', 'merged', 'collapsed', 'queued')
+
+    def __init__(self, send: Callable[[str, str], Awaitable], group_rate: float, group_burst: float,
+                 global_rate: float, global_burst: float, is_status: Optional[Callable[[str], bool]] = None,
+                 bucket_of: Optional[Callable[[Hashable], Hashable]] = None,
+                 on_error: Optional[Callable[[str, Exception], None]] = None, max_length: int = MAX_LENGTH):
+        # send(origin, text)
+        self.send = send
+        # 判断一行是否为可以被取代的状态行
+        self.is_status = is_status
+        # 队列的键 -> 令牌桶的键，默认每个键一个令牌桶
+        self.bucket_of = bucket_of
+        # 后台发送失败时调用 on_error(origin, 异常)，例如记录日志
+        self.on_error = on_error
+        # 速率为 0 表示不限制
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_length = max_length
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic()) if global_rate > 0 else None
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        # 等待发送的消息 {键: (消息来源, 消息队列)}
+        self._queues: Dict[Hashable, Tuple[str, Deque[str]]] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        # 发出的平台消息数、被合并掉的消息数、丢弃的状态行数、进入队列的消息数
+        self.sent = 0
+        self.merged = 0
+        self.collapsed = 0
+        self.queued = 0
+
+    def __len__(self):
+        return sum(len(queue) for _, queue in self._queues.values())
+
+    def _bucket(self, key, now) -> Optional[TokenBucket]:
+        if self.group_rate <= 0:
+            return None
+        if self.bucket_of is not None:
+            key = self.bucket_of(key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= PRUNE_SIZE:
+                # 回满的桶与新建的桶相同，可以丢弃
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.full(now)}
+            bucket = self._buckets[key] = TokenBucket(self.group_rate, self.group_burst, now)
+        return bucket
+
+    def _delay(self, key, now) -> float:
+        """key 还要等多久才能发送一条消息"""
+        bucket = self._bucket(key, now)
+        delay = bucket.delay(now) if bucket is not None else 0.0
+        if self._global is not None:
+            delay = max(delay, self._global.delay(now))
+        return delay
+
+    def _take(self, key, now):
+        bucket = self._bucket(key, now)
+        if bucket is not None:
+            bucket.take(now)
+        if self._global is not None:
+            self._global.take(now)
+        self.sent += 1
+
+    def _coalesce(self, messages: List[str]) -> List[str]:
+        merged = coalesce(messages, self.max_length)
+        self.merged += len(messages) - len(merged)
+        return merged
+
+    def acquire(self, key, messages: List[str]) -> List[str]:
+        """合并一次操作的消息；令牌足够且 key 没有排队的消息时消耗令牌并返回，可以直接回复；
+        否则返回空列表，由调用方把消息交给 post 排队"""
+        merged = coalesce(messages, self.max_length)
+        now = time.monotonic()
+        if not merged or key in self._queues or self._delay(key, now) > 0:
+            return []
+        self.merged += len(messages) - len(merged)
+        for _ in merged:
+            self._take(key, now)
+        return merged
+
+    async def deliver(self, key, origin: str, messages: List[str]):
+        """主动发送到群：令牌足够时立即发送，否则排队"""
+        merged = self.acquire(key, messages)
+        if not merged:
+            self.post(key, origin, messages)
+            return
+        for text in merged:
+            await self.send(origin, text)
+
+    def post(self, key, origin: str, messages: List[str]):
+        """把消息放入 key 的队列，等有令牌时在后台发送"""
+        if not messages:
+            return
+        entry = self._queues.get(key)
+        if entry is None:
+            entry = self._queues[key] = (origin, deque())
+        entry[1].extend(messages)
+        self.queued += len(messages)
+        if key not in self._tasks:
+            task = self._tasks[key] = asyncio.get_running_loop().create_task(self._pump(key))
+            task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+
+    def _collapse(self, messages: List[str]) -> List[str]:
+        """丢弃被后来的消息取代的状态行：只有最后一条消息保留状态行"""
+        if self.is_status is None:
+            return messages
+        result = []
+        last = len(messages) - 1
+        for i, text in enumerate(messages):
+            if i < last:
+                lines = text.split("\n")
+                kept = [line for line in lines if not self.is_status(line)]
+                self.collapsed += len(lines) - len(kept)
+                text = "\n".join(kept)
+            if text:
+                result.append(text)
+        return result
+
+    async def _pump(self, key):
+        """等待令牌，把队列中的消息合并后逐条发送"""
+        while True:
+            delay = self._delay(key, time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            origin, queue = self._queues[key]
+            merged = self._coalesce(self._collapse(list(queue)))
+            queue.clear()
+            if not merged:
+                del self._queues[key]
+                return
+            # 只发送第一条，剩下的留在队列里与之后的消息一起合并
+            queue.extend(merged[1:])
+            self._take(key, time.monotonic())
+            if not queue:
+                del self._queues[key]
+            try:
+                await self.send(origin, merged[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(origin, e)
+            if key not in self._queues:
+                return
+
+    async def throttle(self):
+        """等待并消耗一个全局令牌（用于不属于任何群的发送，例如私聊）"""
+        if self._global is None:
+            return
+        while True:
+            delay = self._global.delay(time.monotonic())
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self._global.take(time.monotonic())
+
+    async def close(self):
+        """取消排队的发送"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._queues.clear()
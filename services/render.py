@@ -0,0 +1,197 @@
+"""手牌和牌桌图片
+
+启动时把 54 张牌和牌背画进一张图集，之后只做拼贴：一组牌（手牌、上一手牌、地主牌）
+按叠放方式拼成一条牌带，牌带按牌编号缓存，手牌不变时直接复用；编码后的 PNG 按
+内容缓存在 LRU 中，重复的 '手牌'、'状态' 不再绘制和编码。绘制在插件的线程池中
+进行，缓存可以被多个线程同时访问。图片中只有牌面，玩家昵称等文字仍在消息文本中。
+"""
+import io
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Sequence, Tuple
+
+from ..engine.cards import BIG_JOKER, DECK_SIZE, RANKS, SMALL_JOKER
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # 没有安装 Pillow 时只发送文字
+    Image = None
+
+# 牌的尺寸（像素）和叠放时每张牌露出的宽度
+CARD_WIDTH = 60
+CARD_HEIGHT = 84
+CARD_STEP = 24
+# 图片边距和两行牌之间的间距
+MARGIN = 10
+ROW_GAP = 12
+# 缓存的牌带数和 PNG 数
+TILE_CACHE_SIZE = 256
+PNG_CACHE_SIZE = 256
+# PNG 压缩级别：牌面颜色很少，低级别已经足够小，编码更快
+PNG_COMPRESS_LEVEL = 3
+
+TABLE_COLOR = (34, 110, 64, 255)
+FACE_COLOR = (252, 252, 248, 255)
+EDGE_COLOR = (150, 150, 150, 255)
+BACK_COLOR = (40, 70, 150, 255)
+RED = (200, 32, 32, 255)
+BLACK = (24, 24, 24, 255)
+# 牌背在图集中的位置
+BACK = DECK_SIZE
+
+
+def can_render() -> bool:
+    """是否安装了 Pillow"""
+    return Image is not None
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size)
+    except (TypeError, OSError, ImportError):
+        # 旧版本 Pillow 或没有 FreeType 时使用固定大小的位图字体
+        return ImageFont.load_default()
+
+
+def _draw_suit(draw, suit: int, cx: float, cy: float, size: float, color):
+    """在 (cx, cy) 画花色：0 梅花、1 方块、2 红桃、3 黑桃"""
+    s = size
+    if suit == 1:
+        draw.polygon([(cx, cy - s), (cx + s * 0.7, cy), (cx, cy + s), (cx - s * 0.7, cy)], fill=color)
+        return
+    if suit == 0:
+        r = s * 0.42
+        for x, y in ((cx, cy - s * 0.45), (cx - s * 0.5, cy + s * 0.15), (cx + s * 0.5, cy + s * 0.15)):
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+    else:
+        # 红桃为两个圆加向下的三角形，黑桃上下翻转
+        sign = 1 if suit == 2 else -1
+        r = s * 0.5
+        for x in (cx - s * 0.48, cx + s * 0.48):
+            y = cy - sign * s * 0.3
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+        draw.polygon([(cx - s * 0.98, cy - sign * s * 0.15), (cx + s * 0.98, cy - sign * s * 0.15), (cx, cy + sign * s)],
+                     fill=color)
+    if suit != 2:
+        # 梅花和黑桃的柄
+        draw.polygon([(cx, cy), (cx - s * 0.35, cy + s), (cx + s * 0.35, cy + s)], fill=color)
+
+
+def _draw_card(draw, card: int, left: int, rank_font, joker_font):
+    """在图集的 left 位置画一张牌（card 为 BACK 时画牌背）"""
+    box = [left, 0, left + CARD_WIDTH - 1, CARD_HEIGHT - 1]
+    if card == BACK:
+        draw.rounded_rectangle(box, radius=6, fill=BACK_COLOR, outline=FACE_COLOR, width=2)
+        draw.rounded_rectangle([left + 6, 6, left + CARD_WIDTH - 7, CARD_HEIGHT - 7], radius=4, outline=EDGE_COLOR)
+        return
+    draw.rounded_rectangle(box, radius=6, fill=FACE_COLOR, outline=EDGE_COLOR, width=1)
+    cx = left + CARD_WIDTH / 2 + CARD_STEP / 4
+    if card >= SMALL_JOKER:
+        color = RED if card == BIG_JOKER else BLACK
+        for i, letter in enumerate("JOKER"):
+            draw.text((left + 5, 3 + 15 * i), letter, font=joker_font, fill=color)
+        r = CARD_WIDTH * 0.18
+        draw.ellipse([cx - r, CARD_HEIGHT / 2 - r, cx + r, CARD_HEIGHT / 2 + r], fill=color)
+        return
+    suit = card % 4
+    color = RED if suit in (1, 2) else BLACK
+    rank = RANKS[card // 4]
+    draw.text((left + (2 if len(rank) > 1 else 5), 3), rank, font=rank_font, fill=color)
+    _draw_suit(draw, suit, left + CARD_STEP / 2, 34, 6, color)
+    _draw_suit(draw, suit, cx, CARD_HEIGHT / 2 + 6, 13, color)
+
+
+class _LRU:
+    """线程安全的 LRU 缓存"""
+
+    __slots__ = ('size', '_items', '_lock', 'hits', 'misses')
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+class CardRenderer:
+    """按牌编号绘制手牌和牌桌图片"""
+
+    __slots__ = ('sprites', 'tiles', 'pngs')
+
+    def __init__(self, tile_cache_size: int = TILE_CACHE_SIZE, png_cache_size: int = PNG_CACHE_SIZE):
+        # 图集：54 张牌加牌背排成一行，切成单张的牌面
+        atlas = Image.new('RGBA', (CARD_WIDTH * (DECK_SIZE + 1), CARD_HEIGHT), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(atlas)
+        rank_font, joker_font = _font(18), _font(13)
+        for card in range(DECK_SIZE + 1):
+            _draw_card(draw, card, card * CARD_WIDTH, rank_font, joker_font)
+        self.sprites = tuple(atlas.crop((card * CARD_WIDTH, 0, (card + 1) * CARD_WIDTH, CARD_HEIGHT))
+                             for card in range(DECK_SIZE + 1))
+        # {牌编号元组: 牌带}、{内容: PNG}
+        self.tiles = _LRU(tile_cache_size)
+        self.pngs = _LRU(png_cache_size)
+
+    def _tile(self, cards: Tuple[int, ...]):
+        """一组牌叠放成的牌带"""
+        tile = self.tiles.get(cards)
+        if tile is None:
+            tile = Image.new('RGBA', (CARD_WIDTH + CARD_STEP * (len(cards) - 1), CARD_HEIGHT), (0, 0, 0, 0))
+            for i, card in enumerate(cards):
+                sprite = self.sprites[card]
+                tile.alpha_composite(sprite, (CARD_STEP * i, 0))
+            self.tiles.put(cards, tile)
+        return tile
+
+    def cached(self, key) -> Optional[bytes]:
+        """已经编码好的图片，没有时返回 None"""
+        return self.pngs.get(key)
+
+    def render(self, key) -> Optional[bytes]:
+        """按 hand_image_key 或 table_image_key 把各行牌画在牌桌背景上并编码为 PNG，放入缓存；没有牌时返回 None"""
+        tiles = [self._tile(cards) for cards in key[1:] if cards]
+        if not tiles:
+            return None
+        width = max(tile.width for tile in tiles) + 2 * MARGIN
+        height = sum(tile.height for tile in tiles) + ROW_GAP * (len(tiles) - 1) + 2 * MARGIN
+        canvas = Image.new('RGBA', (width, height), TABLE_COLOR)
+        top = MARGIN
+        for tile in tiles:
+            canvas.alpha_composite(tile, (MARGIN, top))
+            top += tile.height + ROW_GAP
+        buffer = io.BytesIO()
+        canvas.convert('RGB').save(buffer, 'PNG', compress_level=PNG_COMPRESS_LEVEL)
+        png = buffer.getvalue()
+        self.pngs.put(key, png)
+        return png
+
+
+def hand_image_key(cards: Sequence[int]) -> tuple:
+    """手牌图片的缓存键（同时描述要画的内容）"""
+    return 'hand', tuple(cards)
+
+
+def table_image_key(landlord_cards: Optional[Sequence[int]], last_cards: Sequence[int]) -> tuple:
+    """牌桌图片的缓存键：第一行为地主牌（还没亮出时为 None，画成三张牌背），第二行为上一手牌"""
+    landlord_cards = (BACK,) * 3 if landlord_cards is None else tuple(landlord_cards)
+    return 'table', landlord_cards, tuple(last_cards)
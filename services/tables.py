@@ -0,0 +1,75 @@
+"""群内多桌的索引
+
+每个群可以同时开多桌，牌局按桌区分。索引记录每个群开着哪些桌号，以及每个玩家
+坐在哪一桌，'出牌'、'不出' 等命令按 (群, 玩家) 一次查表找到发送者所在的桌，
+与群里的桌数无关。另按玩家记录其在各群的座位，跨群匹配时一次查表判断玩家是否已经
+坐在任何一个群的桌上。桌关闭时一并移除该桌玩家的座位。
+"""
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class TableIndex:
+    """群 -> 桌号集合、(群, 玩家) -> 桌号"""
+
+    __slots__ = ('_tables', '_seats', '_players')
+
+    def __init__(self):
+        self._tables: Dict[Hashable, Set[int]] = {}
+        self._seats: Dict[Tuple[Hashable, Hashable], int] = {}
+        # 玩家 -> {群: 桌号}
+        self._players: Dict[Hashable, Dict[Hashable, int]] = {}
+
+    def __len__(self):
+        return len(self._seats)
+
+    def open(self, group_id, table: int):
+        """开一桌"""
+        self._tables.setdefault(group_id, set()).add(table)
+
+    def close(self, group_id, table: int, players: Iterable):
+        """关闭一桌，移除该桌玩家的座位"""
+        tables = self._tables.get(group_id)
+        if tables is not None:
+            tables.discard(table)
+            if not tables:
+                del self._tables[group_id]
+        for player_id in players:
+            if self._seats.get((group_id, player_id)) == table:
+                del self._seats[(group_id, player_id)]
+                seats = self._players[player_id]
+                del seats[group_id]
+                if not seats:
+                    del self._players[player_id]
+
+    def seat(self, group_id, player_id, table: int):
+        """玩家坐到某一桌"""
+        self._seats[(group_id, player_id)] = table
+        self._players.setdefault(player_id, {})[group_id] = table
+
+    def find(self, group_id, player_id) -> Optional[int]:
+        """玩家所在的桌号，不在任何一桌时为 None"""
+        return self._seats.get((group_id, player_id))
+
+    def seat_of(self, player_id) -> Optional[Tuple[Hashable, int]]:
+        """玩家在任意一个群的座位 (群, 桌号)，不在任何一桌时为 None"""
+        seats = self._players.get(player_id)
+        if not seats:
+            return None
+        return next(iter(seats.items()))
+
+    def tables(self, group_id) -> List[int]:
+        """群里开着的桌号，从小到大"""
+        return sorted(self._tables.get(group_id, ()))
+
+    def free_table(self, group_id) -> int:
+        """最小的空闲桌号"""
+        tables = self._tables.get(group_id, ())
+        table = 1
+        while table in tables:
+            table += 1
+        return table
+
+    def clear(self):
+        self._tables.clear()
+        self._seats.clear()
+        self._players.clear()
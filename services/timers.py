@@ -0,0 +1,102 @@
+"""分层时间轮
+
+每层 64 个槽位，第 0 层的一个槽位对应一个 tick，第 n 层的一个槽位对应 64^n 个 tick。
+定时器按剩余时间放入对应层的槽位，到期前逐层下移。新增、取消、重设均为 O(1)，
+每个 tick 只处理到期的槽位，开销与到期（及下移）的定时器数量成正比，与总数无关。
+"""
+import math
+from typing import Dict, Hashable, List, Optional, Tuple
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+
+
+class TimerWheel:
+    """以任意可哈希对象为键的分层时间轮，同一个键最多只有一个定时器"""
+
+    __slots__ = ('resolution', 'levels', '_tick', '_wheels', '_where')
+
+    def __init__(self, now: float, resolution: float = 1.0, levels: int = 4):
+        self.resolution = resolution
+        self.levels = levels
+        # 已处理到的 tick
+        self._tick = int(now / resolution)
+        # 各层槽位 {key: 到期 tick}
+        self._wheels = [[{} for _ in range(SLOTS)] for _ in range(levels)]
+        # 键所在的位置 {key: (层, 槽位)}
+        self._where: Dict[Hashable, Tuple[int, int]] = {}
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def _insert(self, key, deadline):
+        """把定时器放入对应层的槽位"""
+        delta = deadline - self._tick
+        for level in range(self.levels):
+            if delta < 1 << (SLOT_BITS * (level + 1)):
+                break
+        else:
+            # 超出时间轮范围的放在最高层，下移时重新计算
+            level = self.levels - 1
+            deadline = self._tick + (1 << (SLOT_BITS * self.levels)) - 1
+        slot = (deadline >> (SLOT_BITS * level)) & SLOT_MASK
+        self._wheels[level][slot][key] = deadline
+        self._where[key] = (level, slot)
+
+    def schedule(self, key: Hashable, delay: float, now: float):
+        """设置定时器在 now + delay 到期，已存在的同键定时器会被替换"""
+        self.cancel(key)
+        deadline = max(math.ceil((now + delay) / self.resolution), self._tick + 1)
+        self._insert(key, deadline)
+
+    def cancel(self, key: Hashable) -> bool:
+        """取消定时器"""
+        where = self._where.pop(key, None)
+        if where is None:
+            return False
+        level, slot = where
+        del self._wheels[level][slot][key]
+        return True
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        """获取定时器的到期时间"""
+        where = self._where.get(key)
+        if where is None:
+            return None
+        level, slot = where
+        return self._wheels[level][slot][key] * self.resolution
+
+    def advance(self, now: float) -> List[Hashable]:
+        """推进到 now，返回到期的键"""
+        target = int(now / self.resolution)
+        expired = []
+        while self._tick < target:
+            self._tick += 1
+            tick = self._tick
+            # 高层槽位轮转到边界时下移，从高到低处理
+            level = 1
+            while level < self.levels and not tick & ((1 << (SLOT_BITS * level)) - 1):
+                level += 1
+            for level in range(level - 1, 0, -1):
+                bucket = self._wheels[level][(tick >> (SLOT_BITS * level)) & SLOT_MASK]
+                if not bucket:
+                    continue
+                entries = list(bucket.items())
+                bucket.clear()
+                for key, deadline in entries:
+                    del self._where[key]
+                    if deadline <= tick:
+                        expired.append(key)
+                    else:
+                        self._insert(key, deadline)
+            bucket = self._wheels[0][tick & SLOT_MASK]
+            if bucket:
+                for key in bucket:
+                    del self._where[key]
+                    expired.append(key)
+                bucket.clear()
+        return expired